@@ -0,0 +1,93 @@
+# bench_compare.py - Structure comparison on dicts vs. on the hash columns of compact structures,
+# and the early-exit "has it changed?" check
+
+import argparse
+import copy
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import html
+
+from bench_extraction import build_page
+from html_page_detector import HTMLPageDetector
+from structure_format import CompactStructure, dump_structure, load_structure
+
+def edit_page(doc, edits: int, seed: int = 1):
+    """Change texts and attributes of random elements and insert one element near the top"""
+    rng = random.Random(seed)
+    doc = copy.deepcopy(doc)
+    elements = [element for element in doc.iter() if isinstance(element.tag, str)]
+    for element in rng.sample(elements, edits):
+        if rng.random() < 0.5:
+            element.text = f"edited {rng.random():.6f}"
+        else:
+            element.set('data-edit', str(rng.randint(0, 9)))
+    if edits:
+        body = doc.find('body')
+        body.insert(len(body) - 1, html.fromstring('<div class="inserted"><p>new</p></div>'))
+    return doc
+
+def normalized(changes):
+    """Changes as tuples; attribute changes sorted, as the dict comparison yields them in set order"""
+    elements = [(c.change_type, c.xpath, c.old_value, c.new_value, c.element_type)
+                for c in changes if c.element_type != 'attribute']
+    attributes = sorted((c.change_type, c.xpath, c.old_value, c.new_value, c.element_type)
+                        for c in changes if c.element_type == 'attribute')
+    return elements, attributes
+
+def best_of(repeat: int, func, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark structure comparison")
+    parser.add_argument('--elements', type=int, default=50000)
+    parser.add_argument('--edits', type=int, nargs='+', default=[0, 10, 1000])
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    db_dir = tempfile.TemporaryDirectory()
+    detector = HTMLPageDetector({'db_path': os.path.join(db_dir.name, 'bench.db')})
+    doc = html.fromstring(build_page(args.elements))
+    old = detector.extract_tree_structure(doc)
+    old_blob = dump_structure(old)
+    print(f"{len(old['elements'])} elements")
+    print(f"{'edits':>6}{'changes':>9}{'dict ms':>10}{'pruned ms':>11}{'compact ms':>12}{'speedup':>9}"
+          f"{'dict check ms':>15}{'compact check ms':>18}")
+
+    for edits in args.edits:
+        new = detector.extract_tree_structure(edit_page(doc, edits))
+        new_compact = CompactStructure.from_dict(new)
+        unpruned = {key: value for key, value in new.items() if key != 'subtree_hashes'}
+
+        # What a scan pays: read the stored structure, then compare
+        dict_time, dict_changes = best_of(
+            args.repeat, lambda: detector.compare_structures(load_structure(old_blob), unpruned))
+        pruned_time, pruned_changes = best_of(
+            args.repeat, lambda: detector.compare_structures(load_structure(old_blob), new))
+        compact_time, compact_changes = best_of(
+            args.repeat, lambda: detector.compare_structures(CompactStructure.load(old_blob), new_compact))
+        assert normalized(compact_changes) == normalized(dict_changes) == normalized(pruned_changes), \
+            "changes differ"
+        dict_check_time, dict_changed = best_of(
+            args.repeat, lambda: detector.has_changes(load_structure(old_blob), unpruned))
+        compact_check_time, compact_changed = best_of(
+            args.repeat, lambda: detector.has_changes(CompactStructure.load(old_blob), new_compact))
+        assert dict_changed == compact_changed == bool(compact_changes), "checks differ"
+        print(f"{edits:>6}{len(compact_changes):>9}{dict_time * 1000:>10.1f}{pruned_time * 1000:>11.1f}"
+              f"{compact_time * 1000:>12.1f}{min(dict_time, pruned_time) / compact_time:>8.1f}x"
+              f"{dict_check_time * 1000:>15.1f}{compact_check_time * 1000:>18.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+# bench_extraction.py - Single-pass XPath structure extraction vs. the per-element getpath() approach
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import html
+
+from html_page_detector import HTMLPageDetector
+
+def build_page(elements: int, seed: int = 0) -> str:
+    """Generate a deep, irregular page with roughly ``elements`` elements, tables, forms and comments"""
+    rng = random.Random(seed)
+    parts = ['<html><head><title>Benchmark</title></head><body>']
+    count = 0
+    while count < elements:
+        depth = rng.randint(1, 6)
+        parts.append(''.join(f'<div class="d{level}">' for level in range(depth)))
+        choice = rng.random()
+        if choice < 0.05:
+            parts.append('<table><tr><th>A</th><th>B</th></tr>' +
+                         ''.join(f'<tr><td>{i}</td><td>{i * 2}</td></tr>' for i in range(5)) + '</table>')
+            count += 18
+        elif choice < 0.07:
+            parts.append('<form action="/go" method="post"><input name="a"><select name="b"></select>'
+                         '<textarea name="c"></textarea></form>')
+            count += 4
+        elif choice < 0.1:
+            parts.append('<!-- generated -->')
+            count += 1
+        else:
+            parts.append(''.join(f'<p id="p{count}{i}">text {i}</p><span>tail</span>' for i in range(rng.randint(1, 4))))
+            count += 8
+        parts.append('</div>' * depth)
+        count += depth
+    parts.append('</body></html>')
+    return ''.join(parts)
+
+def legacy_extract(detector: HTMLPageDetector, doc) -> dict:
+    """The previous extraction: getpath() per element plus separate //table and //form passes"""
+    structure = {'elements': {}, 'attributes': {}, 'tables': {}, 'forms': {}}
+    for element in doc.iter():
+        if element.tag:
+            xpath = element.getroottree().getpath(element)
+            structure['elements'][xpath] = {
+                'tag': element.tag if isinstance(element.tag, str) else 'comment()',
+                'text': (element.text or '').strip()[:100],
+                'tail': (element.tail or '').strip()[:100]
+            }
+            if element.attrib:
+                structure['attributes'][xpath] = dict(element.attrib)
+    for table in doc.xpath('//table'):
+        structure['tables'][table.getroottree().getpath(table)] = detector._extract_table_structure(table)
+    for form in doc.xpath('//form'):
+        structure['forms'][form.getroottree().getpath(form)] = detector._extract_form_structure(form)
+    return structure
+
+def best_of(repeat: int, func, *args) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark XPath structure extraction")
+    parser.add_argument('--elements', type=int, default=40000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    db_dir = tempfile.TemporaryDirectory()
+    # The legacy extractor predates subtree hashes and table contents, so compare like with like
+    detector = HTMLPageDetector({'db_path': os.path.join(db_dir.name, 'bench.db'), 'subtree_hashes': False,
+                                 'table_diff': False})
+    doc = html.fromstring(build_page(args.elements))
+
+    legacy = legacy_extract(detector, doc)
+    current = detector.extract_tree_structure(doc)
+    assert list(legacy['elements'].items()) == list(current['elements'].items()), "elements differ"
+    assert legacy == current, "structures differ"
+
+    legacy_time = best_of(args.repeat, legacy_extract, detector, doc)
+    current_time = best_of(args.repeat, detector.extract_tree_structure, doc)
+    print(f"{len(current['elements'])} elements, {len(current['tables'])} tables, {len(current['forms'])} forms")
+    print(f"getpath() per element: {legacy_time * 1000:.1f} ms")
+    print(f"single pass:           {current_time * 1000:.1f} ms ({legacy_time / current_time:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# bench_history.py - Structure history stored in full on every scan vs. as keyframes and deltas
+
+import argparse
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from lxml import html
+
+from bench_compare import edit_page
+from bench_extraction import build_page
+from html_page_detector import DatabaseManager, HTMLPageDetector
+from structure_format import dump_structure, load_structure
+
+def database_bytes(db_path: str) -> int:
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark structure history storage")
+    parser.add_argument('--elements', type=int, default=20000)
+    parser.add_argument('--scans', type=int, default=200)
+    parser.add_argument('--change-rate', type=float, default=0.1, help="share of scans that see an edited page")
+    parser.add_argument('--edits', type=int, default=20, help="elements edited per changed version")
+    parser.add_argument('--intervals', type=int, nargs='+', default=[1, 20, 100])
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    rng = random.Random(2)
+    db_dir = tempfile.TemporaryDirectory()
+    detector = HTMLPageDetector({'db_path': os.path.join(db_dir.name, 'extract.db')})
+    doc = html.fromstring(build_page(args.elements))
+
+    # The structure every scan sees; it changes on a share of the scans
+    versions = []
+    structure = dump_structure(detector.extract_tree_structure(doc))
+    for scan in range(args.scans):
+        if scan and rng.random() < args.change_rate:
+            doc = edit_page(doc, args.edits, seed=scan)
+            structure = dump_structure(detector.extract_tree_structure(doc))
+        versions.append(structure)
+    print(f"{args.scans} scans of a {len(versions[0]) / 1024:.0f} KB structure, "
+          f"{len(set(versions))} distinct versions")
+    print(f"{'interval':>9}{'db MB':>9}{'persist ms':>12}{'latest ms':>11}{'rebuild ms':>12}")
+
+    for interval in args.intervals:
+        db_path = os.path.join(db_dir.name, f"history-{interval}.db")
+        database = DatabaseManager(db_path, keyframe_interval=interval)
+        scan_ids = []
+        start = time.perf_counter()
+        for structure in versions:
+            scan_ids.append(database.save_scan_result('https://example.com/', 'hash', structure, []))
+        persist_time = (time.perf_counter() - start) / len(versions)
+
+        start = time.perf_counter()
+        for _ in range(100):
+            database.get_last_scan('https://example.com/')
+        latest_time = (time.perf_counter() - start) / 100
+
+        # Slowest rebuild of any scan's structure, i.e. the version furthest from its keyframe
+        rebuild_time = 0
+        for scan_id, structure in zip(scan_ids, versions):
+            start = time.perf_counter()
+            rebuilt = database.get_structure(scan_id)
+            rebuild_time = max(rebuild_time, time.perf_counter() - start)
+            assert rebuilt == load_structure(structure), "rebuilt structure differs"
+
+        database.close()
+        print(f"{interval:>9}{database_bytes(db_path) / 1024 / 1024:>9.1f}{persist_time * 1000:>12.1f}"
+              f"{latest_time * 1000:>11.2f}{rebuild_time * 1000:>12.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+# bench_iterparse_memory.py - Peak memory of tree vs. iterparse extraction on a large generated report
+
+import argparse
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def write_report(path: str, megabytes: float):
+    """Write a generated report: one big table, a few bytes of markup per cell"""
+    with open(path, 'w') as f:
+        f.write('<html><body><h1>Report</h1><table><thead><tr><th>id</th><th>name</th><th>value</th></tr></thead><tbody>')
+        size = 0
+        row = 0
+        while size < megabytes * 1e6:
+            line = f'<tr><td>{row}</td><td class="n">item {row % 977}</td><td>{row * 3 % 1000}.{row % 100:02d}</td></tr>\n'
+            f.write(line)
+            size += len(line)
+            row += 1
+        f.write('</tbody></table></body></html>')
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def measure(mode: str, path: str):
+    """Extract and serialize the report in this process and print the peak RSS"""
+    logging.disable(logging.INFO)
+    from html_page_detector import HTMLPageDetector
+    from iterparse_extractor import extract_iterparse
+    from structure_format import dump_structure
+
+    with tempfile.TemporaryDirectory() as db_dir:
+        detector = HTMLPageDetector({'db_path': os.path.join(db_dir, 'bench.db')})
+        start = time.perf_counter()
+        if mode == 'tree':
+            from lxml import html
+            structure = detector.extract_tree_structure(html.parse(path).getroot())
+            elements = len(structure['elements'])
+            blob = dump_structure(structure)
+        else:
+            def chunks():
+                with open(path, 'rb') as f:
+                    while True:
+                        chunk = f.read(1024 * 1024)
+                        if not chunk:
+                            return
+                        yield chunk
+            structure = extract_iterparse(chunks(), subtree_hashes=detector.subtree_hashes).structure
+            elements = len(structure)
+            blob = structure.serialize()
+        elapsed = time.perf_counter() - start
+    print(f"{mode:<10}{elements:>12}{elapsed:>10.1f}{len(blob) / 1e6:>12.1f}{peak_rss_mb():>12.0f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak memory of tree and iterparse extraction")
+    parser.add_argument('--megabytes', type=float, nargs='+', default=[10, 30])
+    parser.add_argument('--measure', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(*args.measure)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for megabytes in args.megabytes:
+            path = os.path.join(tmp_dir, 'report.html')
+            write_report(path, megabytes)
+            print(f"\n{megabytes:g} MB report")
+            print(f"{'mode':<10}{'elements':>12}{'seconds':>10}{'blob MB':>12}{'peak MB':>12}")
+            # A fresh process per mode so peak RSS isn't shared
+            for mode in ('tree', 'iterparse'):
+                subprocess.run([sys.executable, os.path.abspath(__file__), '--measure', mode, path], check=True)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# bench_persist.py - Database work of a scan: a connection per call and row-by-row inserts vs. DatabaseManager
+
+import argparse
+import json
+import logging
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_page_detector import ChangeDetails, DatabaseManager
+
+class PerCallDatabase:
+    """The previous persistence: rollback journal, default pragmas, a new connection per call, one INSERT per change"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        DatabaseManager(db_path, journal_mode='delete').close()
+
+    def get_last_validators(self, url: str):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        result = conn.execute('''
+            SELECT etag, last_modified, content_length FROM scan_history
+            WHERE url = ? ORDER BY scan_time DESC LIMIT 1
+        ''', (url,)).fetchone()
+        conn.close()
+        return result
+
+    def get_last_scan(self, url: str):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        result = conn.execute('''
+            SELECT html_hash, xpath_structure, simhash FROM scan_history
+            WHERE url = ? ORDER BY scan_time DESC LIMIT 1
+        ''', (url,)).fetchone()
+        conn.close()
+        return result
+
+    def save_scan_result(self, url, html_hash, xpath_structure, changes):
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO scan_history (url, html_hash, xpath_structure, changes_detected, last_checked)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (url, html_hash, xpath_structure, len(changes)))
+        scan_id = cursor.lastrowid
+        for change in changes:
+            cursor.execute('''
+                INSERT INTO detected_changes
+                (scan_id, change_type, xpath, old_value, new_value, element_type, change_count, sample)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (scan_id, change.change_type, change.xpath, change.old_value, change.new_value,
+                  change.element_type, change.count, json.dumps(change.sample) if change.sample else None))
+        conn.commit()
+        conn.close()
+
+    def close(self):
+        pass
+
+def build_changes(count: int):
+    now = datetime.now()
+    return [ChangeDetails("element_text_changed", f"/html/body/div[{index % 50 + 1}]/p[{index + 1}]",
+                          f"old text {index}", f"new text {index}", "p", now)
+            for index in range(count)]
+
+def run(database, scans: int, changes, structure: bytes, threads: int) -> float:
+    """Seconds for ``scans`` scans' reads and writes, spread over ``threads`` threads"""
+    def scan(number: int):
+        url = f"https://example.com/page/{number % 100}"
+        database.get_last_validators(url)
+        database.get_last_scan(url)
+        database.save_scan_result(url, f"{number:032x}", structure, changes)
+
+    start = time.perf_counter()
+    if threads == 1:
+        for number in range(scans):
+            scan(number)
+    else:
+        with ThreadPoolExecutor(threads) as executor:
+            list(executor.map(scan, range(scans)))
+    return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark scan persistence")
+    parser.add_argument('--scans', type=int, default=500)
+    parser.add_argument('--changes', type=int, nargs='+', default=[0, 100, 10000])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--structure-bytes', type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    structure = os.urandom(args.structure_bytes)
+    print(f"{'changes':>8}{'threads':>9}{'scans':>7}{'per-call scans/s':>18}{'manager scans/s':>17}{'speedup':>9}")
+
+    for change_count in args.changes:
+        changes = build_changes(change_count)
+        # Fewer scans when each one writes many changes
+        scans = max(10, min(args.scans, args.scans * 100 // max(change_count, 1)))
+        for threads in args.threads:
+            with tempfile.TemporaryDirectory() as db_dir:
+                rates = []
+                for name, factory in (('per-call', PerCallDatabase), ('manager', DatabaseManager)):
+                    database = factory(os.path.join(db_dir, f"{name}.db"))
+                    rates.append(scans / run(database, scans, changes, structure, threads))
+                    database.close()
+            print(f"{change_count:>8}{threads:>9}{scans:>7}{rates[0]:>18.1f}{rates[1]:>17.1f}"
+                  f"{rates[1] / rates[0]:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
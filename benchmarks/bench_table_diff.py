@@ -0,0 +1,49 @@
+# bench_table_diff.py - Row/cell diff of large tables
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from table_diff import build_table_data, diff_tables
+
+def build_rows(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    return [[f"SKU-{index:07d}", f"item {index % 977}", f"{rng.random() * 100:.2f}", str(index % 7)]
+            for index in range(count)]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the table diff")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--changes', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    header = (True, ['SKU', 'Name', 'Price', 'Stock'])
+    old_rows = build_rows(args.rows)
+    new_rows = [list(row) for row in old_rows]
+    for index in rng.sample(range(len(new_rows)), args.changes):
+        new_rows[index][2] = 'sold out'
+    del new_rows[:args.changes // 10]
+    new_rows += [[f"NEW-{index:07d}", 'new item', '1.00', '1'] for index in range(args.changes // 10)]
+    rng.shuffle(new_rows)
+
+    start = time.perf_counter()
+    old = build_table_data([header] + [(False, row) for row in old_rows])
+    new = build_table_data([header] + [(False, row) for row in new_rows])
+    build_time = time.perf_counter() - start
+    print(f"{args.rows} rows, {args.changes} changed prices, {args.changes // 10} rows deleted and inserted, shuffled")
+    print(f"build table data: {build_time * 1000:.1f} ms")
+
+    for label, key in (('key column found', None), ('key column given', 'SKU')):
+        start = time.perf_counter()
+        diff = diff_tables(old, new, key)
+        elapsed = time.perf_counter() - start
+        print(f"{label}: {elapsed * 1000:.1f} ms, {len(diff.deleted)} deleted, {len(diff.inserted)} inserted, "
+              f"{len(diff.modified)} modified")
+
+if __name__ == "__main__":
+    main()
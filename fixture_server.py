@@ -0,0 +1,197 @@
+# fixture_server.py - Local HTTP stand-in for monitored sites, for offline load testing
+
+import argparse
+import hashlib
+import random
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+class FixtureSite:
+    """Simulated set of pages served by the fixture server
+
+    Every path is its own page. A page is ``page_size`` bytes of generated
+    HTML (nested sections, paragraphs, a table and a form) built from one
+    shared template, so serving thousands of pages stays cheap. Each request
+    bumps the page to a new version with probability ``change_probability``;
+    a new version changes a few text nodes and one table cell.
+    """
+
+    def __init__(self, page_size: int = 20000, latency: float = 0.0, latency_jitter: float = 0.0,
+                 change_probability: float = 0.1, etag: bool = True, last_modified: bool = True,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.page_size = page_size
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.change_probability = change_probability
+        self.etag = etag
+        self.last_modified = last_modified
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.template = self._build_template(page_size)
+        self.versions: Dict[str, list] = {}  # path -> [version, last modified time]
+        self.stats = {'requests': 0, 'ok': 0, 'not_modified': 0, 'errors': 0, 'bytes': 0}
+        self._lock = threading.Lock()
+
+    def _build_template(self, page_size: int) -> str:
+        """Build page HTML with {path} and {version} slots spread through it"""
+        rng = random.Random(page_size)
+        words = ['alpha', 'bravo', 'charlie', 'delta', 'echo', 'foxtrot', 'golf', 'hotel', 'india', 'juliet']
+        head = ('<!DOCTYPE html><html><head><title>Fixture {path}</title></head><body>'
+                '<div id="header"><h1>Page {path}</h1><p class="version">Version {version}</p></div>'
+                '<table id="prices"><thead><tr><th>Item</th><th>Price</th></tr></thead>'
+                '<tbody><tr><td>Widget</td><td>{version}.00</td></tr><tr><td>Gadget</td><td>9.99</td></tr></tbody>'
+                '</table><form action="/search" method="get"><input type="text" name="q"></form>')
+        tail = '<div id="footer"><p>Updated in version {version}</p></div></body></html>'
+
+        sections = []
+        size = len(head) + len(tail)
+        section = 0
+        while size < page_size:
+            paragraphs = ''.join(
+                f'<p class="c{rng.randint(0, 9)}">{" ".join(rng.choice(words) for _ in range(12))}</p>'
+                for _ in range(5)
+            )
+            block = f'<div class="section" id="s{section}"><h2>Section {section}</h2>{paragraphs}</div>'
+            if section % 10 == 5:
+                block += '<div class="changing"><span>{version}</span></div>'
+            sections.append(block)
+            size += len(block)
+            section += 1
+
+        return head + ''.join(sections) + tail
+
+    def render(self, path: str) -> Optional[tuple]:
+        """Serve one request: (status, headers, body), or None to drop the connection"""
+        with self._lock:
+            self.stats['requests'] += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                return 500, {}, b'Internal Server Error'
+
+            state = self.versions.setdefault(path, [0, time.time()])
+            if self.change_probability and self.random.random() < self.change_probability:
+                state[0] += 1
+                state[1] = time.time()
+            version, modified = state
+
+        body = self.template.replace('{path}', path).replace('{version}', str(version)).encode()
+        headers = {'Content-Type': 'text/html; charset=utf-8'}
+        if self.etag:
+            headers['ETag'] = '"%s"' % hashlib.md5(f'{path}:{version}'.encode()).hexdigest()
+        if self.last_modified:
+            headers['Last-Modified'] = formatdate(modified, usegmt=True)
+        return 200, headers, body
+
+    def delay(self):
+        """Sleep for the configured response latency"""
+        latency = self.latency + (self.random.uniform(0, self.latency_jitter) if self.latency_jitter else 0)
+        if latency > 0:
+            time.sleep(latency)
+
+class FixtureRequestHandler(BaseHTTPRequestHandler):
+    """Serves FixtureSite pages, honouring conditional request headers"""
+
+    protocol_version = 'HTTP/1.1'
+    site: FixtureSite = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.site.delay()
+        status, headers, body = self.site.render(self.path)
+
+        if status == 200 and (
+            (headers.get('ETag') and self.headers.get('If-None-Match') == headers['ETag']) or
+            (not headers.get('ETag') and headers.get('Last-Modified') and
+             self.headers.get('If-Modified-Since') == headers['Last-Modified'])
+        ):
+            status, body = 304, b''
+
+        with self.site._lock:
+            if status == 304:
+                self.site.stats['not_modified'] += 1
+            elif status == 200:
+                self.site.stats['ok'] += 1
+            self.site.stats['bytes'] += len(body)
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+class FixtureServer:
+    """Threaded HTTP server for a FixtureSite, runnable in the background"""
+
+    def __init__(self, site: FixtureSite, host: str = '127.0.0.1', port: int = 0):
+        self.site = site
+        handler = type('BoundFixtureRequestHandler', (FixtureRequestHandler,), {'site': site})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def url(self, number: int) -> str:
+        """URL of simulated page ``number``"""
+        return f"{self.base_url}/page/{number}"
+
+    def start(self):
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def add_site_arguments(parser: argparse.ArgumentParser):
+    """Add the FixtureSite options to a command line parser"""
+    parser.add_argument('--page-size', type=int, default=20000, help="bytes per page")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before each response")
+    parser.add_argument('--latency-jitter', type=float, default=0.0, help="extra random latency, up to this")
+    parser.add_argument('--change-probability', type=float, default=0.1, help="chance a request sees a new version")
+    parser.add_argument('--no-etag', action='store_true', help="don't send ETag headers")
+    parser.add_argument('--no-last-modified', action='store_true', help="don't send Last-Modified headers")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument('--seed', type=int, default=None, help="random seed")
+
+def site_from_arguments(args: argparse.Namespace) -> FixtureSite:
+    return FixtureSite(
+        page_size=args.page_size,
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        change_probability=args.change_probability,
+        etag=not args.no_etag,
+        last_modified=not args.no_last_modified,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+
+def main():
+    """Run the fixture server in the foreground"""
+    parser = argparse.ArgumentParser(description="Serve simulated pages for offline detector testing")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8800)
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    server = FixtureServer(site_from_arguments(args), args.host, args.port)
+    print(f"Serving simulated pages at {server.base_url}/page/<n>")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\nStopped. Stats: {server.site.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,67 @@
+import asyncio
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 from lxml import etree, html
 import json
 import hashlib
+import math
+import random
+import re
 import time
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 import logging
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional, Union
 import sqlite3
 import os
-from dataclasses import dataclass
+import multiprocessing
+import socket
+import threading
+import weakref
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
 from difflib import unified_diff
+from html import escape as escape_html
+from itertools import islice
+from urllib.parse import urlsplit
+
+from iterparse_extractor import IterparseExtractor, extract_iterparse
+from page_normalizer import PageNormalizer
+from simhash import similarity, simhash_tree
+from snapshot_store import SnapshotStore
+from structure_diff import diff_compact
+from structure_format import CompactStructure, dump_structure, is_compact, load_compact, load_structure, node_digest
+from structure_history import EMPTY_DELTA, apply_delta, encode_delta
+from table_diff import build_table_data, cell_text, diff_tables, row_values, xpath_literal
+from tree_diff import TreeMatch, match_trees
+from work_queue import SQLiteWorkQueue, WorkQueue
+
+# HTTP status codes worth retrying
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# One location step of an XPath; predicates may contain slashes, and quoted brackets
+XPATH_STEP = re.compile(r"/(?:[^/\[]|\[(?:[^\]'\"]|'[^']*'|\"[^\"]*\")*\])*")
+
+# A table row, and everything in it, below its table's XPath
+TABLE_ROW_STEP = r"(?:/thead|/tbody|/tfoot)?/tr(?:\[\d+\])?(?:/|$)"
+
+# Longest old/new value kept in the sample of a coalesced change
+SAMPLE_VALUE_LENGTH = 200
+
+# Boundary between adjacent tags, where long (e.g. minified) lines are split for diffing
+TAG_BOUNDARY = re.compile(r'>\s*(?=<)')
 
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(levelname)s - %(message)s',
     handlers=[
-        logging.FileHandler('html_detector.log'),
+        # Opened on the first record, so processes that never log here don't touch it
+        logging.FileHandler('html_detector.log', delay=True),
         logging.StreamHandler()
     ]
 )
@@ -35,87 +76,628 @@ class ChangeDetails:
     new_value: Optional[str]
     element_type: str
     timestamp: datetime
+    # Changes this one stands for, and a few of them, when several were coalesced
+    count: int = 1
+    sample: List[Dict] = field(default_factory=list)
+
+@dataclass
+class ScanResult:
+    """Outcome of a single URL scan"""
+    url: str
+    success: bool = False
+    changed: bool = False
+    change_count: int = 0
+    error: Optional[str] = None
+    duration: float = 0.0
+    not_modified: bool = False
+    # SimHash similarity to the last full scan, and whether that was close enough to skip the diff
+    similarity: Optional[float] = None
+    trivial: bool = False
+    # Seconds spent per pipeline stage: fetch, normalize, extract, compare, notify, persist
+    timings: Dict[str, float] = field(default_factory=dict)
+    
+    def mark(self, stage: str, since: float) -> float:
+        """Add the time since ``since`` to a stage and return the current time"""
+        now = time.monotonic()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - since
+        return now
+
+@dataclass
+class PageAnalysis:
+    """Fingerprint, structure and changes of a fetched page, compared to its last scan"""
+    content_hash: Optional[str] = None
+    # Serialized structure to store; the previous one again when the fingerprint is unchanged
+    structure: Union[str, bytes, None] = None
+    changes: List[ChangeDetails] = field(default_factory=list)
+    # Whether anything changed; without recorded change details, ``changes`` stays empty
+    changed: bool = False
+    regions: List[str] = field(default_factory=list)
+    # SimHash of the page's visible text; the previous one again when the diff was skipped
+    simhash: Optional[int] = None
+    similarity: Optional[float] = None
+    trivial: bool = False
+    timings: Dict[str, float] = field(default_factory=dict)
+    
+    def mark(self, stage: str, since: float) -> float:
+        """Add the time since ``since`` to a stage and return the current time"""
+        now = time.monotonic()
+        self.timings[stage] = self.timings.get(stage, 0.0) + now - since
+        return now
+
+@dataclass
+class FetchResult:
+    """Response of a (possibly conditional) page fetch"""
+    url: str
+    content: Optional[str] = None
+    status_code: Optional[int] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+    content_length: Optional[int] = None
+    not_modified: bool = False
+    # Set by streaming fetches instead of ``content``: the parsed tree, or
+    # in iterparse mode the finished extractor
+    tree: Optional[object] = None
+    extracted: Optional[IterparseExtractor] = None
+    # MD5 of the raw body bytes, in either mode
+    content_hash: Optional[str] = None
+    # Key of the raw body in the snapshot store, when snapshots are enabled
+    snapshot_key: Optional[str] = None
+    error: Optional[str] = None
+    
+    @property
+    def validators(self) -> Dict:
+        """Cache validators to store alongside the scan"""
+        return {
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'content_length': self.content_length
+        }
+
+class _ThreadOwner:
+    """Kept in one thread's local storage only, so it is collected when that thread exits"""
 
 class DatabaseManager:
     """Manages SQLite database operations for storing scan history"""
     
-    def __init__(self, db_path: str = "html_detector.db"):
+    # Schema changes applied on top of the base tables, in order. The number
+    # of applied entries is tracked in PRAGMA user_version.
+    MIGRATIONS = [
+        # HTTP cache validators for conditional requests
+        [
+            "ALTER TABLE scan_history ADD COLUMN etag TEXT",
+            "ALTER TABLE scan_history ADD COLUMN last_modified TEXT",
+            "ALTER TABLE scan_history ADD COLUMN content_length INTEGER",
+            "ALTER TABLE scan_history ADD COLUMN last_checked TIMESTAMP"
+        ],
+        # Per-URL adaptive scan schedule
+        [
+            '''
+            CREATE TABLE url_schedule (
+                url TEXT PRIMARY KEY,
+                scan_interval REAL NOT NULL,
+                next_scan REAL NOT NULL,
+                change_rate REAL,
+                checks REAL DEFAULT 0,
+                changes REAL DEFAULT 0,
+                observed_seconds REAL DEFAULT 0,
+                last_checked REAL
+            )
+            '''
+        ],
+        # Per-host circuit breaker state
+        [
+            '''
+            CREATE TABLE host_breaker (
+                host TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL DEFAULT 0,
+                opened_until REAL
+            )
+            '''
+        ],
+        # Work queue leases on the schedule rows
+        [
+            "ALTER TABLE url_schedule ADD COLUMN lease_owner TEXT",
+            "ALTER TABLE url_schedule ADD COLUMN lease_expires REAL",
+            "CREATE INDEX idx_url_schedule_due ON url_schedule (next_scan)"
+        ],
+        # SimHash of the visible text and similarity to the previous scan
+        [
+            "ALTER TABLE scan_history ADD COLUMN simhash INTEGER",
+            "ALTER TABLE scan_history ADD COLUMN similarity REAL"
+        ],
+        # Coalesced changes: how many changes a row stands for and a sample of them
+        [
+            "ALTER TABLE detected_changes ADD COLUMN change_count INTEGER DEFAULT 1",
+            "ALTER TABLE detected_changes ADD COLUMN sample TEXT"
+        ],
+        # Indexes for per-URL history and per-scan change lookups, and the latest scan of each URL
+        [
+            "CREATE INDEX idx_scan_history_url_time ON scan_history (url, scan_time)",
+            "CREATE INDEX idx_detected_changes_scan ON detected_changes (scan_id)",
+            '''
+            CREATE TABLE url_head (
+                url TEXT PRIMARY KEY,
+                scan_id INTEGER NOT NULL REFERENCES scan_history (id),
+                html_hash TEXT NOT NULL,
+                simhash INTEGER,
+                etag TEXT,
+                last_modified TEXT,
+                content_length INTEGER,
+                last_checked TIMESTAMP
+            )
+            ''',
+            '''
+            INSERT INTO url_head
+            (url, scan_id, html_hash, simhash, etag, last_modified, content_length, last_checked)
+            SELECT url, id, html_hash, simhash, etag, last_modified, content_length, last_checked
+            FROM scan_history WHERE id IN (SELECT MAX(id) FROM scan_history GROUP BY url)
+            '''
+        ],
+        # References to raw page versions in the snapshot store
+        [
+            "ALTER TABLE scan_history ADD COLUMN snapshot_key TEXT",
+            "ALTER TABLE url_head ADD COLUMN snapshot_key TEXT",
+            "CREATE INDEX idx_scan_history_url_snapshot ON scan_history (url, snapshot_key) WHERE snapshot_key IS NOT NULL",
+            "CREATE INDEX idx_scan_history_snapshot ON scan_history (snapshot_key) WHERE snapshot_key IS NOT NULL"
+        ],
+        # Structure history as keyframes and deltas; the latest full structure of each URL lives in url_head
+        [
+            "ALTER TABLE scan_history ADD COLUMN structure_base INTEGER",
+            "ALTER TABLE url_head ADD COLUMN structure BLOB",
+            "ALTER TABLE url_head ADD COLUMN structure_scan_id INTEGER",
+            "ALTER TABLE url_head ADD COLUMN keyframe_distance INTEGER NOT NULL DEFAULT 0",
+            '''
+            UPDATE url_head SET structure_scan_id = scan_id,
+                structure = (SELECT xpath_structure FROM scan_history WHERE scan_history.id = url_head.scan_id)
+            '''
+        ],
+        # The latest structure of each URL is read from the history row holding it, not kept twice
+        [
+            "ALTER TABLE url_head DROP COLUMN structure"
+        ],
+    ]
+    
+    # Per-connection tuning; the journal mode is set separately as it is a property of the database file
+    PRAGMAS = [
+        "PRAGMA synchronous = NORMAL",
+        "PRAGMA cache_size = -65536",
+        "PRAGMA mmap_size = 268435456",
+        "PRAGMA temp_store = MEMORY"
+    ]
+    
+    def __init__(self, db_path: str = "html_detector.db", journal_mode: str = "wal", busy_timeout: float = 30,
+                 keyframe_interval: int = 20):
         self.db_path = db_path
+        self.journal_mode = journal_mode
+        self.busy_timeout = busy_timeout
+        # Structure versions of a URL per full one in its history; the ones between are stored as deltas
+        self.keyframe_interval = keyframe_interval
+        # One long-lived connection per thread, so statements stay prepared in its cache
+        self._local = threading.local()
+        self._connections: List[Tuple[int, sqlite3.Connection]] = []
+        self._connections_lock = threading.Lock()
         self.init_database()
     
+    def _connection(self) -> sqlite3.Connection:
+        """The calling thread's connection, opened and tuned on first use"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        
+        # Connections don't survive a fork; a child process opens its own
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, check_same_thread=False,
+                               cached_statements=256)
+        if self.journal_mode:
+            conn.execute(f"PRAGMA journal_mode = {self.journal_mode}")
+        for pragma in self.PRAGMAS:
+            conn.execute(pragma)
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        entry = (os.getpid(), conn)
+        with self._connections_lock:
+            self._connections.append(entry)
+        # Thread-local storage is cleared when its thread exits, which closes the connection
+        self._local.owner = _ThreadOwner()
+        weakref.finalize(self._local.owner, self._release, entry)
+        return conn
+    
+    def _release(self, entry: Tuple[int, sqlite3.Connection]):
+        """Close the connection of a thread that exited, unless ``close`` already did"""
+        with self._connections_lock:
+            if entry not in self._connections:
+                return
+            self._connections.remove(entry)
+        if entry[0] != os.getpid():
+            # Inherited from the parent process; it closes its own
+            return
+        try:
+            entry[1].close()
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to close database connection: {e}")
+    
+    def close(self):
+        """Close the connections of all threads of this process"""
+        pid = os.getpid()
+        with self._connections_lock:
+            connections = [conn for owner, conn in self._connections if owner == pid]
+            self._connections = [entry for entry in self._connections if entry[0] != pid]
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Failed to close database connection: {e}")
+        self._local = threading.local()
+    
     def init_database(self):
-        """Initialize database tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        """Initialize database tables
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scan_history (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                url TEXT NOT NULL,
-                scan_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                html_hash TEXT NOT NULL,
-                xpath_structure TEXT NOT NULL,
-                changes_detected INTEGER DEFAULT 0
-            )
-        ''')
+        Tables and migrations are created in one ``BEGIN IMMEDIATE``
+        transaction, and the schema version is read only once it holds the
+        write lock. Processes starting together on a new or outdated
+        database thus apply every migration exactly once, and a migration
+        that fails is rolled back whole.
+        """
+        conn = self._connection()
+        if conn.execute('PRAGMA user_version').fetchone()[0] >= len(self.MIGRATIONS):
+            return
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS detected_changes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                scan_id INTEGER,
-                change_type TEXT NOT NULL,
-                xpath TEXT NOT NULL,
-                old_value TEXT,
-                new_value TEXT,
-                element_type TEXT,
-                detection_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (scan_id) REFERENCES scan_history (id)
-            )
-        ''')
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS scan_history (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    scan_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    html_hash TEXT NOT NULL,
+                    xpath_structure TEXT NOT NULL,
+                    changes_detected INTEGER DEFAULT 0
+                )
+            ''')
+            
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS detected_changes (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    scan_id INTEGER,
+                    change_type TEXT NOT NULL,
+                    xpath TEXT NOT NULL,
+                    old_value TEXT,
+                    new_value TEXT,
+                    element_type TEXT,
+                    detection_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (scan_id) REFERENCES scan_history (id)
+                )
+            ''')
+            
+            self._apply_migrations(cursor)
+    
+    def _apply_migrations(self, cursor):
+        """Bring the schema up to date with MIGRATIONS, inside the caller's write transaction"""
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
         
-        conn.commit()
-        conn.close()
+        for number, statements in enumerate(self.MIGRATIONS[version:], start=version + 1):
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(f'PRAGMA user_version = {number}')
+            logger.info(f"Applied database migration {number}")
     
-    def save_scan_result(self, url: str, html_hash: str, xpath_structure: str, changes: List[ChangeDetails]) -> int:
-        """Save scan result to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def save_scan_result(self, url: str, html_hash: str, xpath_structure: Union[str, bytes], changes: List[ChangeDetails],
+                         validators: Optional[Dict] = None, simhash: Optional[int] = None,
+                         similarity: Optional[float] = None, change_count: Optional[int] = None,
+                         snapshot_key: Optional[str] = None) -> int:
+        """Save scan result to database
         
-        # Insert scan history
-        cursor.execute('''
-            INSERT INTO scan_history (url, html_hash, xpath_structure, changes_detected)
-            VALUES (?, ?, ?, ?)
-        ''', (url, html_hash, xpath_structure, len(changes)))
+        ``change_count`` overrides the number of changes counted from
+        ``changes``, for scans that didn't record their change details.
+        ``snapshot_key`` refers to the raw page in the snapshot store.
         
-        scan_id = cursor.lastrowid
+        The history row stores the structure as a delta against the previous version (see
+        ``structure_history``), or in full every ``keyframe_interval``
+        versions and whenever the delta wouldn't be smaller. An unchanged
+        structure is an empty delta against the row holding that version,
+        so unchanged scans neither lengthen the chain ``get_structure``
+        follows to rebuild a version nor bring on keyframes.
         
-        # Insert detected changes
-        for change in changes:
+        The URL's head refers to the row holding the version. The delta is
+        computed before taking the write lock. The head is read again under
+        ``BEGIN IMMEDIATE``, and if another scan of the URL was saved
+        meanwhile the delta is recomputed against that one.
+        """
+        validators = validators or {}
+        if change_count is None:
+            change_count = sum(change.count for change in changes)
+        if simhash is not None and simhash >= 1 << 63:
+            # SQLite integers are signed
+            simhash -= 1 << 64
+        conn = self._connection()
+        head = self._read_head(conn, url)
+        stored, base, distance, structure_scan_id = self._plan_structure(head, xpath_structure)
+        
+        # The scan, its changes and the URL's head move together
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            
+            current = self._read_head(cursor, url)
+            if (current and current[0]) != (head and head[0]):
+                # Another scan of the URL was saved meanwhile; chain onto its version instead
+                stored, base, distance, structure_scan_id = self._plan_structure(current, xpath_structure)
+            
+            # Insert scan history
+            cursor.execute('''
+                INSERT INTO scan_history
+                (url, html_hash, xpath_structure, changes_detected, etag, last_modified, content_length, last_checked,
+                 simhash, similarity, snapshot_key, structure_base)
+                VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?, ?)
+            ''', (url, html_hash, stored, change_count, validators.get('etag'),
+                  validators.get('last_modified'), validators.get('content_length'), simhash, similarity,
+                  snapshot_key, base))
+            
+            scan_id = cursor.lastrowid
+            if structure_scan_id is None:
+                # This row holds the version, in full or as a delta
+                structure_scan_id = scan_id
+            
             cursor.execute('''
+                INSERT INTO url_head
+                (url, scan_id, html_hash, simhash, etag, last_modified, content_length, last_checked, snapshot_key,
+                 structure_scan_id, keyframe_distance)
+                VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP, ?, ?, ?)
+                ON CONFLICT(url) DO UPDATE SET
+                    scan_id = excluded.scan_id, html_hash = excluded.html_hash, simhash = excluded.simhash,
+                    etag = excluded.etag, last_modified = excluded.last_modified,
+                    content_length = excluded.content_length, last_checked = excluded.last_checked,
+                    snapshot_key = excluded.snapshot_key, structure_scan_id = excluded.structure_scan_id, keyframe_distance = excluded.keyframe_distance
+            ''', (url, scan_id, html_hash, simhash, validators.get('etag'), validators.get('last_modified'),
+                  validators.get('content_length'), snapshot_key, structure_scan_id, distance))
+            
+            # Insert detected changes
+            cursor.executemany('''
                 INSERT INTO detected_changes 
-                (scan_id, change_type, xpath, old_value, new_value, element_type)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (scan_id, change.change_type, change.xpath, change.old_value, 
-                  change.new_value, change.element_type))
+                (scan_id, change_type, xpath, old_value, new_value, element_type, change_count, sample)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', ((scan_id, change.change_type, change.xpath, change.old_value, 
+                   change.new_value, change.element_type, change.count,
+                   json.dumps(change.sample) if change.sample else None) for change in changes))
         
-        conn.commit()
-        conn.close()
         return scan_id
     
-    def get_last_scan(self, url: str) -> Optional[Tuple[str, str]]:
-        """Get last scan data for a URL"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+    def _read_head(self, cursor, url: str) -> Optional[Tuple]:
+        """The URL's head as (scan id, full structure, scan holding it, keyframe distance)"""
+        head = cursor.execute('SELECT scan_id, structure_scan_id, keyframe_distance FROM url_head WHERE url = ?',
+                              (url,)).fetchone()
+        if head is None:
+            return None
+        scan_id, structure_scan_id, distance = head
+        structure = self._structure_blob(structure_scan_id) if structure_scan_id is not None else None
+        return scan_id, structure, structure_scan_id, distance
+    
+    def _plan_structure(self, head: Optional[Tuple], xpath_structure: Union[str, bytes]) -> Tuple:
+        """How to store a structure after the URL's head row
+        
+        Returns the value to store, its base scan, the keyframe distance and
+        the scan holding the version, or None when the new row will hold it.
+        """
+        if head and head[1] is not None and head[2] is not None:
+            if head[1] == xpath_structure:
+                return EMPTY_DELTA, head[2], head[3], head[2]
+            if head[3] + 1 < self.keyframe_interval:
+                delta = self._structure_delta(head[1], xpath_structure)
+                if delta is not None and len(delta) < len(xpath_structure):
+                    return delta, head[2], head[3] + 1, None
+        return xpath_structure, None, 0, None
+    
+    def get_last_scan(self, url: str) -> Optional[Tuple[str, Union[str, bytes], Optional[int]]]:
+        """Get last scan data for a URL: fingerprint, structure and SimHash
+        
+        The structure is JSON text or a compact binary blob; read it with
+        ``structure_format.load_structure``.
+        """
+        cursor = self._connection().cursor()
+        
+        # One primary key lookup, whatever the history size, then the version's keyframe and deltas
+        cursor.execute('SELECT html_hash, structure_scan_id, simhash FROM url_head WHERE url = ?', (url,))
+        
+        result = cursor.fetchone()
+        
+        if not result:
+            return None
+        html_hash, structure_scan_id, simhash = result
+        structure = self._structure_blob(structure_scan_id) if structure_scan_id is not None else None
+        return html_hash, structure, simhash & 0xFFFFFFFFFFFFFFFF if simhash is not None else None
+    
+    def get_structure(self, scan_id: int) -> Optional[Dict]:
+        """Rebuild the structure dict stored with a scan from its keyframe and the deltas after it"""
+        chain = self._structure_chain(scan_id)
+        if chain is None:
+            return None
+        keyframe, deltas = chain
+        structure = load_structure(keyframe)
+        for delta in deltas:
+            structure = apply_delta(structure, delta)
+        return structure
+    
+    def _structure_blob(self, scan_id: int) -> Optional[Union[str, bytes]]:
+        """A scan's structure in full: its keyframe as stored, or rebuilt and serialized like the keyframe"""
+        chain = self._structure_chain(scan_id)
+        if chain is None:
+            return None
+        keyframe, deltas = chain
+        if not deltas:
+            return keyframe
+        structure = load_structure(keyframe)
+        for delta in deltas:
+            structure = apply_delta(structure, delta)
+        return dump_structure(structure, compact=is_compact(keyframe))
+    
+    def _structure_chain(self, scan_id: int) -> Optional[Tuple[Union[str, bytes], List[bytes]]]:
+        """The keyframe a scan's structure is built from and the non-empty deltas after it, oldest first"""
+        cursor = self._connection().cursor()
+        deltas = []
+        while True:
+            row = cursor.execute('SELECT xpath_structure, structure_base FROM scan_history WHERE id = ?',
+                                 (scan_id,)).fetchone()
+            if row is None:
+                return None
+            blob, scan_id = row
+            if scan_id is None:
+                break
+            if blob != EMPTY_DELTA:
+                deltas.append(blob)
+        return blob, deltas[::-1]
+    
+    @staticmethod
+    def _structure_delta(old_blob: Union[str, bytes], new_blob: Union[str, bytes]) -> Optional[bytes]:
+        """Delta between two stored structures, or None if either can't be read"""
+        if old_blob == new_blob:
+            return EMPTY_DELTA
+        try:
+            return encode_delta(load_structure(old_blob), load_structure(new_blob))
+        except ValueError as e:
+            logger.warning(f"Storing a full structure, as no delta could be computed: {e}")
+            return None
+    
+    def get_last_validators(self, url: str) -> Optional[Dict]:
+        """Get the HTTP cache validators stored with the last scan of a URL"""
+        cursor = self._connection().cursor()
+        
+        cursor.execute('SELECT etag, last_modified, content_length FROM url_head WHERE url = ?', (url,))
+        
+        result = cursor.fetchone()
+        
+        if not result:
+            return None
+        return {'etag': result[0], 'last_modified': result[1], 'content_length': result[2]}
+    
+    def get_last_snapshot_key(self, url: str) -> Optional[str]:
+        """Get the snapshot store key of the raw page stored with the last scan of a URL"""
+        result = self._connection().execute('SELECT snapshot_key FROM url_head WHERE url = ?', (url,)).fetchone()
+        return result[0] if result else None
+    
+    def expire_snapshots(self, url: str, keep: int) -> List[str]:
+        """Drop a URL's references to all but its ``keep`` most recent page versions
+        
+        Returns the keys of the dropped versions that no scan of any URL
+        refers to anymore, candidates for removal from the snapshot store.
+        """
+        conn = self._connection()
+        
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT snapshot_key FROM scan_history WHERE url = ? AND snapshot_key IS NOT NULL
+                GROUP BY snapshot_key ORDER BY MAX(id) DESC
+            ''', (url,))
+            expired = [row[0] for row in cursor.fetchall()[max(keep, 0):]]
+            if not expired:
+                return []
+            
+            cursor.executemany('UPDATE scan_history SET snapshot_key = NULL WHERE url = ? AND snapshot_key = ?',
+                               [(url, key) for key in expired])
+            cursor.executemany('UPDATE url_head SET snapshot_key = NULL WHERE url = ? AND snapshot_key = ?',
+                               [(url, key) for key in expired])
+            return [key for key in expired if cursor.execute(
+                'SELECT 1 FROM scan_history WHERE snapshot_key = ? LIMIT 1', (key,)
+            ).fetchone() is None]
+    
+    def unreferenced_snapshots(self, keys: Iterable[str]) -> List[str]:
+        """The given snapshot store keys that no scan of any URL refers to"""
+        cursor = self._connection().cursor()
+        keys = list(keys)
+        referenced = set()
+        # Stay below SQLite's bound parameter limit
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            cursor.execute(
+                f"SELECT DISTINCT snapshot_key FROM scan_history WHERE snapshot_key IN ({','.join('?' * len(chunk))})",
+                chunk
+            )
+            referenced.update(row[0] for row in cursor.fetchall())
+        return [key for key in keys if key not in referenced]
+    
+    def mark_not_modified(self, url: str):
+        """Record that the last stored scan of a URL was revalidated"""
+        conn = self._connection()
+        
+        with conn:
+            conn.execute('UPDATE url_head SET last_checked = CURRENT_TIMESTAMP WHERE url = ?', (url,))
+            conn.execute('''
+                UPDATE scan_history SET last_checked = CURRENT_TIMESTAMP
+                WHERE id = (SELECT scan_id FROM url_head WHERE url = ?)
+            ''', (url,))
+    
+    def get_scan_stats(self, url: str) -> Tuple[int, int, Optional[float], Optional[float]]:
+        """Get scan count, changed-scan count and first/last scan time (epoch) for a URL"""
+        cursor = self._connection().cursor()
         
         cursor.execute('''
-            SELECT html_hash, xpath_structure FROM scan_history 
-            WHERE url = ? ORDER BY scan_time DESC LIMIT 1
+            SELECT COUNT(*), COALESCE(SUM(changes_detected > 0), 0),
+                   MIN(CAST(strftime('%s', scan_time) AS REAL)), MAX(CAST(strftime('%s', scan_time) AS REAL))
+            FROM scan_history WHERE url = ?
         ''', (url,))
         
-        result = cursor.fetchone()
-        conn.close()
+        return cursor.fetchone()
+    
+    def get_url_schedule(self, url: str) -> Optional[Dict]:
+        """Get the adaptive schedule row of a URL"""
+        schedules = self.get_url_schedules([url])
+        return schedules.get(url)
+    
+    def get_url_schedules(self, urls: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Get adaptive schedule rows, for all URLs or the given ones"""
+        cursor = self._connection().cursor()
+        cursor.row_factory = sqlite3.Row
+        
+        if urls is None:
+            cursor.execute('SELECT * FROM url_schedule')
+            rows = cursor.fetchall()
+        else:
+            rows = []
+            # Stay below SQLite's bound parameter limit
+            for start in range(0, len(urls), 500):
+                chunk = urls[start:start + 500]
+                cursor.execute(
+                    f"SELECT * FROM url_schedule WHERE url IN ({','.join('?' * len(chunk))})", chunk
+                )
+                rows.extend(cursor.fetchall())
+        
+        return {row['url']: dict(row) for row in rows}
+    
+    def save_url_schedule(self, schedule: Dict):
+        """Insert or update the adaptive schedule row of a URL"""
+        conn = self._connection()
+        
+        # Upsert so work queue lease columns on the same row are left alone
+        with conn:
+            conn.execute('''
+                INSERT INTO url_schedule
+                (url, scan_interval, next_scan, change_rate, checks, changes, observed_seconds, last_checked)
+                VALUES (:url, :scan_interval, :next_scan, :change_rate, :checks, :changes, :observed_seconds, :last_checked)
+                ON CONFLICT(url) DO UPDATE SET
+                    scan_interval = excluded.scan_interval, next_scan = excluded.next_scan,
+                    change_rate = excluded.change_rate, checks = excluded.checks, changes = excluded.changes,
+                    observed_seconds = excluded.observed_seconds, last_checked = excluded.last_checked
+            ''', schedule)
+    
+    def get_host_breakers(self) -> Dict[str, Tuple[int, Optional[float]]]:
+        """Get the stored circuit breaker state of all hosts"""
+        cursor = self._connection().cursor()
+        
+        cursor.execute('SELECT host, failures, opened_until FROM host_breaker')
+        return {host: (failures, opened_until) for host, failures, opened_until in cursor.fetchall()}
+    
+    def save_host_breaker(self, host: str, failures: int, opened_until: Optional[float]):
+        """Store the circuit breaker state of a host, dropping it once healthy"""
+        conn = self._connection()
         
-        return result if result else None
+        with conn:
+            if failures:
+                conn.execute('''
+                    INSERT OR REPLACE INTO host_breaker (host, failures, opened_until) VALUES (?, ?, ?)
+                ''', (host, failures, opened_until))
+            else:
+                conn.execute('DELETE FROM host_breaker WHERE host = ?', (host,))
 
 class EmailNotifier:
     """Handles email notifications for detected changes"""
@@ -172,12 +754,12 @@ class EmailNotifier:
             <div class="content">
                 <h3>URL: {url}</h3>
                 <p><strong>Detection Time:</strong> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
-                <p><strong>Total Changes:</strong> {len(changes)}</p>
+                <p><strong>Total Changes:</strong> {sum(change.count for change in changes)}</p>
                 
                 <h3>Change Summary:</h3>
                 {change_summary}
                 
-                {"<h3>HTML Diff:</h3><div class='diff'>" + html_diff + "</div>" if html_diff else ""}
+                {"<h3>HTML Diff:</h3><div class='diff'>" + escape_html(html_diff) + "</div>" if html_diff else ""}
             </div>
         </body>
         </html>
@@ -188,6 +770,23 @@ class EmailNotifier:
         """Create HTML summary of changes"""
         summary = ""
         for change in changes:
+            if change.count > 1:
+                # Coalesced changes show their count and sample only
+                samples = "".join(
+                    f"""<li><span class="xpath">{entry['xpath']}</span>"""
+                    f"""{": " + str(entry['old_value']) if entry.get('old_value') else ""}"""
+                    f"""{" &rarr; " + str(entry['new_value']) if entry.get('new_value') else ""}</li>"""
+                    for entry in change.sample
+                )
+                summary += f"""
+            <div class="change">
+                <strong>Type:</strong> {change.change_type} ({change.count} changes)<br>
+                <strong>Below:</strong> <span class="xpath">{change.xpath}</span><br>
+                <strong>Element:</strong> {change.element_type}<br>
+                <strong>Sample:</strong><ul>{samples}</ul>
+            </div>
+            """
+                continue
             summary += f"""
             <div class="change">
                 <strong>Type:</strong> {change.change_type}<br>
@@ -199,45 +798,485 @@ class EmailNotifier:
             """
         return summary
 
-class HTMLPageDetector:
-    """Main class for detecting HTML page changes"""
+class HostRateLimiter:
+    """Token bucket rate limiter keyed by hostname
+    
+    Every host gets its own bucket holding up to ``burst`` tokens that refill
+    at one token per ``delay`` seconds, where the delay is the host's
+    crawl-delay override if one is set and ``default_delay`` otherwise.
+    Taking a token from an empty bucket reserves the next free slot, so
+    callers queued on the same host are spaced out while other hosts are
+    unaffected.
+    """
+    
+    def __init__(self, default_delay: float = 5.0, burst: int = 1, crawl_delays: Optional[Dict[str, float]] = None):
+        self.default_delay = max(0.0, float(default_delay))
+        self.burst = max(1, int(burst))
+        self.crawl_delays = {host.lower(): float(delay) for host, delay in (crawl_delays or {}).items()}
+        self._buckets: Dict[str, List[float]] = {}  # host -> [tokens, last refill time]
+        self._lock = threading.Lock()
+    
+    def set_crawl_delay(self, host: str, delay: float):
+        """Override the spacing between requests to one host"""
+        with self._lock:
+            self.crawl_delays[host.lower()] = float(delay)
+    
+    def delay_for(self, host: str) -> float:
+        """Seconds between requests to a host"""
+        return self.crawl_delays.get(host.lower(), self.default_delay)
+    
+    def reserve(self, host: str) -> float:
+        """Take a token for a host and return how long to wait before using it"""
+        delay = self.delay_for(host)
+        if delay <= 0:
+            return 0.0
+        
+        with self._lock:
+            now = time.monotonic()
+            tokens, last_refill = self._buckets.get(host.lower(), (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - last_refill) / delay) - 1
+            self._buckets[host.lower()] = [tokens, now]
+        
+        # A negative balance is the queue of callers ahead of us on this host
+        return -tokens * delay if tokens < 0 else 0.0
+    
+    def wait(self, host: str):
+        """Block until a request to a host is allowed"""
+        time.sleep(self.reserve(host))
+    
+    async def acquire(self, host: str):
+        """Wait without blocking the event loop until a request to a host is allowed"""
+        await asyncio.sleep(self.reserve(host))
+
+class CircuitBreaker:
+    """Per-host circuit breaker for hosts that can't be reached
+    
+    A fetch that still fails to connect or times out after all its retries
+    counts as one failure against its host. After ``threshold`` such
+    fetches in a row the breaker opens and requests to that host are
+    skipped for ``cooldown`` seconds. After the cool-down the breaker is
+    half-open: ``allow`` lets a single probe through and turns everyone
+    else away until the probe ends. A probe that reaches the host closes the
+    breaker and a failed one re-opens it right away. State is persisted
+    through the database manager so a restart doesn't retry hosts that are
+    known to be down; the half-open probe is tracked per process.
+    """
+    
+    def __init__(self, db_manager: DatabaseManager, threshold: int = 5, cooldown: float = 300):
+        self.db_manager = db_manager
+        self.threshold = max(1, int(threshold))
+        self.cooldown = float(cooldown)
+        self._lock = threading.Lock()
+        self._state = {
+            host: [failures, opened_until]
+            for host, (failures, opened_until) in db_manager.get_host_breakers().items()
+        }
+        # Start time of the probe in flight, per half-open host
+        self._probes: Dict[str, float] = {}
+    
+    def allow(self, host: str) -> bool:
+        """Check whether a request to a host may be attempted
+        
+        On a half-open breaker the first caller becomes the probe and must
+        end it with ``record_success``, ``record_failure`` or ``release``.
+        A probe that hasn't ended within a cool-down is given up on.
+        """
+        now = time.time()
+        with self._lock:
+            state = self._state.get(host)
+            if not (state and state[1]):
+                return True
+            if state[1] > now:
+                return False
+            started = self._probes.get(host)
+            if started is not None and started + self.cooldown > now:
+                return False
+            self._probes[host] = now
+            return True
+    
+    def is_open(self, host: str) -> bool:
+        """Whether requests to a host are being skipped until its cool-down ends"""
+        with self._lock:
+            state = self._state.get(host)
+            return bool(state and state[1] and state[1] > time.time())
+    
+    def record_success(self, host: str):
+        """Close the breaker of a host after a request reached it"""
+        with self._lock:
+            self._probes.pop(host, None)
+            if self._state.pop(host, None) is None:
+                return
+        logger.info(f"Circuit breaker for {host} closed")
+        self.db_manager.save_host_breaker(host, 0, None)
+    
+    def record_failure(self, host: str):
+        """Count a fetch that couldn't reach a host"""
+        with self._lock:
+            self._probes.pop(host, None)
+            state = self._state.setdefault(host, [0, None])
+            state[0] += 1
+            opened = state[0] >= self.threshold
+            if opened:
+                state[1] = time.time() + self.cooldown
+            failures, opened_until = state
+        
+        if opened:
+            logger.warning(f"Circuit breaker for {host} open for {self.cooldown:.0f}s after {failures} failures")
+        self.db_manager.save_host_breaker(host, failures, opened_until)
+    
+    def release(self, host: str):
+        """End a probe that neither reached nor failed to reach its host, so another request can probe"""
+        with self._lock:
+            self._probes.pop(host, None)
+
+class AdaptiveScheduler:
+    """Derives each URL's scan interval from its own change history
+    
+    Every completed check adds one observation interval to the URL's
+    counters, noting whether a change was detected in it. The change rate is
+    estimated with the Cho & Garcia-Molina estimator, which stays sensible
+    when several changes fall into one interval:
+    
+        rate = -ln((n - X + 0.5) / (n + 0.5)) / mean_interval
+    
+    for n checks with X detected changes. A URL that never changed gets rate
+    0, and with it the longest interval. The next interval is
+    ``rate_factor / rate`` clamped to the URL's min/max interval, so volatile
+    pages are polled often and static ones rarely. Counters are scaled down
+    once they exceed ``history_window`` checks so the estimate follows pages
+    whose behaviour changes over time.
+    """
+    
+    def __init__(self, db_manager: DatabaseManager, default_interval: float = 3600,
+                 min_interval: float = 300, max_interval: float = 86400,
+                 url_intervals: Optional[Dict[str, Dict]] = None,
+                 rate_factor: float = 0.5, history_window: int = 50):
+        self.db_manager = db_manager
+        self.default_interval = float(default_interval)
+        self.min_interval = float(min_interval)
+        self.max_interval = float(max_interval)
+        self.url_intervals = url_intervals or {}
+        self.rate_factor = float(rate_factor)
+        self.history_window = max(1, int(history_window))
+        self._lock = threading.Lock()
+    
+    def interval_bounds(self, url: str) -> Tuple[float, float]:
+        """Get the (min, max) scan interval of a URL"""
+        overrides = self.url_intervals.get(url, {})
+        min_interval = float(overrides.get('min_interval', self.min_interval))
+        max_interval = float(overrides.get('max_interval', self.max_interval))
+        return min_interval, max(min_interval, max_interval)
+    
+    def _clamp(self, url: str, interval: float) -> float:
+        min_interval, max_interval = self.interval_bounds(url)
+        return min(max(interval, min_interval), max_interval)
+    
+    def _seed_schedule(self, url: str, now: float) -> Dict:
+        """Build the initial schedule of a URL from its stored scan history"""
+        scans, changed_scans, first_scan, last_scan = self.db_manager.get_scan_stats(url)
+        schedule = {
+            'url': url,
+            'scan_interval': self._clamp(url, self.default_interval),
+            'next_scan': now,
+            'change_rate': None,
+            'checks': max(0, scans - 1),
+            'changes': changed_scans,
+            'observed_seconds': (last_scan - first_scan) if scans > 1 else 0.0,
+            'last_checked': last_scan
+        }
+        self._update_estimate(schedule)
+        if last_scan is not None:
+            schedule['next_scan'] = last_scan + schedule['scan_interval']
+        return schedule
+    
+    def _update_estimate(self, schedule: Dict):
+        """Recompute change rate and interval from the schedule's counters"""
+        checks = schedule['checks']
+        observed = schedule['observed_seconds']
+        if checks <= 0 or observed <= 0:
+            return
+        
+        changes = min(schedule['changes'], checks)
+        mean_interval = observed / checks
+        rate = -math.log((checks - changes + 0.5) / (checks + 0.5)) / mean_interval
+        schedule['change_rate'] = rate
+        schedule['scan_interval'] = self._clamp(
+            schedule['url'], self.rate_factor / rate if rate > 0 else float('inf')
+        )
+    
+    def ensure(self, urls: List[str]):
+        """Create schedule rows for URLs seen for the first time"""
+        with self._lock:
+            self._load(urls, time.time())
+    
+    def _load(self, urls: List[str], now: float) -> Dict[str, Dict]:
+        schedules = self.db_manager.get_url_schedules(urls)
+        for url in urls:
+            # Rows added straight to the work queue have no interval yet
+            if url not in schedules or schedules[url]['scan_interval'] <= 0:
+                schedules[url] = self._seed_schedule(url, now)
+                self.db_manager.save_url_schedule(schedules[url])
+        return schedules
+    
+    def due_urls(self, urls: List[str], now: Optional[float] = None) -> List[str]:
+        """Get the URLs whose next scan time has passed"""
+        now = time.time() if now is None else now
+        with self._lock:
+            schedules = self._load(urls, now)
+        return [url for url in urls if schedules[url]['next_scan'] <= now]
+    
+    def seconds_until_due(self, urls: List[str], now: Optional[float] = None) -> float:
+        """Get the time until the earliest of the URLs is due"""
+        now = time.time() if now is None else now
+        with self._lock:
+            schedules = self._load(urls, now)
+        if not schedules:
+            return self.default_interval
+        return max(0.0, min(schedule['next_scan'] for schedule in schedules.values()) - now)
+    
+    def record_scan(self, url: str, changed: bool, now: Optional[float] = None) -> float:
+        """Add a completed check to a URL's history and return its new interval"""
+        now = time.time() if now is None else now
+        with self._lock:
+            schedule = self._load([url], now)[url]
+            
+            if schedule['last_checked'] is not None and now > schedule['last_checked']:
+                schedule['checks'] += 1
+                schedule['changes'] += 1 if changed else 0
+                schedule['observed_seconds'] += now - schedule['last_checked']
+                
+                if schedule['checks'] > self.history_window:
+                    scale = self.history_window / schedule['checks']
+                    for key in ('checks', 'changes', 'observed_seconds'):
+                        schedule[key] *= scale
+            
+            previous_interval = schedule['scan_interval']
+            schedule['last_checked'] = now
+            self._update_estimate(schedule)
+            schedule['next_scan'] = now + schedule['scan_interval']
+            self.db_manager.save_url_schedule(schedule)
+        
+        if abs(schedule['scan_interval'] - previous_interval) >= 1:
+            logger.info(f"Scan interval for {url} is now {schedule['scan_interval']:.0f}s")
+        return schedule['scan_interval']
+    
+    def next_scan(self, url: str) -> float:
+        """Get the next scan time (epoch) of a URL"""
+        with self._lock:
+            return self._load([url], time.time())[url]['next_scan']
+    
+    def postpone(self, url: str, now: Optional[float] = None):
+        """Push back a URL whose scan failed without touching its history"""
+        now = time.time() if now is None else now
+        with self._lock:
+            schedule = self._load([url], now)[url]
+            schedule['next_scan'] = now + schedule['scan_interval']
+            self.db_manager.save_url_schedule(schedule)
+    
+    def get_intervals(self, urls: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Get the computed interval, next scan time and change rate of URLs"""
+        with self._lock:
+            schedules = self._load(urls, time.time()) if urls is not None else self.db_manager.get_url_schedules()
+        
+        return {
+            url: {
+                'scan_interval': schedule['scan_interval'],
+                'next_scan': datetime.fromtimestamp(schedule['next_scan']).isoformat(),
+                'change_rate_per_hour': schedule['change_rate'] * 3600 if schedule['change_rate'] is not None else None,
+                'checks': schedule['checks'],
+                'changes': schedule['changes'],
+                'bounds': self.interval_bounds(url)
+            }
+            for url, schedule in schedules.items()
+        }
+
+class PageAnalyzer:
+    """Extracts the structure of fetched pages and compares it to their last scan's
+    
+    Holds only the extraction, normalization and comparison settings of a
+    detector config. It opens no database, session or files, which makes it
+    cheap to build in analysis worker processes; ``HTMLPageDetector`` adds
+    fetching, storage, alerts and scheduling.
+    """
     
     def __init__(self, config: Dict):
         self.config = config
-        self.db_manager = DatabaseManager(config.get('db_path', 'html_detector.db'))
-        
-        # Initialize email notifier if configured
-        self.email_notifier = None
-        if config.get('email_enabled', False):
-            self.email_notifier = EmailNotifier(
-                config['smtp_server'],
-                config['smtp_port'],
-                config['email'],
-                config['email_password']
-            )
+        # Per-URL settings from the config.py ``urls`` list
+        self.url_settings = {
+            entry['url']: entry for entry in config.get('urls', []) if isinstance(entry, dict) and 'url' in entry
+        }
+        self._selector_cache: Dict[str, object] = {}
+        # Noise normalization rules for every URL; per-URL rules override them
+        self.normalization = {
+            'collapse_whitespace': self._setting('ignore_whitespace', 'detection.ignore_whitespace', True),
+            'min_text_length': self._setting('min_text_length', 'detection.min_text_length', 0),
+            **(self._setting('normalization', 'detection.normalization', None) or {})
+        }
+        self._normalizer_cache: Dict[str, Optional[PageNormalizer]] = {}
+        self.subtree_hashes = config.get('subtree_hashes', True)
+        # Store full table contents and diff them row by row and cell by cell
+        self.table_diff = config.get('table_diff', True)
+        # Store a SimHash of each page's visible text; with a similarity threshold,
+        # pages at least that similar to their last full scan skip the structural diff
+        self.simhash = config.get('simhash', True)
+        self.similarity_threshold = config.get('similarity_threshold')
+        # 'xpath' compares elements at equal positional XPaths; 'tree' matches them by
+        # anchors and sibling alignment first (see tree_diff.py)
+        self.diff_mode = config.get('diff_mode', 'xpath')
+        # Changes beyond this many per scan are coalesced into one row per subtree and change type
+        self.max_changes_per_scan = config.get('max_changes_per_scan', 500)
+        self.change_sample_size = int(config.get('change_sample_size', 5))
+        # Store each scan's changes; without them (and without alerts), comparisons stop at the first change
+        self.record_changes = config.get('record_changes', True)
+        # Alerts need every change's details, recorded or not
+        self.send_alerts = bool(config.get('email_enabled', False) and config.get('recipients'))
+        # 'tree' extraction from a parsed DOM, or bounded-memory 'iterparse' extraction from parser events
+        self.extraction_mode = config.get('extraction_mode', 'tree')
+        # 'compact' binary structures (see structure_format.py) or 'json'
+        self.structure_format = config.get('structure_format', 'compact')
+    
+    def _setting(self, key: str, nested_key: str, default=None):
+        """Read a setting from the flat detector config, falling back to the nested config.py layout"""
+        if key in self.config:
+            return self.config[key]
         
-        self.session = requests.Session()
-        # Set user agent to avoid blocking
-        self.session.headers.update({
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        })
+        value = self.config
+        for part in nested_key.split('.'):
+            if not isinstance(value, dict) or part not in value:
+                return default
+            value = value[part]
+        return value
     
-    def fetch_page(self, url: str) -> Optional[str]:
-        """Fetch HTML content from URL"""
+    def extract_xpath_structure(self, html_content: str, selectors: Optional[List[str]] = None) -> Dict:
+        """Extract XPath-based structure from HTML, optionally only from the regions matched by selectors"""
         try:
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-            return response.text
-        except requests.RequestException as e:
-            logger.error(f"Failed to fetch {url}: {e}")
-            return None
+            # Parse HTML with lxml
+            doc = html.document_fromstring(html_content)
+        except Exception as e:
+            logger.error(f"Failed to extract XPath structure: {e}")
+            return {}
+        
+        return self.extract_tree_structure(doc, self.select_scopes(doc, selectors) if selectors else None)
+    
+    def get_url_selectors(self, url: str) -> List[str]:
+        """Get the CSS/XPath selectors a URL's monitoring is restricted to
+        
+        Selectors come from ``custom_selectors`` of the URL's entry in the
+        ``urls`` list (config.py layout) or from the flat ``custom_selectors``
+        mapping of URL to selector list.
+        """
+        flat = self.config.get('custom_selectors')
+        if isinstance(flat, dict) and url in flat:
+            return list(flat[url])
+        entry = self.url_settings.get(url, {})
+        return list(entry.get('custom_selectors') or [])
+    
+    def get_normalizer(self, url: str) -> Optional[PageNormalizer]:
+        """Get the noise normalizer for a URL, or None if normalization is disabled for it
+        
+        The global ``normalization`` rules are overridden by the URL's entry
+        in the flat ``url_normalization`` mapping or by ``normalization`` of
+        its entry in the ``urls`` list (config.py layout). Normalizers are
+        compiled once per distinct set of rules.
+        """
+        overrides = (self.config.get('url_normalization') or {}).get(url)
+        if overrides is None:
+            overrides = self.url_settings.get(url, {}).get('normalization')
+        rules = {**self.normalization, **(overrides or {})}
+        
+        key = json.dumps(rules, sort_keys=True)
+        if key not in self._normalizer_cache:
+            self._normalizer_cache[key] = PageNormalizer(rules) if rules.get('enabled', True) else None
+        return self._normalizer_cache[key]
+    
+    def get_table_keys(self, url: str):
+        """Get the key columns that identify table rows of a URL across scans
+        
+        From the flat ``table_keys`` mapping of URL to key, or ``table_keys``
+        of the URL's entry in the ``urls`` list (config.py layout). A key is a
+        column name or index for every table, or a mapping of table XPath to
+        column. Tables without a key use their first column whose values are
+        unique, else match rows by content and position.
+        """
+        flat = self.config.get('table_keys')
+        if isinstance(flat, dict) and url in flat:
+            return flat[url]
+        return self.url_settings.get(url, {}).get('table_keys')
+    
+    def get_similarity_threshold(self, url: str) -> Optional[float]:
+        """Get the SimHash similarity above which changes of a URL count as trivial
+        
+        From the flat ``url_similarity_thresholds`` mapping, the
+        ``similarity_threshold`` of the URL's entry in the ``urls`` list
+        (config.py layout) or the global ``similarity_threshold``. None, the
+        default, always runs the structural diff.
+        """
+        flat = self.config.get('url_similarity_thresholds')
+        if isinstance(flat, dict) and url in flat:
+            return flat[url]
+        entry = self.url_settings.get(url, {})
+        if 'similarity_threshold' in entry:
+            return entry['similarity_threshold']
+        return self.similarity_threshold
+    
+    def _compile_selector(self, selector: str):
+        """Compile a CSS or XPath selector once and cache it
+        
+        Selectors starting with ``/``, ``./`` or ``(`` are XPath, anything
+        else is CSS (which needs the optional cssselect package).
+        """
+        compiled = self._selector_cache.get(selector)
+        if compiled is None:
+            if selector.startswith(('/', './', '(')):
+                compiled = etree.XPath(selector)
+            else:
+                try:
+                    from lxml.cssselect import CSSSelector
+                except ImportError:
+                    raise ValueError(f"CSS selector {selector!r} needs the cssselect package; use XPath instead")
+                compiled = CSSSelector(selector)
+            self._selector_cache[selector] = compiled
+        return compiled
+    
+    def select_scopes(self, doc, selectors: List[str]) -> List:
+        """Get the elements matched by selectors in document order, without nested matches"""
+        matched = []
+        for selector in selectors:
+            try:
+                matched.extend(node for node in self._compile_selector(selector)(doc) if isinstance(node.tag, str))
+            except Exception as e:
+                logger.error(f"Invalid selector {selector!r}: {e}")
+        
+        # Keep outermost matches only so no subtree is extracted twice
+        matched_ids = {id(node) for node in matched}
+        scopes = []
+        seen = set()
+        for node in matched:
+            if id(node) in seen or any(id(ancestor) in matched_ids for ancestor in node.iterancestors()):
+                continue
+            seen.add(id(node))
+            scopes.append(node)
+        
+        if len(selectors) > 1:
+            order = {id(node): index for index, node in enumerate(doc.getroottree().iter())}
+            scopes.sort(key=lambda node: order.get(id(node), 0))
+        return scopes
+    
+    def _scope_hash(self, scopes: List) -> str:
+        """Fingerprint of the selected regions of a page"""
+        digest = hashlib.md5()
+        for scope in scopes:
+            # Without the tail: text after a region belongs to its surroundings
+            digest.update(etree.tostring(scope, with_tail=False))
+        return digest.hexdigest()
     
-    def extract_xpath_structure(self, html_content: str) -> Dict:
-        """Extract XPath-based structure from HTML"""
+    def extract_tree_structure(self, doc, scopes: Optional[List] = None) -> Dict:
+        """Extract XPath-based structure from an already parsed document
+        
+        With ``scopes`` only those subtrees are extracted; their XPaths are
+        still absolute paths within the document.
+        """
         try:
-            # Parse HTML with lxml
-            doc = html.fromstring(html_content)
-            
             structure = {
                 'elements': {},
                 'attributes': {},
@@ -245,36 +1284,50 @@ class HTMLPageDetector:
                 'forms': {}
             }
             
-            # Extract all elements with their XPaths
-            for element in doc.iter():
-                if element.tag:
-                    xpath = self._get_element_xpath(element)
-                    structure['elements'][xpath] = {
-                        'tag': element.tag,
-                        'text': (element.text or '').strip()[:100],  # Limit text length
-                        'tail': (element.tail or '').strip()[:100]
-                    }
-                    
-                    # Extract attributes
-                    if element.attrib:
-                        structure['attributes'][xpath] = dict(element.attrib)
+            if self.table_diff:
+                structure['table_data'] = {}
+            
+            tables = []
+            forms = []
+            nodes = []
+            
+            # Extract all elements with their XPaths, collecting tables and forms on the way
+            for element, xpath, tag in (
+                item for root in (scopes if scopes is not None else [doc]) for item in self._iter_element_paths(root)
+            ):
+                structure['elements'][xpath] = {
+                    'tag': tag,
+                    'text': (element.text or '').strip()[:100],  # Limit text length
+                    'tail': (element.tail or '').strip()[:100]
+                }
+                
+                # Extract attributes
+                if element.attrib:
+                    structure['attributes'][xpath] = dict(element.attrib)
+                
+                if self.subtree_hashes:
+                    nodes.append((xpath, tag, element.text, element.tail, element.attrib))
+                
+                if tag == 'table':
+                    tables.append((xpath, element))
+                elif tag == 'form':
+                    forms.append((xpath, element))
             
             # Extract table structures
-            tables = doc.xpath('//table')
-            for i, table in enumerate(tables):
-                table_xpath = self._get_element_xpath(table)
+            for table_xpath, table in tables:
                 structure['tables'][table_xpath] = self._extract_table_structure(table)
+                if self.table_diff:
+                    structure['table_data'][table_xpath] = self._extract_table_data(table)
             
             # Extract form structures
-            forms = doc.xpath('//form')
-            for form in forms:
-                form_xpath = self._get_element_xpath(form)
+            for form_xpath, form in forms:
                 structure['forms'][form_xpath] = self._extract_form_structure(form)
             
-            print(f"Extracted structure from HTML content with {len(structure['elements'])} elements, "
-                  f"{len(structure['tables'])} tables, and {len(structure['forms'])} forms.")
-            logger.info(f"Extracted structure from HTML content with {len(structure['elements'])} elements, "
-                        f"{len(structure['tables'])} tables, and {len(structure['forms'])} forms.") 
+            if self.subtree_hashes:
+                structure['subtree_hashes'] = self._compute_subtree_hashes(nodes)
+            
+            logger.debug(f"Extracted structure from HTML content with {len(structure['elements'])} elements, "
+                         f"{len(structure['tables'])} tables, and {len(structure['forms'])} forms.")
             
             return structure
             
@@ -282,6 +1335,91 @@ class HTMLPageDetector:
             logger.error(f"Failed to extract XPath structure: {e}")
             return {}
     
+    def _compute_subtree_hashes(self, nodes: List[Tuple]) -> Dict[str, List]:
+        """Compute a Merkle hash and size for every subtree
+        
+        ``nodes`` are (xpath, tag, text, tail, attrib) in document order. A
+        node's hash covers its tag, raw text and tail, sorted attributes and
+        its children's hashes in order, so equal hashes mean everything
+        compare_structures looks at in that subtree (elements, attributes,
+        table and form summaries) is equal. The size, the number of nodes in
+        the subtree, lets a walk over the document-ordered keys jump past a
+        subtree in one step. Returns {xpath: [hex digest, size]}.
+        """
+        index = {xpath: position for position, (xpath, _, _, _, _) in enumerate(nodes)}
+        child_digests: List[List[bytes]] = [[] for _ in nodes]
+        sizes = [1] * len(nodes)
+        hashes = [None] * len(nodes)
+        
+        # Children follow their parent in document order, so going backwards
+        # every node is hashed after all of its children
+        for position in range(len(nodes) - 1, -1, -1):
+            xpath, tag, text, tail, attrib = nodes[position]
+            hashes[position] = node_digest(tag, text, tail, attrib, b''.join(reversed(child_digests[position])))
+            
+            parent = index.get(xpath.rpartition('/')[0])
+            if parent is not None:
+                child_digests[parent].append(hashes[position])
+                sizes[parent] += sizes[position]
+        
+        return {xpath: [hashes[position].hex(), sizes[position]] for xpath, position in index.items()}
+    
+    def _iter_element_paths(self, doc):
+        """Walk a document once, yielding (element, xpath, tag) in document order
+        
+        XPaths are built from the parent's path and per-parent sibling
+        counters instead of calling getpath() for every element, and match
+        what lxml's getpath() returns: a positional ``[n]`` suffix only when
+        a parent has more than one child of that name. Comments are named
+        ``comment()`` as in XPath. Nodes the counters don't cover (namespaced
+        elements, processing instructions, entities) fall back to getpath().
+        """
+        tree = doc.getroottree()
+        stack = [(doc, tree.getpath(doc))]
+        
+        while stack:
+            element, xpath = stack.pop()
+            tag = element.tag
+            if not isinstance(tag, str):
+                # Name non-element nodes by their XPath node test
+                tag = 'comment()' if tag is etree.Comment else (
+                    'processing-instruction()' if tag is etree.ProcessingInstruction else 'node()'
+                )
+            yield element, xpath, tag
+            
+            children = list(element)
+            if not children:
+                continue
+            
+            names = [self._node_name(child) for child in children]
+            totals = {}
+            for name in names:
+                totals[name] = totals.get(name, 0) + 1
+            
+            seen = {}
+            child_paths = []
+            for child, name in zip(children, names):
+                if name is None:
+                    child_paths.append((child, tree.getpath(child)))
+                elif totals[name] > 1:
+                    seen[name] = seen.get(name, 0) + 1
+                    child_paths.append((child, f"{xpath}/{name}[{seen[name]}]"))
+                else:
+                    child_paths.append((child, f"{xpath}/{name}"))
+            
+            # Push in reverse so children come off the stack in document order
+            stack.extend(reversed(child_paths))
+    
+    @staticmethod
+    def _node_name(node) -> Optional[str]:
+        """XPath name step of a node, or None if it needs getpath()"""
+        tag = node.tag
+        if isinstance(tag, str):
+            return None if tag.startswith('{') else tag
+        if tag is etree.Comment:
+            return 'comment()'
+        return None
+    
     def _get_element_xpath(self, element) -> str:
         """Generate XPath for an element"""
         try:
@@ -315,6 +1453,23 @@ class HTMLPageDetector:
         
         return structure
     
+    def _extract_table_data(self, table) -> Dict:
+        """Extract the full contents of a table, column by column, with a hash per data row
+        
+        Only the table's own rows count, not those of nested tables. Rows in
+        ``thead`` or made of ``th`` cells only are header rows and name the
+        columns.
+        """
+        rows = []
+        try:
+            for row in table.xpath('./tr | ./thead/tr | ./tbody/tr | ./tfoot/tr'):
+                cells = row.xpath('./td | ./th')
+                header = row.getparent().tag == 'thead' or (bool(cells) and all(cell.tag == 'th' for cell in cells))
+                rows.append((header, [cell_text(cell.text_content()) for cell in cells]))
+        except Exception as e:
+            logger.error(f"Error extracting table data: {e}")
+        return build_table_data(rows)
+    
     def _extract_form_structure(self, form) -> Dict:
         """Extract form structure including input fields"""
         structure = {
@@ -339,68 +1494,465 @@ class HTMLPageDetector:
         
         return structure
     
-    def compare_structures(self, old_structure: Dict, new_structure: Dict) -> List[ChangeDetails]:
-        """Compare two HTML structures and detect changes"""
-        changes = []
-        current_time = datetime.now()
+    @staticmethod
+    def _dirty_paths(side: Dict[str, List], other: Dict[str, List]) -> List[str]:
+        """Paths of ``side`` whose subtree hash differs from ``other``, in document order
         
-        # Compare elements
-        changes.extend(self._compare_elements(
-            old_structure.get('elements', {}),
-            new_structure.get('elements', {}),
-            current_time
-        ))
+        Walks the document-ordered hashes top-down and jumps over every
+        subtree whose hash matches, so the work is proportional to the
+        changed part of the page.
+        """
+        paths = []
+        keys = list(side)
+        position = 0
+        while position < len(keys):
+            xpath = keys[position]
+            digest, size = side[xpath]
+            counterpart = other.get(xpath)
+            if counterpart is not None and counterpart[0] == digest:
+                position += size
+                continue
+            paths.append(xpath)
+            position += 1
+        return paths
+    
+    @staticmethod
+    def _restrict_structure(structure: Dict, paths: List[str]) -> Dict:
+        """Keep only the given paths of every structure section, in their original order"""
+        restricted = {}
+        for section in ('elements', 'attributes', 'tables', 'table_data', 'forms'):
+            entries = structure.get(section, {})
+            restricted[section] = {xpath: entries[xpath] for xpath in paths if xpath in entries}
+        return restricted
+    
+    @staticmethod
+    def _subtree_hash_map(structure: Union[Dict, CompactStructure]) -> Optional[Dict[str, List]]:
+        """The ``subtree_hashes`` section of a structure dict or CompactStructure"""
+        if not isinstance(structure, CompactStructure):
+            return structure.get('subtree_hashes')
+        if not structure.has_subtree_hashes:
+            return None
+        strings = structure.strings()
+        return {
+            strings[path_id]: [f"{digest:016x}", size]
+            for path_id, digest, size in zip(
+                structure.path_id.tolist(), structure.subtree_hash.tolist(), structure.subtree_size.tolist()
+            )
+        }
+    
+    def changed_regions(self, old_structure: Union[Dict, CompactStructure],
+                        new_structure: Union[Dict, CompactStructure]) -> List[str]:
+        """Get the smallest subtrees that differ between two structures
+        
+        These are the deepest changed elements present in both versions plus
+        the topmost inserted or removed subtrees. Needs subtree hashes on
+        both sides; returns an empty list otherwise. Two CompactStructures
+        are walked on their hash columns (see ``_compact_regions``).
+        """
+        if isinstance(old_structure, CompactStructure) and isinstance(new_structure, CompactStructure):
+            if not (old_structure.has_subtree_hashes and new_structure.has_subtree_hashes):
+                return []
+            return self._compact_regions(old_structure, new_structure)
+        
+        old_hashes = self._subtree_hash_map(old_structure)
+        new_hashes = self._subtree_hash_map(new_structure)
+        if not old_hashes or not new_hashes:
+            return []
+        
+        dirty = self._dirty_paths(old_hashes, new_hashes)
+        dirty += [xpath for xpath in self._dirty_paths(new_hashes, old_hashes) if xpath not in old_hashes]
+        dirty_parents = {xpath.rpartition('/')[0] for xpath in dirty}
+        
+        regions = []
+        for xpath in dirty:
+            if xpath in old_hashes and xpath in new_hashes:
+                if xpath not in dirty_parents:
+                    regions.append(xpath)
+            else:
+                # Inserted or removed: report the top of the subtree only
+                side = old_hashes if xpath in old_hashes else new_hashes
+                parent = xpath.rpartition('/')[0]
+                if parent not in side or (parent in old_hashes and parent in new_hashes):
+                    regions.append(xpath)
+        return regions
+    
+    @staticmethod
+    def _compact_regions(old: CompactStructure, new: CompactStructure) -> List[str]:
+        """``changed_regions`` of two CompactStructures from their Merkle hashes
+        
+        Walks both trees top-down, pairing the children of each mismatched
+        subtree by path hash and descending only into pairs whose subtree
+        hashes differ. Children are found by skipping over subtree sizes, so
+        matching subtrees are never visited and only the XPaths of the
+        regions are decoded.
+        """
+        old_paths, new_paths = old.path_hash, new.path_hash
+        old_hashes, new_hashes = old.subtree_hash, new.subtree_hash
+        old_sizes, new_sizes = old.subtree_size, new.subtree_size
+        
+        def children(sizes, start: int, end: int) -> Iterator[int]:
+            while start < end:
+                yield start
+                start += sizes[start]
+        
+        regions: List[str] = []
+        added: List[int] = []
+        # Mismatched (old, new) subtree pairs to walk, or removed subtrees (new index None);
+        # -1 stands for the document level
+        pending: List[Tuple[int, Optional[int]]] = [(-1, -1)]
+        while pending:
+            old_parent, new_parent = pending.pop()
+            if new_parent is None:
+                regions.append(old.xpath(old_parent))
+                continue
+            old_start = old_parent + 1
+            old_end = old_parent + old_sizes[old_parent] if old_parent >= 0 else len(old)
+            new_start = new_parent + 1
+            new_end = new_parent + new_sizes[new_parent] if new_parent >= 0 else len(new)
+            
+            new_children = {new_paths[index]: index for index in children(new_sizes, new_start, new_end)}
+            dirty = []
+            for old_index in children(old_sizes, old_start, old_end):
+                new_index = new_children.pop(old_paths[old_index], None)
+                if new_index is None or old_hashes[old_index] != new_hashes[new_index]:
+                    dirty.append((old_index, new_index))
+            added.extend(new_children.values())
+            
+            if not dirty and not new_children and old_parent >= 0:
+                # Only the element itself differs
+                regions.append(old.xpath(old_parent))
+            # Keep document order: the first child comes off the stack first
+            pending.extend(reversed(dirty))
+        return regions + [new.xpath(index) for index in sorted(added)]
+    
+    def compare_structures(self, old_structure: Union[Dict, CompactStructure],
+                           new_structure: Union[Dict, CompactStructure], table_keys=None) -> List[ChangeDetails]:
+        """Compare two HTML structures and detect changes
+        
+        Returns every change of ``iter_changes``.
+        """
+        return list(self.iter_changes(old_structure, new_structure, table_keys))
+    
+    def has_changes(self, old_structure: Union[Dict, CompactStructure],
+                    new_structure: Union[Dict, CompactStructure], table_keys=None) -> bool:
+        """Whether two HTML structures differ, stopping at the first change"""
+        return next(self.iter_changes(old_structure, new_structure, table_keys), None) is not None
+    
+    def iter_changes(self, old_structure: Union[Dict, CompactStructure],
+                     new_structure: Union[Dict, CompactStructure], table_keys=None) -> Iterator[ChangeDetails]:
+        """Compare two HTML structures and yield their changes one at a time
+        
+        Structures are dicts or CompactStructures. Two CompactStructures are
+        compared on their hash columns (see ``_compare_compact``). When both
+        dicts carry subtree hashes, unchanged subtrees are skipped and only
+        the differing paths are compared; the resulting changes are the same
+        as from a full comparison. ``table_keys`` is the key column for every
+        table, or a mapping of table XPath to key column, as returned by
+        ``get_table_keys``. Elements in the rows of tables whose contents
+        both structures carry are left to the table diff, so a changed cell
+        is reported once, as ``table_cell_changed``.
+        
+        Each change is built when it is asked for, so a caller that stops
+        early skips the string building of the remaining ones.
+        """
+        if isinstance(old_structure, CompactStructure) or isinstance(new_structure, CompactStructure):
+            if (self.diff_mode != 'tree' and isinstance(old_structure, CompactStructure)
+                    and isinstance(new_structure, CompactStructure)
+                    and '__attributes__' not in old_structure.extras and '__attributes__' not in new_structure.extras):
+                yield from self._compare_compact(old_structure, new_structure, table_keys)
+                return
+            if isinstance(old_structure, CompactStructure):
+                old_structure = old_structure.to_dict()
+            if isinstance(new_structure, CompactStructure):
+                new_structure = new_structure.to_dict()
+        
+        if self.diff_mode == 'tree':
+            yield from self._compare_matched_structures(old_structure, new_structure, table_keys)
+            return
+        
+        current_time = datetime.now()
+        
+        old_hashes = old_structure.get('subtree_hashes')
+        new_hashes = new_structure.get('subtree_hashes')
+        if old_hashes and new_hashes:
+            old_structure = self._restrict_structure(old_structure, self._dirty_paths(old_hashes, new_hashes))
+            new_structure = self._restrict_structure(new_structure, self._dirty_paths(new_hashes, old_hashes))
+        
+        # Compare elements; the table diff below reports what changed in the rows of tables
+        in_table_rows = self._table_rows(old_structure.get('table_data', {}).keys()
+                                         & new_structure.get('table_data', {}).keys())
+        yield from (
+            change for change in self._compare_elements(
+                old_structure.get('elements', {}),
+                new_structure.get('elements', {}),
+                current_time
+            )
+            if not in_table_rows(change.xpath)
+        )
         
         # Compare attributes
-        changes.extend(self._compare_attributes(
+        yield from self._compare_attributes(
             old_structure.get('attributes', {}),
             new_structure.get('attributes', {}),
             current_time
-        ))
+        )
         
         # Compare tables
-        changes.extend(self._compare_tables(
+        yield from self._compare_tables(
             old_structure.get('tables', {}),
             new_structure.get('tables', {}),
             current_time
-        ))
+        )
+        
+        # Compare table contents, where both versions have them
+        yield from self._compare_table_data(
+            old_structure.get('table_data', {}),
+            new_structure.get('table_data', {}),
+            table_keys,
+            current_time
+        )
         
         # Compare forms
-        changes.extend(self._compare_forms(
+        yield from self._compare_forms(
             old_structure.get('forms', {}),
             new_structure.get('forms', {}),
             current_time
-        ))
+        )
+    
+    def _compare_compact(self, old: CompactStructure, new: CompactStructure, table_keys=None) -> Iterator[ChangeDetails]:
+        """``compare_structures`` over the hash columns of two CompactStructures
         
-        return changes
+        Added, removed and modified elements come from sorted-array set
+        operations on the 64-bit path, text and attribute hashes
+        (``structure_diff.diff_compact``); strings are decoded and
+        ChangeDetails built only for the elements that differ. Gives the
+        changes of the dict comparison, in the same order, with attribute
+        changes in document order.
+        """
+        current_time = datetime.now()
+        diff = diff_compact(old, new)
+        # The table diff below reports what changed in the rows of tables
+        in_table_rows = self._table_rows(old.extras.get('table_data', {}).keys()
+                                         & new.extras.get('table_data', {}).keys())
+        
+        def record(structure: CompactStructure, index: int) -> Dict:
+            return {
+                'tag': structure.string(structure.tag_id[index]),
+                'text': structure.string(structure.text_id[index]),
+                'tail': structure.string(structure.tail_id[index])
+            }
+        
+        # Compare elements
+        for index in diff.removed.tolist():
+            xpath = old.xpath(index)
+            if in_table_rows(xpath):
+                continue
+            element = record(old, index)
+            yield ChangeDetails(
+                change_type="element_removed",
+                xpath=xpath,
+                old_value=str(element),
+                new_value=None,
+                element_type=element['tag'],
+                timestamp=current_time
+            )
+        
+        for index in diff.added.tolist():
+            xpath = new.xpath(index)
+            if in_table_rows(xpath):
+                continue
+            element = record(new, index)
+            yield ChangeDetails(
+                change_type="element_added",
+                xpath=xpath,
+                old_value=None,
+                new_value=str(element),
+                element_type=element['tag'],
+                timestamp=current_time
+            )
+        
+        text_changed = diff.text_changed
+        for old_index, new_index in zip(diff.old_common[text_changed].tolist(), diff.new_common[text_changed].tolist()):
+            xpath = old.xpath(old_index)
+            if in_table_rows(xpath):
+                continue
+            yield ChangeDetails(
+                change_type="element_text_changed",
+                xpath=xpath,
+                old_value=old.string(old.text_id[old_index]),
+                new_value=new.string(new.text_id[new_index]),
+                element_type=old.string(old.tag_id[old_index]),
+                timestamp=current_time
+            )
+        
+        # Compare attributes of elements that differ in them, were removed or were added
+        attribute_pairs = [
+            (old.xpath(old_index), old.attributes(old_index), new.attributes(new_index))
+            for old_index, new_index in zip(diff.old_common[diff.attributes_changed].tolist(),
+                                            diff.new_common[diff.attributes_changed].tolist())
+        ]
+        attribute_pairs += [(old.xpath(index), old.attributes(index), None) for index in diff.removed.tolist()
+                            if old.attr_offsets[index] != old.attr_offsets[index + 1]]
+        attribute_pairs += [(new.xpath(index), None, new.attributes(index)) for index in diff.added.tolist()
+                            if new.attr_offsets[index] != new.attr_offsets[index + 1]]
+        for xpath, old_attr, new_attr in attribute_pairs:
+            old_attr = old_attr or {}
+            new_attr = new_attr or {}
+            for attr_name in list(old_attr) + [name for name in new_attr if name not in old_attr]:
+                old_value = old_attr.get(attr_name)
+                new_value = new_attr.get(attr_name)
+                if old_value != new_value:
+                    change_type = "attribute_modified"
+                    if old_value is None:
+                        change_type = "attribute_added"
+                    elif new_value is None:
+                        change_type = "attribute_removed"
+                    yield ChangeDetails(
+                        change_type=change_type,
+                        xpath=f"{xpath}/@{attr_name}",
+                        old_value=old_value,
+                        new_value=new_value,
+                        element_type="attribute",
+                        timestamp=current_time
+                    )
+        
+        # Tables, their contents and forms are small and stay dicts
+        yield from self._compare_tables(old.extras.get('tables', {}), new.extras.get('tables', {}), current_time)
+        yield from self._compare_table_data(
+            old.extras.get('table_data', {}),
+            new.extras.get('table_data', {}),
+            table_keys,
+            current_time
+        )
+        yield from self._compare_forms(old.extras.get('forms', {}), new.extras.get('forms', {}), current_time)
     
-    def _compare_elements(self, old_elements: Dict, new_elements: Dict, timestamp: datetime) -> List[ChangeDetails]:
-        """Compare element structures"""
-        changes = []
+    def _compare_matched_structures(self, old_structure: Dict, new_structure: Dict, table_keys=None) -> Iterator[ChangeDetails]:
+        """``compare_structures`` in tree diff mode
+        
+        Elements are matched by ``tree_diff.match_trees`` instead of by
+        XPath, so an inserted or removed sibling is one change rather than a
+        shifted XPath for everything after it. Removed and added subtrees are
+        reported at their top only, moved subtrees as ``element_moved``.
+        Attributes, tables and forms of matched elements are compared across
+        the matching; those of unmatched ones are reported as removed or
+        added where the XPath comparison would report them.
+        """
+        current_time = datetime.now()
+        match = match_trees(old_structure, new_structure)
+        old_data, new_data, _, _ = match.split(old_structure.get('table_data', {}),
+                                               new_structure.get('table_data', {}))
+        # The table diff below reports what changed in the rows of matched tables
+        diffed_tables = old_data.keys() & new_data.keys()
+        in_old_rows = self._table_rows(
+            xpath for xpath in old_structure.get('table_data', {}) if match.mapping.get(xpath) in diffed_tables
+        )
+        in_new_rows = self._table_rows(diffed_tables)
+        for change in self._compare_matched_elements(
+            match,
+            old_structure.get('elements', {}),
+            new_structure.get('elements', {}),
+            current_time
+        ):
+            if change.change_type == 'element_removed' and in_old_rows(change.xpath):
+                continue
+            if change.change_type in ('element_added', 'element_text_changed') and in_new_rows(change.xpath):
+                continue
+            yield change
+        
+        old_attrs, new_attrs, _, _ = match.split(old_structure.get('attributes', {}),
+                                                 new_structure.get('attributes', {}))
+        yield from self._compare_attributes(old_attrs, new_attrs, current_time)
+        
+        old_tables, new_tables, old_only, new_only = match.split(old_structure.get('tables', {}),
+                                                                 new_structure.get('tables', {}))
+        yield from self._compare_tables(old_only, {}, current_time)
+        yield from self._compare_tables({}, new_only, current_time)
+        yield from self._compare_tables(old_tables, new_tables, current_time)
+        
+        yield from self._compare_table_data(old_data, new_data, table_keys, current_time)
+        
+        old_forms, new_forms, old_only, new_only = match.split(old_structure.get('forms', {}),
+                                                               new_structure.get('forms', {}))
+        yield from self._compare_forms(old_only, {}, current_time)
+        yield from self._compare_forms({}, new_only, current_time)
+        yield from self._compare_forms(old_forms, new_forms, current_time)
+    
+    def _compare_matched_elements(self, match: TreeMatch, old_elements: Dict, new_elements: Dict,
+                                  timestamp: datetime) -> Iterator[ChangeDetails]:
+        """Element changes of a tree matching, in the order ``_compare_elements`` reports them"""
+        for xpath in match.removed:
+            yield ChangeDetails(
+                change_type="element_removed",
+                xpath=xpath,
+                old_value=str(old_elements[xpath]),
+                new_value=None,
+                element_type=old_elements[xpath].get('tag', 'unknown'),
+                timestamp=timestamp
+            )
+        
+        for xpath in match.added:
+            yield ChangeDetails(
+                change_type="element_added",
+                xpath=xpath,
+                old_value=None,
+                new_value=str(new_elements[xpath]),
+                element_type=new_elements[xpath].get('tag', 'unknown'),
+                timestamp=timestamp
+            )
+        
+        for old_xpath, new_xpath in match.moved:
+            yield ChangeDetails(
+                change_type="element_moved",
+                xpath=new_xpath,
+                old_value=old_xpath,
+                new_value=new_xpath,
+                element_type=new_elements[new_xpath].get('tag', 'unknown'),
+                timestamp=timestamp
+            )
         
+        for old_xpath, new_xpath in match.text_changed:
+            yield ChangeDetails(
+                change_type="element_text_changed",
+                xpath=new_xpath,
+                old_value=old_elements[old_xpath].get('text'),
+                new_value=new_elements[new_xpath].get('text'),
+                element_type=new_elements[new_xpath].get('tag', 'unknown'),
+                timestamp=timestamp
+            )
+    
+    def _table_rows(self, tables: Iterable[str]) -> Callable[[str], bool]:
+        """Predicate for XPaths in the rows of the given tables, whose contents the table diff covers"""
+        tables = list(tables)
+        if not tables:
+            return lambda xpath: False
+        pattern = re.compile(f"(?:{'|'.join(map(re.escape, tables))}){TABLE_ROW_STEP}")
+        return lambda xpath: pattern.match(xpath) is not None
+    
+    def _compare_elements(self, old_elements: Dict, new_elements: Dict, timestamp: datetime) -> Iterator[ChangeDetails]:
+        """Compare element structures"""
         # Find removed elements
         for xpath in old_elements:
             if xpath not in new_elements:
-                changes.append(ChangeDetails(
+                yield ChangeDetails(
                     change_type="element_removed",
                     xpath=xpath,
                     old_value=str(old_elements[xpath]),
                     new_value=None,
                     element_type=old_elements[xpath].get('tag', 'unknown'),
                     timestamp=timestamp
-                ))
+                )
         
         # Find added elements
         for xpath in new_elements:
             if xpath not in old_elements:
-                changes.append(ChangeDetails(
+                yield ChangeDetails(
                     change_type="element_added",
                     xpath=xpath,
                     old_value=None,
                     new_value=str(new_elements[xpath]),
                     element_type=new_elements[xpath].get('tag', 'unknown'),
                     timestamp=timestamp
-                ))
+                )
         
         # Find modified elements
         for xpath in old_elements:
@@ -409,21 +1961,17 @@ class HTMLPageDetector:
                 new_elem = new_elements[xpath]
                 
                 if old_elem.get('text') != new_elem.get('text'):
-                    changes.append(ChangeDetails(
+                    yield ChangeDetails(
                         change_type="element_text_changed",
                         xpath=xpath,
                         old_value=old_elem.get('text'),
                         new_value=new_elem.get('text'),
                         element_type=old_elem.get('tag', 'unknown'),
                         timestamp=timestamp
-                    ))
-        
-        return changes
+                    )
     
-    def _compare_attributes(self, old_attrs: Dict, new_attrs: Dict, timestamp: datetime) -> List[ChangeDetails]:
+    def _compare_attributes(self, old_attrs: Dict, new_attrs: Dict, timestamp: datetime) -> Iterator[ChangeDetails]:
         """Compare element attributes"""
-        changes = []
-        
         all_xpaths = set(old_attrs.keys()) | set(new_attrs.keys())
         
         for xpath in all_xpaths:
@@ -444,44 +1992,40 @@ class HTMLPageDetector:
                     elif new_value is None:
                         change_type = "attribute_removed"
                     
-                    changes.append(ChangeDetails(
+                    yield ChangeDetails(
                         change_type=change_type,
                         xpath=f"{xpath}/@{attr_name}",
                         old_value=old_value,
                         new_value=new_value,
                         element_type="attribute",
                         timestamp=timestamp
-                    ))
-        
-        return changes
+                    )
     
-    def _compare_tables(self, old_tables: Dict, new_tables: Dict, timestamp: datetime) -> List[ChangeDetails]:
+    def _compare_tables(self, old_tables: Dict, new_tables: Dict, timestamp: datetime) -> Iterator[ChangeDetails]:
         """Compare table structures"""
-        changes = []
-        
         # Find removed tables
         for xpath in old_tables:
             if xpath not in new_tables:
-                changes.append(ChangeDetails(
+                yield ChangeDetails(
                     change_type="table_removed",
                     xpath=xpath,
                     old_value=str(old_tables[xpath]),
                     new_value=None,
                     element_type="table",
                     timestamp=timestamp
-                ))
+                )
         
         # Find added tables
         for xpath in new_tables:
             if xpath not in old_tables:
-                changes.append(ChangeDetails(
+                yield ChangeDetails(
                     change_type="table_added",
                     xpath=xpath,
                     old_value=None,
                     new_value=str(new_tables[xpath]),
                     element_type="table",
                     timestamp=timestamp
-                ))
+                )
         
         # Find modified tables
         for xpath in old_tables:
@@ -491,32 +2035,104 @@ class HTMLPageDetector:
                 
                 # Compare headers
                 if old_table.get('headers') != new_table.get('headers'):
-                    changes.append(ChangeDetails(
+                    yield ChangeDetails(
                         change_type="table_headers_changed",
                         xpath=xpath,
                         old_value=str(old_table.get('headers')),
                         new_value=str(new_table.get('headers')),
                         element_type="table",
                         timestamp=timestamp
-                    ))
+                    )
                 
                 # Compare column count
                 if old_table.get('column_count') != new_table.get('column_count'):
-                    changes.append(ChangeDetails(
+                    yield ChangeDetails(
                         change_type="table_columns_changed",
                         xpath=xpath,
                         old_value=str(old_table.get('column_count')),
                         new_value=str(new_table.get('column_count')),
                         element_type="table",
                         timestamp=timestamp
-                    ))
+                    )
+                
+                # Compare row count
+                if old_table.get('row_count') != new_table.get('row_count'):
+                    yield ChangeDetails(
+                        change_type="table_rows_changed",
+                        xpath=xpath,
+                        old_value=str(old_table.get('row_count')),
+                        new_value=str(new_table.get('row_count')),
+                        element_type="table",
+                        timestamp=timestamp
+                    )
+    
+    def _compare_table_data(self, old_data: Dict, new_data: Dict, table_keys, timestamp: datetime) -> Iterator[ChangeDetails]:
+        """Compare the contents of tables present in both structures row by row and cell by cell
         
-        return changes
+        Rows are matched by a key column (see ``get_table_keys``) and are
+        reported as ``table[...]/row['key'='value']``, or by content and
+        position as ``table[...]/row[n]`` when no column identifies them.
+        Column names and key values are quoted as XPath string literals.
+        """
+        for xpath in new_data:
+            if xpath not in old_data:
+                continue
+            old_table = old_data[xpath]
+            new_table = new_data[xpath]
+            key = table_keys.get(xpath) if isinstance(table_keys, dict) else table_keys
+            diff = diff_tables(old_table, new_table, key)
+            if not diff:
+                continue
+            
+            def row_path(table: Dict, row: int, key_column: Optional[int]) -> str:
+                if key_column is None:
+                    return f"{xpath}/row[{row + 1}]"
+                key_name = table['columns'][key_column]
+                return f"{xpath}/row[{xpath_literal(key_name)}={xpath_literal(table['cells'][key_column][row])}]"
+            
+            for row in diff.deleted:
+                yield ChangeDetails(
+                    change_type="table_row_deleted",
+                    xpath=row_path(old_table, row, diff.old_key_column),
+                    old_value=' | '.join(row_values(old_table, row)),
+                    new_value=None,
+                    element_type="table_row",
+                    timestamp=timestamp
+                )
+            
+            for row in diff.inserted:
+                yield ChangeDetails(
+                    change_type="table_row_inserted",
+                    xpath=row_path(new_table, row, diff.key_column),
+                    old_value=None,
+                    new_value=' | '.join(row_values(new_table, row)),
+                    element_type="table_row",
+                    timestamp=timestamp
+                )
+            
+            for old_row, new_row, columns in diff.modified:
+                if not columns:
+                    # Only cells of columns one of the tables lacks differ
+                    yield ChangeDetails(
+                        change_type="table_row_modified",
+                        xpath=row_path(new_table, new_row, diff.key_column),
+                        old_value=' | '.join(row_values(old_table, old_row)),
+                        new_value=' | '.join(row_values(new_table, new_row)),
+                        element_type="table_row",
+                        timestamp=timestamp
+                    )
+                for old_column, new_column in columns:
+                    yield ChangeDetails(
+                        change_type="table_cell_changed",
+                        xpath=f"{row_path(new_table, new_row, diff.key_column)}/cell[{xpath_literal(new_table['columns'][new_column])}]",
+                        old_value=old_table['cells'][old_column][old_row],
+                        new_value=new_table['cells'][new_column][new_row],
+                        element_type="table_cell",
+                        timestamp=timestamp
+                    )
     
-    def _compare_forms(self, old_forms: Dict, new_forms: Dict, timestamp: datetime) -> List[ChangeDetails]:
+    def _compare_forms(self, old_forms: Dict, new_forms: Dict, timestamp: datetime) -> Iterator[ChangeDetails]:
         """Compare form structures"""
-        changes = []
-        
         all_xpaths = set(old_forms.keys()) | set(new_forms.keys())
         
         for xpath in all_xpaths:
@@ -524,45 +2140,587 @@ class HTMLPageDetector:
             new_form = new_forms.get(xpath)
             
             if old_form is None:
-                changes.append(ChangeDetails(
+                yield ChangeDetails(
                     change_type="form_added",
                     xpath=xpath,
                     old_value=None,
                     new_value=str(new_form),
                     element_type="form",
                     timestamp=timestamp
-                ))
+                )
             elif new_form is None:
-                changes.append(ChangeDetails(
+                yield ChangeDetails(
                     change_type="form_removed",
                     xpath=xpath,
                     old_value=str(old_form),
                     new_value=None,
                     element_type="form",
                     timestamp=timestamp
-                ))
+                )
             else:
                 # Compare form inputs
                 old_inputs = old_form.get('inputs', [])
                 new_inputs = new_form.get('inputs', [])
                 
                 if len(old_inputs) != len(new_inputs) or old_inputs != new_inputs:
-                    changes.append(ChangeDetails(
+                    yield ChangeDetails(
                         change_type="form_inputs_changed",
                         xpath=xpath,
                         old_value=str(old_inputs),
                         new_value=str(new_inputs),
                         element_type="form",
                         timestamp=timestamp
-                    ))
+                    )
+    
+    def coalesce_changes(self, changes: List[ChangeDetails]) -> List[ChangeDetails]:
+        """Bound the changes of one scan to ``max_changes_per_scan`` rows
+        
+        Changes are grouped by change type and by their ancestor at the
+        deepest XPath depth that leaves no more groups than the cap, found by
+        binary search. A group of one keeps its change; larger groups become
+        one change at the members' common ancestor with their ``count`` and
+        the first ``change_sample_size`` of them as ``sample``. Groups keep
+        the order of their first change. Grouping by change type alone may
+        still leave more groups than a cap below the number of change types.
+        """
+        cap = self.max_changes_per_scan
+        if cap is None or len(changes) <= cap:
+            return changes
+        
+        steps = [XPATH_STEP.findall(change.xpath) for change in changes]
+        
+        def group(depth: int) -> Dict[Tuple, List[int]]:
+            groups: Dict[Tuple, List[int]] = {}
+            for index, change in enumerate(changes):
+                groups.setdefault((change.change_type, *steps[index][:depth]), []).append(index)
+            return groups
+        
+        # The number of groups only grows with depth
+        low, high = 0, max(len(path) for path in steps)
+        while low < high:
+            depth = (low + high + 1) // 2
+            if len(group(depth)) <= cap:
+                low = depth
+            else:
+                high = depth - 1
+        
+        def clip(value: Optional[str]) -> Optional[str]:
+            if value is None or len(value) <= SAMPLE_VALUE_LENGTH:
+                return value
+            return value[:SAMPLE_VALUE_LENGTH] + '...'
+        
+        coalesced = []
+        for (change_type, *_), members in group(low).items():
+            if len(members) == 1:
+                coalesced.append(changes[members[0]])
+                continue
+            common = steps[members[0]]
+            for index in members[1:]:
+                path = steps[index]
+                shared = 0
+                while shared < min(len(common), len(path)) and common[shared] == path[shared]:
+                    shared += 1
+                common = common[:shared]
+            element_types = {changes[index].element_type for index in members}
+            coalesced.append(ChangeDetails(
+                change_type=change_type,
+                xpath=''.join(common) or '/',
+                old_value=None,
+                new_value=None,
+                element_type=element_types.pop() if len(element_types) == 1 else 'mixed',
+                timestamp=changes[members[0]].timestamp,
+                count=sum(changes[index].count for index in members),
+                sample=[{'xpath': changes[index].xpath, 'old_value': clip(changes[index].old_value),
+                         'new_value': clip(changes[index].new_value)}
+                        for index in members[:self.change_sample_size]]
+            ))
+        
+        logger.info(f"Coalesced {len(changes)} changes into {len(coalesced)}")
+        return coalesced
+    
+    def analyze(self, url: str, content: Optional[str], tree=None, content_hash: Optional[str] = None,
+                last_scan: Optional[Tuple[str, Union[str, bytes], Optional[int]]] = None,
+                extracted: Optional[IterparseExtractor] = None) -> PageAnalysis:
+        """Fingerprint a fetched page, extract its structure and compare it to the last scan
+        
+        Takes the page as ``content`` or, from streaming fetches, as a parsed
+        ``tree`` or finished iterparse extractor. ``content_hash`` is the
+        fetch's hash of the raw body; without one, ``content`` is hashed.
+        This is the CPU-bound part of a scan and runs in worker processes for
+        large pages when the process pool is enabled, so it touches neither
+        the database nor the network.
+        """
+        stage_start = time.monotonic()
+        analysis = PageAnalysis()
+        selectors = self.get_url_selectors(url)
+        normalizer = self.get_normalizer(url)
+        if extracted is not None or (tree is None and self.use_iterparse(url)):
+            return self._analyze_extracted(url, content, extracted, content_hash, normalizer, last_scan)
+        
+        # Fetches hash the raw body, streamed or not
+        current_hash = content_hash
+        if tree is not None:
+            # Streaming fetches parse the body as it arrives
+            doc = tree
+        else:
+            # Generate hash and structure
+            if current_hash is None:
+                current_hash = hashlib.md5(content.encode()).hexdigest()
+            doc = None
+            if selectors or normalizer:
+                try:
+                    # Always the whole document, as the streaming parser gives it; fromstring()
+                    # would return a fragment's element and shift every XPath
+                    doc = html.document_fromstring(content)
+                except Exception as e:
+                    logger.error(f"Failed to parse {url}: {e}")
+        
+        if normalizer and doc is not None:
+            # Fingerprint the page without scripts, tokens, timestamps and other noise
+            normalizer.normalize(doc)
+            current_hash = normalizer.fingerprint(doc)
+        
+        scopes = None
+        if selectors and doc is not None:
+            # Only the selected regions are fingerprinted, extracted and compared
+            scopes = self.select_scopes(doc, selectors)
+            if not scopes:
+                logger.warning(f"No element of {url} matches its selectors {selectors}")
+            current_hash = self._scope_hash(scopes)
+        analysis.content_hash = current_hash
+        stage_start = analysis.mark('normalize', stage_start)
+        
+        if last_scan and current_hash == last_scan[0]:
+            # Same fingerprint, same structure: keep the stored one instead of extracting again
+            logger.info(f"No changes detected in {url}")
+            analysis.structure = last_scan[1]
+            analysis.simhash = last_scan[2]
+            analysis.mark('extract', stage_start)
+            return analysis
+        
+        if self.simhash and doc is None and content:
+            try:
+                doc = html.document_fromstring(content)
+            except Exception as e:
+                logger.error(f"Failed to parse {url}: {e}")
+        if self.simhash and doc is not None:
+            analysis.simhash = simhash_tree(scopes if scopes is not None else [doc])
+            if self._is_trivial(url, analysis, last_scan):
+                analysis.mark('compare', stage_start)
+                return analysis
+        
+        if doc is not None:
+            current_structure = self.extract_tree_structure(doc, scopes)
+        else:
+            current_structure = self.extract_xpath_structure(content)
+        stage_start = analysis.mark('extract', stage_start)
+        
+        current_compact = None
+        if self.structure_format == 'compact':
+            # Built once, to compare on its hash columns and to store
+            try:
+                current_compact = CompactStructure.from_dict(current_structure)
+            except ValueError:
+                pass
+        
+        if last_scan:
+            # Content changed since the last scan
+            try:
+                if current_compact is not None:
+                    last_structure = load_compact(last_scan[1])
+                    current = current_compact
+                else:
+                    last_structure = load_structure(last_scan[1])
+                    current = current_structure
+                self._compare_to_last(url, analysis, last_structure, current)
+            except ValueError as e:
+                logger.error(f"Failed to parse stored structure: {e}")
+        else:
+            logger.info(f"First scan for {url} - creating baseline")
+        stage_start = analysis.mark('compare', stage_start)
+        
+        if current_compact is not None:
+            analysis.structure = current_compact.serialize()
+        else:
+            analysis.structure = dump_structure(current_structure, False)
+        analysis.mark('persist', stage_start)
+        return analysis
+    
+    def _analyze_extracted(self, url: str, content: Optional[str], extracted: Optional[IterparseExtractor],
+                           content_hash: Optional[str], normalizer: Optional[PageNormalizer],
+                           last_scan: Optional[Tuple[str, Union[str, bytes], Optional[int]]]) -> PageAnalysis:
+        """``analyze`` in iterparse mode, extracting from ``content`` unless a streaming fetch already did"""
+        stage_start = time.monotonic()
+        analysis = PageAnalysis()
+        if extracted is None:
+            extracted = extract_iterparse(self._content_chunks(content), normalizer, self.subtree_hashes, 'utf-8',
+                                          self.table_diff, self.simhash)
+            if normalizer is None and content_hash is None:
+                content_hash = hashlib.md5(content.encode()).hexdigest()
+        stage_start = analysis.mark('extract', stage_start)
+        
+        # A normalized page is fingerprinted by the Merkle hash of its whole tree
+        analysis.content_hash = extracted.fingerprint if normalizer else content_hash
+        structure = extracted.structure
+        logger.debug(f"Extracted structure from HTML content with {len(structure)} elements, "
+                     f"{len(structure.extras['tables'])} tables, and {len(structure.extras['forms'])} forms.")
+        
+        if last_scan and analysis.content_hash == last_scan[0]:
+            logger.info(f"No changes detected in {url}")
+            analysis.structure = last_scan[1]
+            analysis.simhash = last_scan[2]
+            return analysis
+        
+        analysis.simhash = extracted.simhash
+        if self._is_trivial(url, analysis, last_scan):
+            analysis.mark('compare', stage_start)
+            return analysis
+        
+        if last_scan:
+            try:
+                last_structure = load_compact(last_scan[1])
+                self._compare_to_last(url, analysis, last_structure, structure)
+            except ValueError as e:
+                logger.error(f"Failed to parse stored structure: {e}")
+        else:
+            logger.info(f"First scan for {url} - creating baseline")
+        stage_start = analysis.mark('compare', stage_start)
+        
+        if self.structure_format == 'compact':
+            analysis.structure = structure.serialize()
+        else:
+            analysis.structure = dump_structure(structure.to_dict(), False)
+        analysis.mark('persist', stage_start)
+        return analysis
+    
+    def _compare_to_last(self, url: str, analysis: PageAnalysis, last_structure: Union[Dict, CompactStructure],
+                         structure: Union[Dict, CompactStructure]):
+        """Compare a page's structure to its last scan's, in as much detail as anything will use"""
+        changes = self.iter_changes(last_structure, structure, self.get_table_keys(url))
+        if self.needs_change_details:
+            analysis.changes = self.coalesce_changes(list(changes))
+            analysis.changed = bool(analysis.changes)
+            if analysis.changed:
+                analysis.regions = self.changed_regions(last_structure, structure)
+        else:
+            # Nothing stores or sends the details: the first change answers the question
+            analysis.changed = next(changes, None) is not None
+        if not analysis.changed:
+            logger.info(f"Content changed in {url} but no structural changes detected")
+    
+    @property
+    def needs_change_details(self) -> bool:
+        """Whether scans store or send their changes, rather than only whether there were any"""
+        return bool(self.record_changes or self.send_alerts)
+    
+    def _is_trivial(self, url: str, analysis: PageAnalysis,
+                    last_scan: Optional[Tuple[str, Union[str, bytes], Optional[int]]]) -> bool:
+        """Score a changed page against its last full scan and decide whether the diff can be skipped
+        
+        A trivial page keeps the last scan's structure and SimHash as its
+        baseline, so small changes can't add up unnoticed over several scans.
+        """
+        if not last_scan or last_scan[2] is None or analysis.simhash is None:
+            return False
+        analysis.similarity = similarity(analysis.simhash, last_scan[2])
+        threshold = self.get_similarity_threshold(url)
+        if threshold is None or analysis.similarity < threshold:
+            return False
+        logger.info(f"Only trivial changes in {url} (similarity {analysis.similarity:.3f})")
+        analysis.trivial = True
+        analysis.structure = last_scan[1]
+        analysis.simhash = last_scan[2]
+        return True
+    
+    def use_iterparse(self, url: str) -> bool:
+        """Whether a URL is extracted from parser events instead of a full tree
+        
+        Region selectors need the whole tree, so URLs with selectors always
+        use tree extraction.
+        """
+        return self.extraction_mode == 'iterparse' and not self.get_url_selectors(url)
+    
+    def _content_chunks(self, content: str, chunk_size: int = 1024 * 1024):
+        """Encode page text piecewise for the incremental parser"""
+        for start in range(0, len(content), chunk_size):
+            yield content[start:start + chunk_size].encode()
+
+class HTMLPageDetector(PageAnalyzer):
+    """Main class for detecting HTML page changes"""
+    
+    def __init__(self, config: Dict, work_queue: Optional[WorkQueue] = None):
+        super().__init__(config)
+        self.db_manager = DatabaseManager(config.get('db_path', 'html_detector.db'),
+                                          config.get('db_journal_mode', 'wal'),
+                                          keyframe_interval=int(config.get('structure_keyframe_interval', 20)))
+        # Shared queue for running several worker processes against one store
+        self.work_queue = work_queue or SQLiteWorkQueue(self.db_manager.db_path)
+        
+        # Initialize email notifier if configured
+        self.email_notifier = None
+        if config.get('email_enabled', False):
+            self.email_notifier = EmailNotifier(
+                config['smtp_server'],
+                config['smtp_port'],
+                config['email'],
+                config['email_password']
+            )
+        
+        self.max_concurrency = max(1, int(config.get('max_concurrency', 10)))
+        self.stream_fetch = config.get('stream_fetch', False)
+        self.stream_chunk_size = int(config.get('stream_chunk_size', 64 * 1024))
+        self.max_body_bytes = config.get('max_body_bytes')
+        self.request_timeout = self._setting('request_timeout', 'monitoring.request_timeout', 30)
+        self.max_retries = max(0, int(self._setting('max_retries', 'monitoring.max_retries', 3)))
+        self.retry_delay = float(self._setting('retry_delay', 'monitoring.retry_delay', 1.0))
+        self.retry_max_delay = float(config.get('retry_max_delay', 30))
+        self.circuit_breaker = CircuitBreaker(
+            self.db_manager,
+            config.get('breaker_threshold', 5),
+            config.get('breaker_cooldown', 300)
+        )
+        self.per_host_concurrency = max(1, int(config.get('per_host_concurrency', 1)))
+        self.rate_limiter = HostRateLimiter(
+            config.get('host_delay', 5.0),
+            config.get('host_burst', 1),
+            config.get('crawl_delays')
+        )
+        # Raw page versions, stored once each, for HTML diffs against the previous scan
+        self.generate_diff = self._setting('generate_diff', 'detection.generate_diff', False)
+        self.snapshot_store = None
+        if config.get('snapshots', self.generate_diff):
+            snapshot_dir = config.get('snapshot_dir') or os.path.splitext(self.db_manager.db_path)[0] + '_snapshots'
+            self.snapshot_store = SnapshotStore(snapshot_dir, int(config.get('snapshot_compression', 6)))
+        # Versions of each URL kept in the snapshot store
+        self.snapshot_retention = max(1, int(config.get('snapshot_retention', 10)))
+        # Unreferenced versions stored or reused this recently may be about to be referred to again
+        self.snapshot_grace = float(config.get('snapshot_grace', 3600))
+        self.max_diff_lines = int(config.get('max_diff_lines', 2000))
+        # Parse, extract and compare large pages in worker processes when > 0
+        self.process_pool_workers = int(config.get('process_pool_workers', 0))
+        self.process_pool_max_tasks = config.get('process_pool_max_tasks', 200)
+        self.process_pool_min_bytes = int(config.get('process_pool_min_bytes', 200 * 1024))
+        # Longest wait for a page analyzed in the pool, including its wait for a free worker
+        self.analysis_timeout = float(config.get('analysis_timeout') or 4 * float(self.request_timeout))
+        self._process_pool = None
+        self._process_pool_lock = threading.Lock()
+        self.adaptive_intervals = config.get('adaptive_intervals', True)
+        self.scheduler = AdaptiveScheduler(
+            self.db_manager,
+            config.get('scan_interval', 3600),
+            config.get('min_scan_interval', 300),
+            config.get('max_scan_interval', 86400),
+            config.get('url_intervals')
+        )
+        
+        self.session = requests.Session()
+        # Set user agent to avoid blocking
+        self.session.headers.update({
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+        })
+        # Size the connection pool so concurrent scans don't queue on it
+        adapter = HTTPAdapter(pool_connections=self.max_concurrency, pool_maxsize=self.max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+    
+    def _retry_backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        """Jittered exponential backoff before retry number ``attempt``"""
+        delay = random.uniform(0, min(self.retry_max_delay, self.retry_delay * 2 ** (attempt - 1)))
+        if retry_after and retry_after.isdigit():
+            delay = max(delay, min(float(retry_after), self.retry_max_delay))
+        return delay
+    
+    def fetch_page(self, url: str) -> Optional[str]:
+        """Fetch HTML content from URL"""
+        return self.fetch(url, stream=False).content
+    
+    def fetch(self, url: str, validators: Optional[Dict] = None, stream: Optional[bool] = None) -> FetchResult:
+        """Fetch a URL, revalidating against stored cache validators if given
+        
+        When ``validators`` carries an ETag or Last-Modified value the request
+        is sent as a conditional GET, and a 304 answer comes back with
+        ``not_modified`` set and no content.
+        
+        In streaming mode (``stream_fetch`` in the config unless overridden)
+        the body is never buffered: chunks are hashed and fed to lxml's
+        incremental parser as they arrive, and the result carries the parsed
+        ``tree`` instead of ``content``. Both modes hash the raw body bytes,
+        so switching between them doesn't change ``content_hash`` of an
+        unchanged page. Bodies larger than ``max_body_bytes`` are rejected
+        in either mode.
+        
+        Connect failures, timeouts, 429 and 5xx answers are retried up to
+        ``max_retries`` times with jittered exponential backoff, each retry
+        taking its turn from the host's rate limiter like any other request
+        (the first request's turn is taken by ``scan_urls_async``). A fetch
+        that still can't connect or times out counts once towards the host's
+        circuit breaker, and hosts with an open breaker are skipped without a
+        request.
+        """
+        stream = self.stream_fetch if stream is None else stream
+        result = FetchResult(url=url)
+        headers = {}
+        if validators:
+            if validators.get('etag'):
+                headers['If-None-Match'] = validators['etag']
+            if validators.get('last_modified'):
+                headers['If-Modified-Since'] = validators['last_modified']
+        
+        # Breaker state is kept per host and port, rate limits per host
+        host = urlsplit(url).netloc.lower()
+        if not self.circuit_breaker.allow(host):
+            result.error = f"circuit breaker open for {host}"
+            logger.error(f"Failed to fetch {url}: {result.error}")
+            return result
+        
+        retry_after = None
+        unreachable = False
+        try:
+            for attempt in range(self.max_retries + 1):
+                if attempt:
+                    if self.circuit_breaker.is_open(host):
+                        # Other fetches found the host down meanwhile
+                        break
+                    time.sleep(max(self._retry_backoff(attempt, retry_after),
+                                   self.rate_limiter.reserve(urlsplit(url).hostname or '')))
+                
+                unreachable = False
+                try:
+                    self._fetch_once(url, headers, validators, stream, result)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    result.error = str(e)
+                    retry_after = None
+                    unreachable = True
+                    continue
+                except requests.HTTPError as e:
+                    result.error = str(e)
+                    if e.response is not None and e.response.status_code in RETRY_STATUS_CODES:
+                        retry_after = e.response.headers.get('Retry-After')
+                        continue
+                    break
+                except requests.RequestException as e:
+                    result.error = str(e)
+                    break
+                break
+        finally:
+            if unreachable:
+                self.circuit_breaker.record_failure(host)
+            elif result.status_code is not None:
+                self.circuit_breaker.record_success(host)
+            else:
+                self.circuit_breaker.release(host)
+        
+        if result.error:
+            logger.error(f"Failed to fetch {url}: {result.error}")
+        return result
+    
+    def _fetch_once(self, url: str, headers: Dict, validators: Optional[Dict], stream: bool, result: FetchResult):
+        """Make a single request and fill ``result`` from the response"""
+        result.error = None
+        with self.session.get(url, headers=headers, timeout=self.request_timeout, stream=stream) as response:
+            result.status_code = response.status_code
+            
+            if response.status_code == 304 and headers:
+                # Keep the validators we revalidated with unless the server refreshed them
+                result.not_modified = True
+                result.etag = response.headers.get('ETag') or validators.get('etag')
+                result.last_modified = response.headers.get('Last-Modified') or validators.get('last_modified')
+                result.content_length = validators.get('content_length')
+                return
+            
+            response.raise_for_status()
+            result.etag = response.headers.get('ETag')
+            result.last_modified = response.headers.get('Last-Modified')
+            content_length = response.headers.get('Content-Length')
+            result.content_length = int(content_length) if content_length and content_length.isdigit() else None
+            
+            if self.max_body_bytes and (result.content_length or 0) > self.max_body_bytes:
+                result.error = f"body of {result.content_length} bytes exceeds max_body_bytes"
+            elif stream:
+                self._read_streaming(response, result)
+            elif self.max_body_bytes and len(response.content) > self.max_body_bytes:
+                result.error = f"body of {len(response.content)} bytes exceeds max_body_bytes"
+            else:
+                result.content = response.text
+                result.content_hash = hashlib.md5(response.content).hexdigest()
+                result.snapshot_key = self._store_snapshot(response.content)
+    
+    def _store_snapshot(self, body: bytes) -> Optional[str]:
+        """Put a raw page body into the snapshot store, if there is one"""
+        if self.snapshot_store is None:
+            return None
+        try:
+            return self.snapshot_store.put(body)
+        except OSError as e:
+            logger.error(f"Failed to store page snapshot: {e}")
+            return None
+    
+    def _read_streaming(self, response: requests.Response, result: FetchResult):
+        """Hash and incrementally parse a streamed response body"""
+        # Only trust an explicit charset; otherwise let lxml sniff <meta charset>
+        content_type = response.headers.get('Content-Type', '')
+        encoding = response.encoding if 'charset=' in content_type.lower() else None
+        if self.use_iterparse(result.url):
+            # Extract as the body arrives without ever holding the whole DOM
+            parser = IterparseExtractor(self.get_normalizer(result.url), self.subtree_hashes, encoding,
+                                        self.table_diff, self.simhash)
+        else:
+            parser = html.HTMLParser(encoding=encoding)
+        digest = hashlib.md5()
+        received = 0
+        snapshot = None
+        if self.snapshot_store is not None:
+            try:
+                snapshot = self.snapshot_store.writer()
+            except OSError as e:
+                logger.error(f"Failed to store page snapshot: {e}")
+        
+        try:
+            for chunk in response.iter_content(chunk_size=self.stream_chunk_size):
+                received += len(chunk)
+                if self.max_body_bytes and received > self.max_body_bytes:
+                    result.error = f"body exceeds max_body_bytes ({self.max_body_bytes})"
+                    parser.close()
+                    return
+                digest.update(chunk)
+                parser.feed(chunk)
+                if snapshot is not None:
+                    try:
+                        snapshot.write(chunk)
+                    except OSError as e:
+                        logger.error(f"Failed to store page snapshot: {e}")
+                        snapshot.abort()
+                        snapshot = None
+            
+            if received == 0:
+                result.error = "empty response body"
+                return
+            
+            if snapshot is not None:
+                try:
+                    result.snapshot_key = snapshot.commit()
+                except OSError as e:
+                    logger.error(f"Failed to store page snapshot: {e}")
+                    snapshot.abort()
+                snapshot = None
+        finally:
+            if snapshot is not None:
+                snapshot.abort()
         
-        return changes
+        if isinstance(parser, IterparseExtractor):
+            parser.close()
+            result.extracted = parser
+        else:
+            result.tree = parser.close()
+        result.content_hash = digest.hexdigest()
+        if result.content_length is None:
+            result.content_length = received
     
     def generate_html_diff(self, old_html: str, new_html: str) -> str:
-        """Generate HTML diff for email alerts"""
+        """Generate HTML diff for email alerts, cut off after ``max_diff_lines`` lines"""
         try:
-            old_lines = old_html.splitlines()
-            new_lines = new_html.splitlines()
+            old_lines = self._diff_lines(old_html)
+            new_lines = self._diff_lines(new_html)
             
             diff = unified_diff(
                 old_lines, new_lines,
@@ -571,80 +2729,267 @@ class HTMLPageDetector:
                 lineterm=''
             )
             
-            return '\n'.join(diff)
+            lines = list(islice(diff, self.max_diff_lines + 1))
+            if len(lines) > self.max_diff_lines:
+                lines[-1] = f"... diff cut off after {self.max_diff_lines} lines"
+            return '\n'.join(lines)
         except Exception as e:
             logger.error(f"Failed to generate HTML diff: {e}")
             return ""
     
+    @staticmethod
+    def _diff_lines(content: str, max_length: int = 200) -> List[str]:
+        """Lines of a page, with overlong ones broken after each tag so minified pages diff usefully"""
+        lines = []
+        for line in content.splitlines():
+            if len(line) > max_length:
+                lines.extend(TAG_BOUNDARY.sub('>\n', line).split('\n'))
+            else:
+                lines.append(line)
+        return lines
+    
+    def _delete_snapshots(self, keys: Iterable[str]) -> int:
+        """Remove the given versions that no scan refers to and no writer reused within the grace period"""
+        removed = 0
+        for key in self.db_manager.unreferenced_snapshots(keys):
+            if self.snapshot_store.delete(key, self.snapshot_grace):
+                removed += 1
+        return removed
+    
+    def collect_snapshots(self) -> int:
+        """Remove every stored version no scan refers to, such as those of scans that failed after storing them"""
+        if self.snapshot_store is None:
+            return 0
+        removed = self._delete_snapshots(self.snapshot_store.keys())
+        if removed:
+            logger.info(f"Removed {removed} unreferenced page snapshots")
+        return removed
+    
+    def snapshot_diff(self, old_key: Optional[str], new_key: Optional[str]) -> str:
+        """HTML diff of two page versions in the snapshot store; empty when either is missing or they are equal"""
+        if self.snapshot_store is None or not old_key or not new_key or old_key == new_key:
+            return ""
+        old_body = self.snapshot_store.get(old_key)
+        new_body = self.snapshot_store.get(new_key)
+        if old_body is None or new_body is None:
+            return ""
+        return self.generate_html_diff(old_body.decode('utf-8', 'replace'), new_body.decode('utf-8', 'replace'))
+    
     def scan_url(self, url: str) -> bool:
         """Scan a URL for changes"""
+        return self.scan(url).changed
+    
+    def scan(self, url: str) -> ScanResult:
+        """Scan a URL for changes and return the detailed outcome"""
         logger.info(f"Scanning URL: {url}")
+        start_time = stage_start = time.monotonic()
+        result = ScanResult(url=url)
         
-        # Fetch current HTML
-        current_html = self.fetch_page(url)
-        if not current_html:
-            return False
+        # Fetch current HTML, revalidating against the last scan when possible
+        fetched = self.fetch(url, self.db_manager.get_last_validators(url))
+        stage_start = result.mark('fetch', stage_start)
+        if fetched.not_modified:
+            logger.info(f"No changes detected in {url} (not modified since last scan)")
+            self.db_manager.mark_not_modified(url)
+            result.success = True
+            result.not_modified = True
+            result.duration = time.monotonic() - start_time
+            return result
         
-        # Generate hash and structure
-        current_hash = hashlib.md5(current_html.encode()).hexdigest()
-        current_structure = self.extract_xpath_structure(current_html)
+        if fetched.tree is None and fetched.extracted is None and not fetched.content:
+            result.error = fetched.error or "fetch failed"
+            result.duration = time.monotonic() - start_time
+            return result
         
-        # Get last scan data
         last_scan = self.db_manager.get_last_scan(url)
+        previous_snapshot = self.db_manager.get_last_snapshot_key(url) if self.snapshot_store else None
+        analysis = None
+        pool = None
+        if fetched.content is not None and len(fetched.content) >= self.process_pool_min_bytes:
+            pool = self._get_process_pool()
+        if pool is not None:
+            # Large pages are parsed, extracted and compared without holding our GIL
+            try:
+                analysis = pool.submit(_analyze_in_worker, url, fetched.content, fetched.content_hash,
+                                       last_scan).result(timeout=self.analysis_timeout)
+            except FutureTimeoutError:
+                # Analyzing the page in-process would get stuck on it the same way
+                logger.error(f"Analysis of {url} in the process pool timed out after {self.analysis_timeout:g}s")
+                self._discard_process_pool(pool, terminate=True)
+                result.error = f"analysis timed out after {self.analysis_timeout:g}s"
+                result.duration = time.monotonic() - start_time
+                return result
+            except BrokenProcessPool as e:
+                logger.error(f"Analysis process pool broke while analyzing {url}, retrying in-process: {e}")
+                self._discard_process_pool(pool)
+            except Exception as e:
+                logger.error(f"Analysis of {url} in the process pool failed, retrying in-process: {e}")
+                self._discard_process_pool(pool)
+        if analysis is None:
+            analysis = self.analyze(url, fetched.content, fetched.tree, fetched.content_hash, last_scan,
+                                    fetched.extracted)
+        for stage, seconds in analysis.timings.items():
+            result.timings[stage] = result.timings.get(stage, 0.0) + seconds
+        stage_start = time.monotonic()
         
-        changes = []
-        html_diff = ""
-        
-        if last_scan:
-            last_hash, last_structure_json = last_scan
+        changes = analysis.changes
+        change_count = sum(change.count for change in changes)
+        if analysis.changed and not changes:
+            logger.info(f"Detected changes in {url}")
+        if changes:
+            logger.info(f"Detected {change_count} changes in {url}"
+                        f"{f' ({len(changes)} after coalescing)' if len(changes) < change_count else ''}")
+            if analysis.regions:
+                regions = analysis.regions
+                logger.info(f"Changes in {url} are confined to: {', '.join(regions[:10])}"
+                            f"{f' and {len(regions) - 10} more' if len(regions) > 10 else ''}")
             
-            # Check if content changed
-            if current_hash != last_hash:
-                try:
-                    last_structure = json.loads(last_structure_json)
-                    changes = self.compare_structures(last_structure, current_structure)
-                    
-                    if changes:
-                        logger.info(f"Detected {len(changes)} changes in {url}")
-                        
-                        # Generate HTML diff if configured
-                        if self.config.get('generate_diff', False):
-                            # We don't have the old HTML stored, so we'll skip diff generation
-                            # In production, you might want to store the actual HTML content
-                            html_diff = "HTML diff generation requires storing full HTML content"
-                        
-                        # Send alerts if configured
-                        if self.email_notifier and self.config.get('recipients'):
-                            for recipient in self.config['recipients']:
-                                self.email_notifier.send_alert(recipient, url, changes, html_diff)
-                    else:
-                        logger.info(f"Content changed in {url} but no structural changes detected")
-                except json.JSONDecodeError as e:
-                    logger.error(f"Failed to parse stored structure: {e}")
-            else:
-                logger.info(f"No changes detected in {url}")
-        else:
-            logger.info(f"First scan for {url} - creating baseline")
+            # Send alerts if configured
+            if self.email_notifier and self.config.get('recipients'):
+                # Generate HTML diff against the previous snapshot if configured
+                html_diff = ""
+                if self.generate_diff:
+                    html_diff = self.snapshot_diff(previous_snapshot, fetched.snapshot_key)
+                for recipient in self.config['recipients']:
+                    self.email_notifier.send_alert(recipient, url, changes, html_diff)
+            stage_start = result.mark('notify', stage_start)
         
         # Save current scan result
-        self.db_manager.save_scan_result(
-            url, current_hash, json.dumps(current_structure), changes
-        )
+        self.db_manager.save_scan_result(url, analysis.content_hash, analysis.structure, changes, fetched.validators,
+                                         analysis.simhash, analysis.similarity, change_count or int(analysis.changed),
+                                         fetched.snapshot_key)
+        if fetched.snapshot_key and fetched.snapshot_key != previous_snapshot:
+            # A new version of the page: drop the oldest one beyond the retention
+            self._delete_snapshots(self.db_manager.expire_snapshots(url, self.snapshot_retention))
+        result.mark('persist', stage_start)
+        
+        result.success = True
+        result.similarity = analysis.similarity
+        result.trivial = analysis.trivial
+        result.changed = analysis.changed
+        result.change_count = change_count
+        result.duration = time.monotonic() - start_time
+        return result
+    
+    def _get_process_pool(self) -> Optional[ProcessPoolExecutor]:
+        """The analysis process pool, started on first use; None when it is disabled"""
+        if self.process_pool_workers <= 0:
+            return None
+        with self._process_pool_lock:
+            if self._process_pool is None:
+                # Spawned workers don't inherit our threads or open connections;
+                # recycling them after max tasks releases memory lxml holds on to
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.process_pool_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_analysis_worker,
+                    initargs=(self.config, logging.root.manager.disable),
+                    max_tasks_per_child=self.process_pool_max_tasks or None
+                )
+                logger.info(f"Started analysis process pool with {self.process_pool_workers} workers")
+            return self._process_pool
+    
+    def _discard_process_pool(self, pool: ProcessPoolExecutor, terminate: bool = False):
+        """Drop a broken pool so the next large page starts a fresh one
+        
+        With ``terminate`` its workers are killed too, as shutting down
+        leaves a worker stuck on a page running. Scans waiting on the pool's
+        other workers then fail over to in-process analysis.
+        """
+        with self._process_pool_lock:
+            if self._process_pool is pool:
+                self._process_pool = None
+        if terminate:
+            for process in list((pool._processes or {}).values()):
+                process.terminate()
+        pool.shutdown(wait=False, cancel_futures=True)
+    
+    def close(self):
+        """Stop the analysis process pool, if one was started, and close the database connections"""
+        with self._process_pool_lock:
+            pool, self._process_pool = self._process_pool, None
+        if pool is not None:
+            pool.shutdown()
+        self.db_manager.close()
+    
+    async def scan_urls_async(self, urls: List[str], max_concurrency: Optional[int] = None) -> List[ScanResult]:
+        """Scan many URLs concurrently
+        
+        At most ``max_concurrency`` scans run at once overall and at most
+        ``per_host_concurrency`` against any single host, and requests to the
+        same host are spaced out by the per-host rate limiter. Each scan runs
+        the regular fetch/extract/compare/persist/notify pipeline of ``scan``
+        in a worker thread. Results are returned in the order of ``urls``.
+        """
+        limit = max(1, max_concurrency or self.max_concurrency)
+        global_slots = asyncio.Semaphore(limit)
+        host_slots: Dict[str, asyncio.Semaphore] = {}
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(max_workers=limit, thread_name_prefix='scan')
+        
+        async def run(url: str) -> ScanResult:
+            host = urlsplit(url).hostname or ''
+            if host not in host_slots:
+                host_slots[host] = asyncio.Semaphore(self.per_host_concurrency)
+            
+            async with host_slots[host]:
+                # Wait for the host's turn before taking one of the global slots
+                await self.rate_limiter.acquire(host)
+                async with global_slots:
+                    try:
+                        return await loop.run_in_executor(executor, self.scan, url)
+                    except Exception as e:
+                        logger.error(f"Error scanning {url}: {e}")
+                        return ScanResult(url=url, error=str(e))
         
-        return len(changes) > 0
+        try:
+            return await asyncio.gather(*(run(url) for url in urls))
+        finally:
+            executor.shutdown(wait=False)
+    
+    def scan_urls(self, urls: List[str], max_concurrency: Optional[int] = None) -> List[ScanResult]:
+        """Run one concurrent scan cycle over ``urls`` and wait for it to finish"""
+        return asyncio.run(self.scan_urls_async(urls, max_concurrency))
+    
+    def get_scan_intervals(self, urls: Optional[List[str]] = None) -> Dict[str, Dict]:
+        """Get the adaptive scan interval computed for each URL"""
+        return self.scheduler.get_intervals(urls)
     
     def monitor_urls(self, urls: List[str], interval: int = 3600):
-        """Monitor multiple URLs continuously"""
-        logger.info(f"Starting monitoring for {len(urls)} URLs with {interval}s interval")
+        """Monitor multiple URLs continuously
+        
+        With ``adaptive_intervals`` enabled (the default) each URL is scanned
+        when its own interval, learned from its change history, has elapsed
+        and ``interval`` is only the starting point for new URLs. Otherwise
+        all URLs are scanned every ``interval`` seconds.
+        """
+        self.scheduler.default_interval = float(interval)
+        self.collect_snapshots()
+        logger.info(f"Starting monitoring for {len(urls)} URLs with {interval}s interval "
+                    f"(max {self.max_concurrency} concurrent scans, "
+                    f"adaptive intervals {'on' if self.adaptive_intervals else 'off'})")
         
         while True:
             try:
-                for url in urls:
-                    self.scan_url(url)
-                    time.sleep(5)  # Small delay between URLs
+                cycle_start = time.monotonic()
+                due = self.scheduler.due_urls(urls) if self.adaptive_intervals else urls
+                results = self.scan_urls(due)
                 
-                logger.info(f"Completed scan cycle. Waiting {interval} seconds...")
-                time.sleep(interval)
+                if self.adaptive_intervals:
+                    for r in results:
+                        if r.success:
+                            self.scheduler.record_scan(r.url, r.changed)
+                        else:
+                            self.scheduler.postpone(r.url)
+                    wait = min(self.scheduler.seconds_until_due(urls), interval)
+                else:
+                    wait = interval
+                
+                changed = sum(1 for r in results if r.changed)
+                failed = sum(1 for r in results if not r.success)
+                logger.info(f"Completed scan cycle of {len(due)} URLs in {time.monotonic() - cycle_start:.1f}s: "
+                            f"{changed} changed, {failed} failed. Waiting {wait:.0f} seconds...")
+                time.sleep(max(wait, 1))
                 
             except KeyboardInterrupt:
                 logger.info("Monitoring stopped by user")
@@ -652,20 +2997,143 @@ class HTMLPageDetector:
             except Exception as e:
                 logger.error(f"Error in monitoring loop: {e}")
                 time.sleep(60)  # Wait 1 minute before retrying
+    
+    def run_worker(self, urls: Optional[List[str]] = None, worker_id: Optional[str] = None,
+                   batch_size: Optional[int] = None, lease_seconds: float = 300,
+                   poll_interval: float = 30, stop_event: Optional[threading.Event] = None):
+        """Scan URLs claimed from the shared work queue until stopped
+        
+        Any number of workers, in this or other processes or machines sharing
+        the queue's store, can run at once. Each claims a batch of due URLs
+        under a lease, keeps the lease renewed while the batch is scanned,
+        reschedules every URL from its change history and releases it. Leases
+        of crashed workers expire and their URLs are claimed by others.
+        ``urls`` are added to the queue before starting.
+        """
+        worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+        batch_size = batch_size or self.max_concurrency
+        stop_event = stop_event or threading.Event()
+        
+        if urls:
+            self.scheduler.ensure(urls)
+            self.work_queue.enqueue(urls)
+        self.collect_snapshots()
+        logger.info(f"Worker {worker_id} started (batch size {batch_size}, lease {lease_seconds}s)")
+        
+        while not stop_event.is_set():
+            try:
+                claimed = self.work_queue.claim(worker_id, batch_size, lease_seconds)
+                if not claimed:
+                    stop_event.wait(min(poll_interval, max(1.0, self.work_queue.seconds_until_due())))
+                    continue
+                
+                # Renew the batch's leases in the background while it is scanned
+                batch_done = threading.Event()
+                
+                def renew_leases():
+                    while not batch_done.wait(lease_seconds / 3):
+                        self.work_queue.renew(worker_id, claimed, lease_seconds)
+                
+                renewer = threading.Thread(target=renew_leases, daemon=True)
+                renewer.start()
+                try:
+                    results = self.scan_urls(claimed)
+                finally:
+                    batch_done.set()
+                    renewer.join()
+                
+                for r in results:
+                    if r.success:
+                        self.scheduler.record_scan(r.url, r.changed)
+                    else:
+                        self.scheduler.postpone(r.url)
+                    self.work_queue.release(worker_id, r.url, self.scheduler.next_scan(r.url))
+                
+                logger.info(f"Worker {worker_id} scanned {len(results)} URLs: "
+                            f"{sum(1 for r in results if r.changed)} changed, "
+                            f"{sum(1 for r in results if not r.success)} failed")
+                
+            except KeyboardInterrupt:
+                logger.info(f"Worker {worker_id} stopped by user")
+                break
+            except Exception as e:
+                logger.error(f"Error in worker {worker_id}: {e}")
+                stop_event.wait(60)
+
+# Analyzer of an analysis worker process, built once per process
+_worker_analyzer: Optional[PageAnalyzer] = None
+
+def _init_analysis_worker(config: Dict, disabled_log_level: int = 0):
+    """Process pool initializer: build an analyzer, which needs no database, and log to stderr only"""
+    global _worker_analyzer
+    # Spawned workers start with fresh logging; keep the parent's suppression, and leave the log file to it
+    logging.disable(disabled_log_level)
+    for handler in logging.root.handlers[:]:
+        if isinstance(handler, logging.FileHandler):
+            logging.root.removeHandler(handler)
+            handler.close()
+    _worker_analyzer = PageAnalyzer(config)
+
+def _analyze_in_worker(url: str, content: str, content_hash: Optional[str],
+                       last_scan: Optional[Tuple[str, Union[str, bytes], Optional[int]]]) -> PageAnalysis:
+    return _worker_analyzer.analyze(url, content, content_hash=content_hash, last_scan=last_scan)
 
 # Configuration example
 def create_sample_config():
     """Create sample configuration"""
     return {
         'db_path': 'html_detector.db',
+        'db_journal_mode': 'wal',  # Use 'delete' when machines share the database over network storage
         'email_enabled': False,  # Set to True to enable email alerts
         'smtp_server': 'smtp.gmail.com',
         'smtp_port': 587,
         'email': 'your-email@gmail.com',
         'email_password': 'your-app-password',
         'recipients': ['recipient@example.com'],
-        'generate_diff': True,
+        'generate_diff': True,  # Attach a diff against the previous page version to alerts
+        'snapshots': True,  # Keep raw page versions, compressed and stored once each; defaults to generate_diff
+        'snapshot_dir': None,  # Defaults to <db_path without extension>_snapshots
+        'snapshot_retention': 10,  # Versions kept per URL
+        'snapshot_grace': 3600,  # Seconds an unreferenced version is kept after it was last stored or reused
+        'max_diff_lines': 2000,  # Longer diffs are cut off
         'scan_interval': 3600,  # 1 hour
+        'max_concurrency': 10,  # Scans running at once per cycle
+        'per_host_concurrency': 1,  # Scans running at once against one host
+        'host_delay': 5,  # Seconds between requests to the same host
+        'host_burst': 1,  # Requests a host may receive back to back
+        'crawl_delays': {},  # Per-host overrides of host_delay, e.g. {'example.com': 10}
+        'custom_selectors': {},  # Per-URL CSS/XPath regions to monitor, e.g. {'https://example.com': ['#prices']}
+        'adaptive_intervals': True,  # Learn each URL's interval from its change history
+        'min_scan_interval': 300,  # 5 minutes
+        'max_scan_interval': 86400,  # 1 day
+        'url_intervals': {},  # Per-URL bounds, e.g. {'https://example.com': {'min_interval': 60}}
+        'stream_fetch': False,  # Hash and parse bodies while they download
+        'max_body_bytes': 64 * 1024 * 1024,  # Refuse pages larger than this
+        'max_retries': 3,  # Retries after connect failures, timeouts, 429 and 5xx
+        'retry_delay': 1,  # Base of the jittered exponential backoff
+        'breaker_threshold': 5,  # Fetches in a row that can't reach a host, retries included, before it is skipped
+        'breaker_cooldown': 300,  # Seconds a failing host is skipped for
+        'process_pool_workers': 0,  # Processes for parsing/extracting/comparing large pages; 0 = in-process
+        'process_pool_max_tasks': 200,  # Pages a worker process analyzes before it is replaced
+        'process_pool_min_bytes': 200 * 1024,  # Smaller pages are analyzed in-process
+        'analysis_timeout': None,  # Seconds before a pooled page analysis fails the scan; 4x request_timeout
+        'extraction_mode': 'tree',  # 'iterparse' keeps memory flat on huge pages
+        'table_diff': True,  # Store table contents and report changed rows and cells
+        'table_keys': {},  # Per-URL row key columns, e.g. {'https://example.com/prices': 'SKU'}
+        'diff_mode': 'xpath',  # 'tree' matches elements by id/name/class and sibling alignment
+        'simhash': True,  # Store a similarity fingerprint of each page's visible text
+        'similarity_threshold': None,  # e.g. 0.95: more similar pages skip the structural diff
+        'url_similarity_thresholds': {},  # Per-URL thresholds, e.g. {'https://example.com': 0.9}
+        'max_changes_per_scan': 500,  # More changes are coalesced per subtree and change type; None = never
+        'change_sample_size': 5,  # Changes kept as a sample of each coalesced group
+        'record_changes': True,  # False only records whether pages changed, unless alerts need the details
+        'structure_format': 'compact',  # Stored structures: 'compact' binary or 'json'
+        'structure_keyframe_interval': 20,  # Structure versions per full one in the history; the rest are deltas
+        'normalization': {  # Noise stripped before fingerprinting; see page_normalizer.DEFAULT_RULES
+            'ignore_patterns': [r'\d{1,2}:\d{2}(:\d{2})?'],  # e.g. inline clock times
+            'volatile_attributes': ['nonce', 'data-nonce', 'data-csrf', 'data-timestamp']
+        },
+        'url_normalization': {},  # Per-URL overrides, e.g. {'https://example.com': {'enabled': False}}
         'urls_to_monitor': [
             'https://example.com',
             'https://httpbin.org/html'
@@ -0,0 +1,385 @@
+# iterparse_extractor.py - Bounded-memory structure extraction from parser events
+
+import logging
+from array import array
+from typing import Dict, List, Optional
+
+from lxml import etree
+
+from page_normalizer import PageNormalizer, drop_element
+from simhash import INVISIBLE_TAGS, SimHasher
+from structure_format import CompactStructure, attributes_hash, hash64, node_digest
+from table_diff import build_table_data, cell_text
+
+logger = logging.getLogger(__name__)
+
+FORM_INPUT_TAGS = {'input', 'select', 'textarea'}
+
+# lxml.html's text_content() for the plain elements the pull parser builds
+_text_content = etree.XPath('string()')
+
+class _Frame:
+    """Bookkeeping for one element between its start event and the point its tail is complete"""
+
+    __slots__ = ('index', 'element', 'tag', 'text', 'attributes', 'children', 'name_counts',
+                 'pending', 'child_digests', 'size', 'table', 'form', 'header_slots', 'row', 'cell_slot',
+                 'retained')
+
+    def __init__(self, index: int, element, tag: str, attributes: Dict[str, str]):
+        self.index = index
+        self.element = element
+        self.tag = tag
+        self.text = None
+        self.attributes = attributes
+        self.children = array('I')  # Indexes of the children started so far
+        self.name_counts = {}  # Children per XPath name, for positional [n] suffixes
+        self.pending = None  # Last ended child, finalized once its tail is complete
+        self.child_digests = bytearray()
+        self.size = 1
+        self.table = None  # Summary being built, for tables
+        self.form = None  # Summary being built, for forms
+        self.header_slots = None  # (table summary, position) slots a header cell fills at its end
+        self.row = None  # [table summary, in thead, cell texts, only th cells] for rows of a table
+        self.cell_slot = None  # (cell texts, position) of the row a cell belongs to
+        self.retained = False  # Cells keep their subtree for text_content()
+
+class _TableSummary:
+    __slots__ = ('headers', 'row_count', 'column_count', 'first_row', 'open_theads', 'rows')
+
+    def __init__(self):
+        self.headers = []
+        self.rows = []  # (header row, cell texts) of the table's own rows, for table data
+        self.row_count = 0
+        self.column_count = 0
+        self.first_row = None  # Frame of the first row while it is open; False once it ended
+        self.open_theads = 0
+
+class IterparseExtractor:
+    """Extracts a page structure from incremental parser events
+
+    Bytes are fed as they arrive into lxml's HTMLPullParser. Element records
+    go straight into the columns of a CompactStructure, table and form
+    summaries are built from start and end events, Merkle subtree hashes are
+    folded in as subtrees complete, and finished subtrees are removed from
+    the parser's tree. Memory therefore stays at the size of the compact
+    columns plus the currently open elements, instead of a whole DOM plus a
+    dict per element.
+
+    The result equals what ``HTMLPageDetector.extract_tree_structure`` gives
+    for the same page after ``PageNormalizer.normalize``, except that ignore
+    XPaths spanning several steps can't be applied; single-step rules such as
+    ``//input[@name='token']/@value`` are checked per element, from its
+    attributes.
+    """
+
+    def __init__(self, normalizer: Optional[PageNormalizer] = None, subtree_hashes: bool = True,
+                 encoding: Optional[str] = None, table_data: bool = True, simhash: bool = False):
+        self.normalizer = normalizer
+        self.subtree_hashes = subtree_hashes
+        self.table_data = table_data
+        self.simhasher = SimHasher() if simhash else None
+        self.parser = etree.HTMLPullParser(events=('start', 'end', 'comment'), encoding=encoding)
+        self.compact = CompactStructure()
+        self.parents = array('i')
+        self.names = array('I')
+        self.ordinals = array('I')
+        self.indexed = array('b')
+        self.digests = array('Q')
+        self.sizes = array('I')
+        self.tables: Dict[int, Dict] = {}
+        self.table_contents: Dict[int, Dict] = {}
+        self.forms: Dict[int, Dict] = {}
+        self.stack: List[_Frame] = []
+        self.open_tables: List[_TableSummary] = []
+        self.open_forms: List[Dict] = []
+        self.retained_depth = 0
+        self.skipping = None  # Element being dropped by the normalizer, with its subtree
+        self.root_digest = None
+        self.structure: Optional[CompactStructure] = None
+        if normalizer and normalizer.tree_only_xpaths:
+            logger.warning(f"Ignore XPaths {normalizer.tree_only_xpaths} need the whole tree "
+                           f"and are not applied in iterparse mode")
+
+    def feed(self, data: bytes):
+        """Parse another chunk of the page"""
+        self.parser.feed(data)
+        self._process_events()
+
+    def close(self) -> CompactStructure:
+        """Finish parsing and return the structure"""
+        try:
+            self.parser.close()
+        except etree.XMLSyntaxError as e:
+            logger.error(f"Failed to parse page: {e}")
+        self._process_events()
+        self.structure = self._build()
+        return self.structure
+
+    @property
+    def fingerprint(self) -> Optional[str]:
+        """Hex Merkle digest of the whole normalized document"""
+        return self.root_digest.hex() if self.root_digest is not None else None
+
+    @property
+    def simhash(self) -> Optional[int]:
+        """SimHash of the page's visible text, if requested"""
+        return self.simhasher.digest() if self.simhasher else None
+
+    # Events
+
+    def _process_events(self):
+        for event, element in self.parser.read_events():
+            if self.skipping is not None:
+                if event == 'end' and element is self.skipping:
+                    self.skipping = None
+                    drop_element(element)
+            elif event == 'start':
+                self._start(element)
+            elif event == 'end':
+                self._end(element)
+            elif event == 'comment':
+                self._comment(element)
+
+    def _start(self, element):
+        if not self.stack and self.compact.path_id:
+            return  # Elements after the root aren't part of the structure
+        if self.normalizer and self.normalizer.drops(element):
+            self.skipping = element
+            return
+
+        tag = element.tag
+        parent = self.stack[-1] if self.stack else None
+        frame = self._open(element, tag, dict(element.attrib))
+
+        if tag == 'tr':
+            for table in self.open_tables:
+                table.row_count += 1
+                if table.first_row is None:
+                    table.first_row = frame
+            if self.table_data and parent is not None:
+                # Rows of the table itself, directly or in its thead/tbody/tfoot
+                if parent.table is not None:
+                    frame.row = [parent.table, False, [], True]
+                elif parent.tag in ('thead', 'tbody', 'tfoot') and len(self.stack) > 1 and self.stack[-2].table:
+                    frame.row = [self.stack[-2].table, parent.tag == 'thead', [], True]
+        elif tag == 'td' or tag == 'th':
+            slots = []
+            for table in self.open_tables:
+                if table.first_row:
+                    table.column_count += 1
+                if tag == 'th' or table.open_theads:
+                    slots.append((table, len(table.headers)))
+                    table.headers.append(None)
+            if slots:
+                frame.header_slots = slots
+            if parent is not None and parent.row is not None:
+                cells = parent.row[2]
+                frame.cell_slot = (cells, len(cells))
+                cells.append(None)
+                if tag != 'th':
+                    parent.row[3] = False
+            if slots or frame.cell_slot:
+                frame.retained = True
+                self.retained_depth += 1
+        elif tag == 'thead':
+            for table in self.open_tables:
+                table.open_theads += 1
+        elif tag == 'table':
+            frame.table = _TableSummary()
+            self.open_tables.append(frame.table)
+        elif tag == 'form':
+            frame.form = {
+                'action': frame.attributes.get('action', ''),
+                'method': frame.attributes.get('method', ''),
+                'inputs': []
+            }
+            self.open_forms.append(frame.form)
+
+        if tag in FORM_INPUT_TAGS:
+            for form in self.open_forms:
+                form['inputs'].append({
+                    'type': frame.attributes.get('type', tag),
+                    'name': frame.attributes.get('name', ''),
+                    'id': frame.attributes.get('id', ''),
+                    'class': frame.attributes.get('class', '')
+                })
+
+        self.stack.append(frame)
+
+    def _end(self, element):
+        if not self.stack or self.stack[-1].element is not element:
+            return
+        frame = self.stack.pop()
+        frame.text = self._clean(element.text)
+        if frame.retained or self.retained_depth:
+            element.text = frame.text
+        if self.simhasher and frame.tag not in INVISIBLE_TAGS:
+            self.simhasher.update(frame.text)
+        self.compact.text_id[frame.index] = self.compact.intern((frame.text or '').strip()[:100])
+        self._close_children(frame)
+
+        tag = frame.tag
+        if frame.retained:
+            content = _text_content(element)
+            for table, position in frame.header_slots or ():
+                table.headers[position] = content.strip()
+            if frame.cell_slot:
+                cells, position = frame.cell_slot
+                cells[position] = cell_text(content)
+            self.retained_depth -= 1
+        if tag == 'tr':
+            for table in self.open_tables:
+                if table.first_row is frame:
+                    table.first_row = False
+            if frame.row:
+                table, in_thead, cells, only_th = frame.row
+                table.rows.append((in_thead or (bool(cells) and only_th), cells))
+        elif tag == 'thead':
+            for table in self.open_tables:
+                table.open_theads -= 1
+        elif tag == 'table':
+            table = self.open_tables.pop()
+            self.tables[frame.index] = {
+                'headers': [header for header in table.headers if header],
+                'row_count': table.row_count,
+                'column_count': table.column_count
+            }
+            if self.table_data:
+                self.table_contents[frame.index] = build_table_data(table.rows)
+        elif tag == 'form':
+            self.forms[frame.index] = self.open_forms.pop()
+
+        if self.stack:
+            self.stack[-1].pending = frame
+        else:
+            # The root's tail is never part of a page
+            self._finalize(frame, None)
+
+    def _comment(self, comment):
+        if not self.stack:
+            return
+        if self.normalizer and self.normalizer.strip_comments:
+            drop_element(comment)
+            return
+        frame = self._open(comment, 'comment()', {})
+        frame.text = self._clean(comment.text)
+        self.compact.text_id[frame.index] = self.compact.intern((frame.text or '').strip()[:100])
+        self.stack[-1].pending = frame
+
+    # Records
+
+    def _open(self, element, tag: str, attributes: Dict[str, str]) -> _Frame:
+        """Start the record of a new element or comment, completing its previous sibling"""
+        compact = self.compact
+        index = len(compact.path_id)
+        parent = self.stack[-1] if self.stack else None
+        if parent is not None and parent.pending is not None:
+            # A new sibling follows, so the previous one's tail is complete
+            self._finalize(parent.pending, parent)
+            parent.pending = None
+
+        name_id = compact.intern(tag)
+        compact.path_id.append(0)
+        compact.tag_id.append(name_id)
+        compact.text_id.append(0)
+        compact.tail_id.append(0)
+        for name, value in attributes.items():
+            compact.attr_name_id.append(compact.intern(name))
+            compact.attr_value_id.append(compact.intern(value))
+        compact.attr_offsets.append(len(compact.attr_name_id))
+        compact.attr_hash.append(attributes_hash(attributes) if attributes else 0)
+
+        self.names.append(name_id)
+        self.digests.append(0)
+        self.sizes.append(1)
+        if parent is None:
+            self.parents.append(-1)
+            self.ordinals.append(1)
+        else:
+            self.parents.append(parent.index)
+            count = parent.name_counts.get(name_id, 0) + 1
+            parent.name_counts[name_id] = count
+            self.ordinals.append(count)
+            parent.children.append(index)
+        self.indexed.append(0)
+        return _Frame(index, element, tag, attributes)
+
+    def _close_children(self, frame: _Frame):
+        """All children of an ended element are known: finish the last one and fix the positional suffixes"""
+        if frame.pending is not None:
+            self._finalize(frame.pending, frame)
+            frame.pending = None
+        for child in frame.children:
+            if frame.name_counts[self.names[child]] > 1:
+                self.indexed[child] = 1
+        frame.children = None
+        frame.name_counts = None
+
+    def _finalize(self, frame: _Frame, parent: Optional[_Frame]):
+        """Record the tail and subtree hash of a completed element and drop its subtree"""
+        element = frame.element
+        tail = self._clean(element.tail) if parent is not None else element.tail
+        if self.retained_depth:
+            element.tail = tail
+        self.compact.tail_id[frame.index] = self.compact.intern((tail or '').strip()[:100])
+        if self.simhasher and parent is not None:
+            self.simhasher.update(tail)
+
+        digest = node_digest(frame.tag, frame.text, tail, frame.attributes, frame.child_digests)
+        self.digests[frame.index] = int.from_bytes(digest, 'big')
+        self.sizes[frame.index] = frame.size
+        if parent is None:
+            self.root_digest = digest
+            return
+        parent.child_digests += digest
+        parent.size += frame.size
+        if not self.retained_depth:
+            parent.element.remove(element)
+
+    def _clean(self, text: Optional[str]) -> Optional[str]:
+        return self.normalizer.clean_text(text) if self.normalizer else text
+
+    # Result
+
+    def _build(self) -> CompactStructure:
+        """Materialize XPaths and hash columns once every element is complete"""
+        compact = self.compact
+        while self.stack:
+            # Close whatever a truncated page left open
+            self._end(self.stack[-1].element)
+
+        strings = compact.strings()
+        paths = []
+        for index, parent in enumerate(self.parents):
+            name = strings[self.names[index]]
+            step = f"{name}[{self.ordinals[index]}]" if self.indexed[index] else name
+            paths.append(f"{paths[parent]}/{step}" if parent >= 0 else f"/{step}")
+
+        compact.path_id = array('I', compact.add_unique(paths))
+        compact.path_hash = array('Q', [hash64(path) for path in paths])
+        text_hashes = {}
+        for text_id in compact.text_id:
+            if text_id not in text_hashes:
+                text_hashes[text_id] = hash64(compact.string(text_id))
+        compact.text_hash = array('Q', [text_hashes[text_id] for text_id in compact.text_id])
+        if self.subtree_hashes:
+            compact.subtree_hash = self.digests
+            compact.subtree_size = self.sizes
+            compact.has_subtree_hashes = True
+        compact.extras = {
+            'tables': {paths[index]: summary for index, summary in sorted(self.tables.items())},
+            'forms': {paths[index]: summary for index, summary in sorted(self.forms.items())}
+        }
+        if self.table_data:
+            compact.extras['table_data'] = {paths[index]: data for index, data in sorted(self.table_contents.items())}
+        return compact
+
+def extract_iterparse(chunks, normalizer: Optional[PageNormalizer] = None, subtree_hashes: bool = True,
+                      encoding: Optional[str] = None, table_data: bool = True,
+                      simhash: bool = False) -> IterparseExtractor:
+    """Run an IterparseExtractor over an iterable of byte chunks"""
+    extractor = IterparseExtractor(normalizer, subtree_hashes, encoding, table_data, simhash)
+    for chunk in chunks:
+        extractor.feed(chunk)
+    extractor.close()
+    return extractor
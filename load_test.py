@@ -0,0 +1,137 @@
+# load_test.py - End-to-end throughput test of HTMLPageDetector against the local fixture server
+
+import argparse
+import logging
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+from fixture_server import FixtureServer, add_site_arguments, site_from_arguments
+
+STAGES = ['fetch', 'normalize', 'extract', 'compare', 'notify', 'persist']
+
+def _serve(args: argparse.Namespace, conn):
+    """Run the fixture server in its own process so it doesn't compete for our GIL"""
+    server = FixtureServer(site_from_arguments(args)).start()
+    conn.send(server.base_url)
+    conn.recv()  # Wait for the stop message
+    conn.send(dict(server.site.stats))
+    server.stop()
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def db_size(db_path: str) -> int:
+    """Size of a SQLite database including its WAL file"""
+    return sum(os.path.getsize(path) for path in (db_path, db_path + '-wal') if os.path.exists(path))
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+def report_stages(results) -> str:
+    """Format per-stage latency percentiles in milliseconds"""
+    lines = [f"  {'stage':<10}{'count':>8}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}"]
+    for stage in STAGES:
+        values = [r.timings[stage] * 1000 for r in results if stage in r.timings]
+        if not values:
+            continue
+        lines.append(f"  {stage:<10}{len(values):>8}{percentile(values, 50):>10.1f}{percentile(values, 90):>10.1f}"
+                     f"{percentile(values, 99):>10.1f}{max(values):>10.1f}")
+    totals = [r.duration * 1000 for r in results]
+    lines.append(f"  {'total':<10}{len(totals):>8}{percentile(totals, 50):>10.1f}{percentile(totals, 90):>10.1f}"
+                 f"{percentile(totals, 99):>10.1f}{max(totals or [0]):>10.1f}")
+    return '\n'.join(lines)
+
+def build_config(args: argparse.Namespace, db_path: str) -> Dict:
+    """Detector config for the load test; politeness is off since every URL hits one local host"""
+    return {
+        'db_path': db_path,
+        'email_enabled': False,
+        'generate_diff': False,
+        'max_concurrency': args.concurrency,
+        'per_host_concurrency': args.concurrency,
+        'host_delay': 0,
+        'stream_fetch': args.stream,
+        'max_retries': args.retries,
+        'retry_delay': 0.05,
+        'breaker_threshold': 1000000,
+        'process_pool_workers': args.processes,
+        'process_pool_min_bytes': args.process_min_bytes
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test HTMLPageDetector against simulated pages")
+    parser.add_argument('--urls', type=int, default=1000, help="simulated URLs to scan")
+    parser.add_argument('--cycles', type=int, default=3, help="scan cycles over all URLs")
+    parser.add_argument('--concurrency', type=int, default=20, help="concurrent scans")
+    parser.add_argument('--sequential', action='store_true', help="call scan_url one URL at a time instead")
+    parser.add_argument('--stream', action='store_true', help="use streaming fetches")
+    parser.add_argument('--retries', type=int, default=0, help="fetch retries")
+    parser.add_argument('--processes', type=int, default=0, help="analysis worker processes (0: in-process)")
+    parser.add_argument('--process-min-bytes', type=int, default=200 * 1024,
+                        help="pages smaller than this are analyzed in-process")
+    parser.add_argument('--db', default=None, help="database path (default: a temporary file)")
+    add_site_arguments(parser)
+    args = parser.parse_args()
+
+    # Keep per-scan logging out of the measurements
+    logging.disable(logging.INFO)
+    from html_page_detector import HTMLPageDetector
+
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server_process = multiprocessing.Process(target=_serve, args=(args, child_conn), daemon=True)
+    server_process.start()
+    base_url = parent_conn.recv()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = args.db or os.path.join(tmp_dir, 'load_test.db')
+        detector = HTMLPageDetector(build_config(args, db_path))
+        urls = [f"{base_url}/page/{number}" for number in range(args.urls)]
+        print(f"Load test: {args.urls} URLs x {args.cycles} cycles, "
+              f"{'sequential' if args.sequential else f'concurrency {args.concurrency}'}, "
+              f"{f'{args.processes} analysis processes, ' if args.processes else ''}"
+              f"page size {args.page_size} B, latency {args.latency * 1000:.0f} ms, "
+              f"change probability {args.change_probability}, error rate {args.error_rate}")
+
+        all_results = []
+        initial_db_size = db_size(db_path)
+        for cycle in range(1, args.cycles + 1):
+            cycle_start = time.monotonic()
+            if args.sequential:
+                results = [detector.scan(url) for url in urls]
+            else:
+                results = detector.scan_urls(urls)
+            elapsed = time.monotonic() - cycle_start
+            all_results.extend(results)
+
+            print(f"\nCycle {cycle}: {len(urls)} URLs in {elapsed:.2f}s ({len(urls) / elapsed:.1f} URLs/s), "
+                  f"{sum(1 for r in results if r.changed)} changed, "
+                  f"{sum(1 for r in results if r.not_modified)} not modified, "
+                  f"{sum(1 for r in results if not r.success)} failed, "
+                  f"DB {db_size(db_path) / 1e6:.1f} MB")
+            print(report_stages(results))
+
+        print(f"\nAll cycles, stage latency (ms):\n{report_stages(all_results)}")
+        print(f"DB growth: {initial_db_size / 1e6:.1f} MB -> {db_size(db_path) / 1e6:.1f} MB "
+              f"({(db_size(db_path) - initial_db_size) / max(1, len(all_results)) / 1024:.1f} KB per scan)")
+        print(f"Peak RSS: {peak_rss_mb():.1f} MB")
+        detector.close()
+
+    parent_conn.send('stop')
+    print(f"Server: {parent_conn.recv()}")
+    server_process.join(timeout=5)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+# page_normalizer.py - Strips volatile noise from parsed pages before they are fingerprinted
+
+import hashlib
+import logging
+import re
+from typing import Dict, Optional
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES = {
+    'enabled': True,
+    'strip_tags': ['script', 'style', 'noscript'],
+    'strip_comments': True,
+    'collapse_whitespace': True,
+    'min_text_length': 0,
+    # Attributes that differ on every response, dropped wherever they appear
+    'volatile_attributes': ['nonce', 'data-nonce', 'data-csrf', 'data-csrf-token', 'data-timestamp'],
+    # Regexes whose matches are removed from text, tails and attribute values
+    'ignore_patterns': [],
+    # XPaths of elements to drop, or of attributes (ending in /@name) to clear
+    'ignore_xpaths': [
+        "//meta[@name='csrf-token' or @name='csrf-param']/@content",
+        "//input[@type='hidden'][contains(@name, 'csrf') or contains(@name, 'token')]/@value"
+    ]
+}
+
+# An ignore XPath of one descendant step, optionally selecting an attribute
+_SINGLE_STEP_RULE = re.compile(r"^//([^/|]+?)(?:/@([\w:.-]+))?$")
+
+class PageNormalizer:
+    """Removes noise that changes between fetches without the page changing
+
+    Scripts, styles, comments, rotating tokens, nonces, timestamps and
+    whitespace differences would otherwise give a page a new fingerprint on
+    nearly every scan. Rules are compiled once; ``normalize`` rewrites a
+    parsed document in place and ``fingerprint`` hashes the result. Rules not
+    given fall back to DEFAULT_RULES; invalid regexes and XPaths are logged
+    and skipped.
+    """
+
+    def __init__(self, rules: Optional[Dict] = None):
+        rules = {**DEFAULT_RULES, **(rules or {})}
+        self.strip_tags = list(rules['strip_tags'] or [])
+        self.strip_tag_set = set(self.strip_tags)
+        self.strip_comments = bool(rules['strip_comments'])
+        self.collapse_whitespace = bool(rules['collapse_whitespace'])
+        self.min_text_length = int(rules['min_text_length'] or 0)
+        self.volatile_attributes = list(rules['volatile_attributes'] or [])
+
+        self.patterns = []
+        for pattern in rules['ignore_patterns'] or []:
+            try:
+                self.patterns.append(re.compile(pattern))
+            except re.error as e:
+                logger.error(f"Invalid ignore pattern {pattern!r}: {e}")
+
+        self.xpaths = []
+        # Rules that can be checked on one element from its attributes, for iterparse extraction
+        self.element_rules = []
+        self.tree_only_xpaths = []
+        for xpath in rules['ignore_xpaths'] or []:
+            try:
+                self.xpaths.append(etree.XPath(xpath))
+            except etree.XPathSyntaxError as e:
+                logger.error(f"Invalid ignore XPath {xpath!r}: {e}")
+                continue
+            element_rule = self._element_rule(xpath)
+            if element_rule:
+                self.element_rules.append(element_rule)
+            else:
+                self.tree_only_xpaths.append(xpath)
+
+    @staticmethod
+    def _element_rule(xpath: str):
+        """Turn ``//step[predicates]`` or ``//step[predicates]/@attr`` into a per-element test
+
+        Returns (self::step test, attribute name or None), or None for rules
+        that need the whole tree (several steps, unions, positions).
+        """
+        match = _SINGLE_STEP_RULE.match(xpath)
+        if not match or re.search(r'\[\s*\d|position\(|last\(', match.group(1)):
+            return None
+        return etree.XPath(f"self::{match.group(1)}"), match.group(2)
+
+    def normalize(self, doc):
+        """Strip the noise from a parsed document in place and return it"""
+        for xpath in self.xpaths:
+            for match in xpath(doc):
+                if isinstance(match, etree._Element):
+                    drop_element(match)
+                elif getattr(match, 'is_attribute', False) and match.getparent() is not None:
+                    del match.getparent().attrib[match.attrname]
+
+        # Removed elements keep their tails, so surrounding text stays put
+        if self.strip_tags:
+            etree.strip_elements(doc, *self.strip_tags, with_tail=False)
+        if self.strip_comments:
+            etree.strip_elements(doc, etree.Comment, with_tail=False)
+        if self.volatile_attributes:
+            etree.strip_attributes(doc, *self.volatile_attributes)
+
+        if self.patterns or self.collapse_whitespace or self.min_text_length:
+            for element in doc.iter():
+                text = self.clean_text(element.text)
+                if text != element.text:
+                    element.text = text
+                tail = self.clean_text(element.tail)
+                if tail != element.tail:
+                    element.tail = tail
+                if self.patterns and isinstance(element.tag, str):
+                    self._substitute_attributes(element)
+        return doc
+
+    def drops(self, element) -> bool:
+        """Apply the per-element rules to a just-started element; True if it is to be removed
+
+        Used by iterparse extraction, which can't run whole-tree XPaths.
+        Attributes are cleaned as in ``normalize``. Rules are checked before
+        the element's children are parsed, so their predicates should only
+        test attributes.
+        """
+        if element.tag in self.strip_tag_set:
+            return True
+        for test, attribute in self.element_rules:
+            if test(element):
+                if attribute is None:
+                    return True
+                element.attrib.pop(attribute, None)
+        for name in self.volatile_attributes:
+            element.attrib.pop(name, None)
+        if self.patterns:
+            self._substitute_attributes(element)
+        return False
+
+    def fingerprint(self, doc) -> str:
+        """Hash of a normalized document"""
+        return hashlib.md5(etree.tostring(doc)).hexdigest()
+
+    def _substitute_attributes(self, element):
+        for name, value in element.attrib.items():
+            cleaned = self._substitute(value)
+            if cleaned != value:
+                element.set(name, cleaned)
+
+    def _substitute(self, value: str) -> str:
+        for pattern in self.patterns:
+            value = pattern.sub('', value)
+        return value
+
+    def clean_text(self, text: Optional[str]) -> Optional[str]:
+        """Apply the text rules to a text or tail"""
+        if not text:
+            return text
+        if self.patterns:
+            text = self._substitute(text)
+        if self.collapse_whitespace:
+            text = ' '.join(text.split())
+        if self.min_text_length and len(text.strip()) < self.min_text_length:
+            return None
+        return text or None
+
+def drop_element(element):
+    """Remove an element but keep its tail text in place"""
+    parent = element.getparent()
+    if parent is None:
+        return
+    if element.tail:
+        previous = element.getprevious()
+        if previous is not None:
+            previous.tail = (previous.tail or '') + element.tail
+        else:
+            parent.text = (parent.text or '') + element.tail
+    parent.remove(element)
@@ -0,0 +1,82 @@
+# simhash.py - SimHash similarity fingerprints over the visible text of a page
+
+import re
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from structure_format import hash64
+
+# Elements whose own text isn't visible; their tails are
+INVISIBLE_TAGS = {'script', 'style', 'noscript', 'template'}
+
+_WORD = re.compile(r'\w+')
+
+class SimHasher:
+    """Builds a 64-bit SimHash from word shingles, one text node at a time
+
+    Every run of ``shingle_size`` consecutive words within a text node is
+    hashed; each bit of the SimHash is set when it is set in the majority of
+    shingle hashes. Shingles never span text nodes, so the fingerprint
+    doesn't depend on the order text nodes are seen in, and tree and
+    iterparse extraction give the same value. Shingle hashes are buffered
+    and their bits counted with NumPy in batches.
+    """
+
+    def __init__(self, shingle_size: int = 4, batch_size: int = 8192):
+        self.shingle_size = shingle_size
+        self.batch_size = batch_size
+        self.counts = np.zeros(64, dtype=np.int64)
+        self.total = 0
+        self._pending: List[int] = []
+
+    def update(self, text: Optional[str]):
+        """Add the shingles of one text node"""
+        if not text:
+            return
+        words = _WORD.findall(text.lower())
+        if not words:
+            return
+        size = self.shingle_size
+        if len(words) <= size:
+            self._pending.append(hash64(' '.join(words)))
+        else:
+            self._pending.extend(hash64(' '.join(words[start:start + size]))
+                                 for start in range(len(words) - size + 1))
+        if len(self._pending) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._pending:
+            return
+        hashes = np.array(self._pending, dtype='<u8')
+        bits = np.unpackbits(hashes.view(np.uint8).reshape(-1, 8), axis=1, bitorder='little')
+        self.counts += bits.sum(axis=0, dtype=np.int64)
+        self.total += len(hashes)
+        self._pending = []
+
+    def digest(self) -> Optional[int]:
+        """The SimHash, or None for a page without any text"""
+        self._flush()
+        if not self.total:
+            return None
+        bits = (self.counts * 2 > self.total).astype(np.uint8)
+        return int(np.packbits(bits, bitorder='little').view('<u8')[0])
+
+def simhash_tree(roots: Iterable, shingle_size: int = 4) -> Optional[int]:
+    """SimHash of the visible text (texts and tails) below the given elements
+
+    The roots' own tails lie outside them and are left out.
+    """
+    hasher = SimHasher(shingle_size)
+    for root in roots:
+        for element in root.iter():
+            if isinstance(element.tag, str) and element.tag not in INVISIBLE_TAGS:
+                hasher.update(element.text)
+            if element is not root:
+                hasher.update(element.tail)
+    return hasher.digest()
+
+def similarity(first: int, second: int) -> float:
+    """Share of equal bits of two SimHashes, from 0.0 to 1.0"""
+    return 1.0 - bin((first ^ second) & 0xFFFFFFFFFFFFFFFF).count('1') / 64
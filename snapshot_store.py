@@ -0,0 +1,150 @@
+# snapshot_store.py - Content-addressed, compressed store of raw page versions
+
+import hashlib
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+import zlib
+from typing import Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+class SnapshotWriter:
+    """Compresses and hashes a page body as it arrives
+
+    The body goes to a temporary file in the store; ``commit`` files it
+    under the SHA-256 of the uncompressed bytes, or drops it and touches
+    the stored file when that version is already stored.
+    """
+
+    def __init__(self, store: 'SnapshotStore'):
+        self.store = store
+        fd, self._temp_path = tempfile.mkstemp(dir=store.root, suffix='.tmp')
+        self._file = os.fdopen(fd, 'wb')
+        self._compressor = zlib.compressobj(store.level)
+        self._digest = hashlib.sha256()
+
+    def write(self, data: bytes):
+        self._digest.update(data)
+        self._file.write(self._compressor.compress(data))
+
+    def commit(self) -> str:
+        """Store the body and return its key"""
+        self._file.write(self._compressor.flush())
+        self._file.close()
+        key = self._digest.hexdigest()
+        path = self.store.path(key)
+        if self.store._reuse(path):
+            os.remove(self._temp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(self._temp_path, path)
+        return key
+
+    def abort(self):
+        """Discard the body"""
+        self._file.close()
+        try:
+            os.remove(self._temp_path)
+        except FileNotFoundError:
+            pass
+
+class SnapshotStore:
+    """Page bodies stored once per distinct version, zlib-compressed, under their SHA-256
+
+    Every version is one file, ``<root>/<first two hex digits>/<rest>``, so
+    identical bodies share a file across scans and URLs, and concurrent
+    writers of the same version simply replace it with identical bytes.
+    References to versions are kept elsewhere (``scan_history``); callers
+    delete versions nothing refers to anymore. Storing a version that is
+    already there touches its file, and ``delete`` spares files touched
+    within a grace period, so a version another scan is about to refer to
+    again survives a concurrent cleanup.
+    """
+
+    def __init__(self, root: str, level: int = 6):
+        self.root = root
+        self.level = level
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key[2:])
+
+    def _reuse(self, path: str) -> bool:
+        """Touch a stored version for reuse; False if it isn't stored (anymore)"""
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def writer(self) -> SnapshotWriter:
+        """A writer for storing a body piece by piece"""
+        return SnapshotWriter(self)
+
+    def put(self, content: Union[str, bytes]) -> str:
+        """Store a body unless its version is already stored, and return its key"""
+        if isinstance(content, str):
+            content = content.encode('utf-8')
+        key = hashlib.sha256(content).hexdigest()
+        if self._reuse(self.path(key)):
+            return key
+        writer = self.writer()
+        try:
+            writer.write(content)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.commit()
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self.path(key))
+
+    def get(self, key: str) -> Optional[bytes]:
+        """The body stored under a key, or None when it isn't stored
+
+        The compressed file is memory-mapped and decompressed straight from
+        the mapping rather than read into a buffer first.
+        """
+        try:
+            with open(self.path(key), 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                return zlib.decompress(mapped)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, zlib.error) as e:
+            logger.error(f"Failed to read snapshot {key}: {e}")
+            return None
+
+    def delete(self, key: str, grace: float = 0) -> bool:
+        """Remove a stored version unless it was stored or touched within ``grace`` seconds
+
+        The file is renamed away first and put back if a writer touched it
+        before the rename; a writer touching it after the rename finds it
+        gone and stores it anew. Returns whether the version was removed.
+        """
+        path = self.path(key)
+        tombstone = f"{path}.{os.getpid()}-{threading.get_ident()}.deleted"
+        try:
+            if time.time() - os.stat(path).st_mtime < grace:
+                return False
+            os.replace(path, tombstone)
+        except FileNotFoundError:
+            return False
+        if time.time() - os.stat(tombstone).st_mtime < grace:
+            os.replace(tombstone, path)
+            return False
+        os.remove(tombstone)
+        return True
+
+    def keys(self) -> Iterator[str]:
+        """Keys of all stored versions"""
+        for prefix in sorted(os.listdir(self.root)):
+            directory = os.path.join(self.root, prefix)
+            if len(prefix) == 2 and os.path.isdir(directory):
+                for rest in sorted(os.listdir(directory)):
+                    # Skip files being deleted
+                    if '.' not in rest:
+                        yield prefix + rest
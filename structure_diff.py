@@ -0,0 +1,69 @@
+# structure_diff.py - Element and attribute differences of compact structures, from their hash columns
+
+from dataclasses import dataclass
+
+import numpy as np
+
+from structure_format import CompactStructure
+
+@dataclass
+class StructureDiff:
+    """Indexes of differing elements between two CompactStructures
+
+    ``removed`` indexes the old structure, ``added`` the new one, both in
+    document order. ``old_common``/``new_common`` pair the elements present
+    in both, in old document order, and ``text_changed`` and
+    ``attributes_changed`` are masks over those pairs.
+    """
+    removed: np.ndarray
+    added: np.ndarray
+    old_common: np.ndarray
+    new_common: np.ndarray
+    text_changed: np.ndarray
+    attributes_changed: np.ndarray
+
+def _column(values) -> np.ndarray:
+    # Columns are arrays or, for loaded blobs, memoryviews; both are wrapped without copying
+    return np.frombuffer(values, dtype=np.uint64) if len(values) else np.empty(0, dtype=np.uint64)
+
+def diff_compact(old: CompactStructure, new: CompactStructure) -> StructureDiff:
+    """Match elements by path hash and compare their text and attribute hashes
+
+    Elements at the same position with the same path hash match outright;
+    that usually covers the page up to the first inserted or removed
+    element. The rest is matched by sorting the remaining old path hashes
+    once and looking the new ones up with ``np.searchsorted``. No strings
+    are decoded; only the elements in the result need to be materialized
+    afterwards.
+    """
+    old_paths = _column(old.path_hash)
+    new_paths = _column(new.path_hash)
+    shared = min(len(old_paths), len(new_paths))
+    aligned = old_paths[:shared] == new_paths[:shared]
+    prefix = shared if aligned.all() else int(np.argmin(aligned))
+
+    # New index of every old element, or -1
+    old_to_new = np.full(len(old_paths), -1, dtype=np.intp)
+    old_to_new[:prefix] = np.arange(prefix)
+    if prefix < len(old_paths) and prefix < len(new_paths):
+        order = np.argsort(old_paths[prefix:])
+        sorted_paths = old_paths[prefix:][order]
+        rest = new_paths[prefix:]
+        positions = np.minimum(np.searchsorted(sorted_paths, rest), len(sorted_paths) - 1)
+        found = sorted_paths[positions] == rest
+        old_to_new[prefix + order[positions[found]]] = prefix + np.flatnonzero(found)
+
+    old_present = old_to_new >= 0
+    old_common = np.flatnonzero(old_present)
+    new_common = old_to_new[old_common]
+    new_present = np.zeros(len(new_paths), dtype=bool)
+    new_present[new_common] = True
+
+    return StructureDiff(
+        removed=np.flatnonzero(~old_present),
+        added=np.flatnonzero(~new_present),
+        old_common=old_common,
+        new_common=new_common,
+        text_changed=_column(old.text_hash)[old_common] != _column(new.text_hash)[new_common],
+        attributes_changed=_column(old.attr_hash)[old_common] != _column(new.attr_hash)[new_common]
+    )
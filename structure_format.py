@@ -0,0 +1,416 @@
+# structure_format.py - Compact binary representation of extracted page structures
+
+import hashlib
+import json
+import struct
+import sys
+from array import array
+from itertools import accumulate
+from typing import Dict, Iterator, List, Optional, Union
+
+MAGIC = b'HPDS'
+FORMAT_VERSION = 1
+
+# magic, version, byte order, flags, elements, strings, attributes, string bytes, extras bytes
+_HEADER = struct.Struct('<4sHBBIIIII')
+_LITTLE_ENDIAN = 1
+_BIG_ENDIAN = 2
+_FLAG_SUBTREE_HASHES = 1
+# No string contains NUL, so the NUL-joined string data can be split in one go
+_FLAG_SPLITTABLE_STRINGS = 2
+
+# Element dict keys the columns can hold; anything else stays in the JSON form
+_ELEMENT_KEYS = {'tag', 'text', 'tail'}
+
+def hash64(value: str) -> int:
+    """Stable 64-bit hash of a string, the same in every process"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8', 'surrogatepass'), digest_size=8).digest(), 'little')
+
+def node_digest(tag: str, text: Optional[str], tail: Optional[str], attributes: Dict[str, str],
+                child_digests: bytes) -> bytes:
+    """Merkle digest of one node from its own content and its children's concatenated digests"""
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(f"{tag}\x00{text or ''}\x00{tail or ''}\x00".encode('utf-8', 'surrogatepass'))
+    for name, value in sorted(attributes.items()):
+        digest.update(f"{name}\x01{value}\x02".encode('utf-8', 'surrogatepass'))
+    digest.update(child_digests)
+    return digest.digest()
+
+def attributes_hash(attributes: Dict[str, str]) -> int:
+    """Stable 64-bit hash of an attribute dict, independent of attribute order"""
+    digest = hashlib.blake2b(digest_size=8)
+    for name, value in sorted(attributes.items()):
+        digest.update(f"{name}\x01{value}\x02".encode('utf-8', 'surrogatepass'))
+    return int.from_bytes(digest.digest(), 'little')
+
+class ElementRecord:
+    """One element of a CompactStructure"""
+
+    __slots__ = ('xpath', 'tag', 'text', 'tail', 'attributes', 'path_hash', 'text_hash', 'attr_hash')
+
+    def __init__(self, xpath: str, tag: str, text: str, tail: str, attributes: Optional[Dict[str, str]],
+                 path_hash: int, text_hash: int, attr_hash: int):
+        self.xpath = xpath
+        self.tag = tag
+        self.text = text
+        self.tail = tail
+        self.attributes = attributes
+        self.path_hash = path_hash
+        self.text_hash = text_hash
+        self.attr_hash = attr_hash
+
+    def __repr__(self):
+        return f"ElementRecord({self.xpath!r}, tag={self.tag!r}, text={self.text!r})"
+
+class CompactStructure:
+    """Column-oriented page structure with interned strings
+
+    Holds the same information as the structure dict produced by
+    ``HTMLPageDetector.extract_tree_structure`` in flat arrays, one entry per
+    element in document order:
+
+    - ``path_id``, ``tag_id``, ``text_id``, ``tail_id``: indexes into one
+      table of interned strings, so repeated tags, texts and attribute
+      names are stored once
+    - ``attr_offsets`` with ``attr_name_id``/``attr_value_id``: the
+      element's attributes as a slice of two flat arrays
+    - ``path_hash``, ``text_hash``, ``attr_hash``: stable 64-bit hashes for
+      comparing structures without touching the strings
+    - ``subtree_hash``, ``subtree_size``: the Merkle hashes, when present
+
+    Table and form summaries, which are small, travel as a JSON section.
+    ``serialize`` writes a versioned binary blob, and ``load`` reads one back
+    without copying: the columns are memoryviews over the blob and strings
+    are only decoded when asked for. ``to_dict`` gives back the original
+    dict exactly.
+    """
+
+    def __init__(self):
+        self._strings: List[str] = []
+        self._string_ids: Dict[str, int] = {}
+        self._string_offsets = None
+        self._string_data = None
+        self.path_id = array('I')
+        self.tag_id = array('I')
+        self.text_id = array('I')
+        self.tail_id = array('I')
+        self.attr_offsets = array('I', [0])
+        self.attr_name_id = array('I')
+        self.attr_value_id = array('I')
+        self.path_hash = array('Q')
+        self.text_hash = array('Q')
+        self.attr_hash = array('Q')
+        self.subtree_hash = array('Q')
+        self.subtree_size = array('I')
+        self.has_subtree_hashes = False
+        self._splittable_strings = False
+        self.extras: Dict = {}
+
+    # Strings
+
+    def add_unique(self, values: List[str]) -> range:
+        """Append strings known not to repeat, such as XPaths, without interning them; returns their ids"""
+        start = len(self._strings)
+        self._strings.extend(values)
+        return range(start, len(self._strings))
+
+    def intern(self, value: str) -> int:
+        """Id of a string in the string table, adding it if new"""
+        string_id = self._string_ids.get(value)
+        if string_id is None:
+            string_id = self._string_ids[value] = len(self._strings)
+            self._strings.append(value)
+        return string_id
+
+    def string(self, string_id: int) -> str:
+        """Decode one interned string"""
+        if self._string_data is None:
+            return self._strings[string_id]
+        # Strings are stored NUL-separated; offsets point at their starts
+        start, end = self._string_offsets[string_id], self._string_offsets[string_id + 1] - 1
+        return str(self._string_data[start:end], 'utf-8', 'surrogatepass')
+    
+    def strings(self) -> List[str]:
+        """Decode the whole string table"""
+        if self._string_data is None:
+            return list(self._strings)
+        if self._splittable_strings:
+            return str(self._string_data, 'utf-8', 'surrogatepass').split('\0')[:self.string_count]
+        return [self.string(string_id) for string_id in range(self.string_count)]
+
+    @property
+    def string_count(self) -> int:
+        return len(self._strings) if self._string_data is None else len(self._string_offsets) - 1
+
+    # Building
+
+    @classmethod
+    def from_dict(cls, structure: Dict) -> 'CompactStructure':
+        """Build from a structure dict; raises ValueError for shapes the columns can't hold"""
+        compact = cls()
+        elements = structure.get('elements', {})
+        attributes = structure.get('attributes', {})
+        subtree_hashes = structure.get('subtree_hashes')
+        if subtree_hashes is not None and list(subtree_hashes) != list(elements):
+            raise ValueError("subtree hashes don't match the elements")
+
+        intern = compact.intern
+        text_hashes: Dict[int, int] = {}
+        path_ids, tag_ids, text_ids, tail_ids = [], [], [], []
+        path_hashes, text_hash_column, attr_hashes = [], [], []
+        attr_offsets, attr_names, attr_values = [0], [], []
+
+        for xpath, element in elements.items():
+            if element.keys() != _ELEMENT_KEYS:
+                raise ValueError(f"element {xpath} has an unsupported shape")
+            tag, text, tail = element['tag'], element['text'], element['tail']
+            if type(tag) is not str or type(text) is not str or type(tail) is not str:
+                raise ValueError(f"element {xpath} has non-string values")
+
+            text_id = intern(text)
+            path_ids.append(intern(xpath))
+            tag_ids.append(intern(tag))
+            text_ids.append(text_id)
+            tail_ids.append(intern(tail))
+            # Paths are unique, texts repeat a lot
+            path_hashes.append(hash64(xpath))
+            text_hash = text_hashes.get(text_id)
+            if text_hash is None:
+                text_hash = text_hashes[text_id] = hash64(text)
+            text_hash_column.append(text_hash)
+
+            element_attributes = attributes.get(xpath)
+            if element_attributes:
+                for name, value in element_attributes.items():
+                    if type(name) is not str or type(value) is not str:
+                        raise ValueError(f"attribute {name!r} of {xpath} is not a string")
+                    attr_names.append(intern(name))
+                    attr_values.append(intern(value))
+                attr_hashes.append(attributes_hash(element_attributes))
+            else:
+                attr_hashes.append(0)
+            attr_offsets.append(len(attr_names))
+
+        compact.path_id = array('I', path_ids)
+        compact.tag_id = array('I', tag_ids)
+        compact.text_id = array('I', text_ids)
+        compact.tail_id = array('I', tail_ids)
+        compact.path_hash = array('Q', path_hashes)
+        compact.text_hash = array('Q', text_hash_column)
+        compact.attr_hash = array('Q', attr_hashes)
+        compact.attr_offsets = array('I', attr_offsets)
+        compact.attr_name_id = array('I', attr_names)
+        compact.attr_value_id = array('I', attr_values)
+
+        if subtree_hashes is not None:
+            compact.subtree_hash = array('Q', [int(digest, 16) for digest, _ in subtree_hashes.values()])
+            compact.subtree_size = array('I', [size for _, size in subtree_hashes.values()])
+        compact.has_subtree_hashes = subtree_hashes is not None
+        extras = {key: value for key, value in structure.items()
+                  if key not in ('elements', 'attributes', 'subtree_hashes')}
+        # Attribute entries without an element (or empty ones) don't fit the columns
+        leftover = {xpath: attrs for xpath, attrs in attributes.items() if xpath not in elements or not attrs}
+        if leftover:
+            extras['__attributes__'] = leftover
+        compact.extras = extras
+        return compact
+
+    # Reading
+
+    def __len__(self) -> int:
+        return len(self.path_id)
+
+    def xpath(self, index: int) -> str:
+        return self.string(self.path_id[index])
+
+    def attributes(self, index: int) -> Optional[Dict[str, str]]:
+        """Attributes of one element, or None if it has none"""
+        start, end = self.attr_offsets[index], self.attr_offsets[index + 1]
+        if start == end:
+            return None
+        return {
+            self.string(self.attr_name_id[position]): self.string(self.attr_value_id[position])
+            for position in range(start, end)
+        }
+
+    def record(self, index: int) -> ElementRecord:
+        """Materialize one element"""
+        return ElementRecord(
+            self.string(self.path_id[index]),
+            self.string(self.tag_id[index]),
+            self.string(self.text_id[index]),
+            self.string(self.tail_id[index]),
+            self.attributes(index),
+            self.path_hash[index],
+            self.text_hash[index],
+            self.attr_hash[index]
+        )
+
+    def __iter__(self) -> Iterator[ElementRecord]:
+        for index in range(len(self)):
+            yield self.record(index)
+
+    def to_dict(self) -> Dict:
+        """Convert back to the structure dict the detector has always used"""
+        strings = self.strings()
+        paths = [strings[path_id] for path_id in self.path_id.tolist()]
+        elements = {
+            xpath: {'tag': strings[tag_id], 'text': strings[text_id], 'tail': strings[tail_id]}
+            for xpath, tag_id, text_id, tail_id in zip(
+                paths, self.tag_id.tolist(), self.text_id.tolist(), self.tail_id.tolist()
+            )
+        }
+
+        attributes = {}
+        offsets = self.attr_offsets.tolist()
+        names = self.attr_name_id.tolist()
+        values = self.attr_value_id.tolist()
+        for index, xpath in enumerate(paths):
+            start, end = offsets[index], offsets[index + 1]
+            if start != end:
+                attributes[xpath] = {
+                    strings[names[position]]: strings[values[position]] for position in range(start, end)
+                }
+
+        subtree_hashes = None
+        if self.has_subtree_hashes:
+            subtree_hashes = {
+                xpath: [f"{digest:016x}", size]
+                for xpath, digest, size in zip(paths, self.subtree_hash.tolist(), self.subtree_size.tolist())
+            }
+
+        extras = dict(self.extras)
+        leftover = extras.pop('__attributes__', None)
+        if leftover:
+            attributes.update(leftover)
+
+        structure = {'elements': elements, 'attributes': attributes}
+        for key in ('tables', 'forms'):
+            if key in extras:
+                structure[key] = extras.pop(key)
+        structure.update(extras)
+        if subtree_hashes is not None:
+            structure['subtree_hashes'] = subtree_hashes
+        return structure
+
+    # Binary format
+
+    def serialize(self) -> bytes:
+        """Write the versioned binary form"""
+        strings = self.strings()
+        joined = '\0'.join(strings) + '\0'
+        if joined.isascii():
+            string_data = joined.encode('ascii')
+            lengths = map(len, strings)
+        else:
+            string_data = joined.encode('utf-8', 'surrogatepass')
+            lengths = (len(value.encode('utf-8', 'surrogatepass')) for value in strings)
+        del joined
+        string_offsets = array('I', accumulate((length + 1 for length in lengths), initial=0))
+        splittable = string_data.count(b'\0') == len(strings)
+        extras = json.dumps(self.extras, separators=(',', ':')).encode()
+
+        header = _HEADER.pack(
+            MAGIC, FORMAT_VERSION,
+            _LITTLE_ENDIAN if sys.byteorder == 'little' else _BIG_ENDIAN,
+            (_FLAG_SUBTREE_HASHES if self.has_subtree_hashes else 0) |
+            (_FLAG_SPLITTABLE_STRINGS if splittable else 0),
+            len(self), self.string_count, len(self.attr_name_id), len(string_data), len(extras)
+        )
+        parts = [header]
+        for section in self._sections(string_offsets, string_data):
+            parts.append(bytes(section))
+            # Pad every section to 8 bytes so the 64-bit columns stay aligned
+            parts.append(b'\0' * (-sum(len(part) for part in parts) % 8))
+        parts.append(extras)
+        return b''.join(parts)
+
+    def _sections(self, string_offsets, string_data) -> List:
+        sections = [string_offsets, string_data, self.path_id, self.tag_id, self.text_id, self.tail_id,
+                    self.attr_offsets, self.attr_name_id, self.attr_value_id,
+                    self.path_hash, self.text_hash, self.attr_hash]
+        if self.has_subtree_hashes:
+            sections += [self.subtree_hash, self.subtree_size]
+        return sections
+
+    @classmethod
+    def load(cls, blob: Union[bytes, memoryview]) -> 'CompactStructure':
+        """Read the binary form; columns are views into ``blob``, not copies"""
+        view = memoryview(blob)
+        magic, version, byte_order, flags, count, string_count, attr_count, string_bytes, extras_bytes = \
+            _HEADER.unpack_from(view)
+        if magic != MAGIC:
+            raise ValueError("not a compact structure")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"unsupported compact structure version {version}")
+        native = byte_order == (_LITTLE_ENDIAN if sys.byteorder == 'little' else _BIG_ENDIAN)
+
+        compact = cls()
+        offset = _HEADER.size
+
+        def take(typecode: str, length: int):
+            nonlocal offset
+            size = length * (8 if typecode == 'Q' else 4 if typecode == 'I' else 1)
+            chunk = view[offset:offset + size]
+            offset += size
+            offset += -offset % 8
+            if typecode == 'B':
+                return chunk
+            if native:
+                return chunk.cast(typecode)
+            # Foreign byte order: fall back to a swapped copy
+            column = array(typecode)
+            column.frombytes(chunk)
+            column.byteswap()
+            return column
+
+        compact._string_offsets = take('I', string_count + 1)
+        compact._string_data = take('B', string_bytes)
+        compact.path_id = take('I', count)
+        compact.tag_id = take('I', count)
+        compact.text_id = take('I', count)
+        compact.tail_id = take('I', count)
+        compact.attr_offsets = take('I', count + 1)
+        compact.attr_name_id = take('I', attr_count)
+        compact.attr_value_id = take('I', attr_count)
+        compact.path_hash = take('Q', count)
+        compact.text_hash = take('Q', count)
+        compact.attr_hash = take('Q', count)
+        compact.has_subtree_hashes = bool(flags & _FLAG_SUBTREE_HASHES)
+        compact._splittable_strings = bool(flags & _FLAG_SPLITTABLE_STRINGS)
+        if compact.has_subtree_hashes:
+            compact.subtree_hash = take('Q', count)
+            compact.subtree_size = take('I', count)
+        compact.extras = json.loads(bytes(view[offset:offset + extras_bytes]))
+        return compact
+
+def is_compact(blob) -> bool:
+    """Check whether a stored structure is in the compact binary format"""
+    return isinstance(blob, (bytes, bytearray, memoryview)) and bytes(blob[:4]) == MAGIC
+
+def dump_structure(structure: Dict, compact: bool = True) -> Union[bytes, str]:
+    """Serialize a structure dict for storage, as compact binary when possible and JSON otherwise"""
+    if compact:
+        try:
+            return CompactStructure.from_dict(structure).serialize()
+        except ValueError:
+            pass
+    return json.dumps(structure)
+
+def load_structure(blob: Union[bytes, str]) -> Dict:
+    """Read a stored structure in either format back into a structure dict"""
+    if is_compact(blob):
+        return CompactStructure.load(blob).to_dict()
+    if isinstance(blob, (bytes, bytearray)):
+        blob = blob.decode()
+    return json.loads(blob)
+
+def load_compact(blob: Union[bytes, str]) -> Union[CompactStructure, Dict]:
+    """Read a stored structure as a CompactStructure, or as a dict if it doesn't fit the columns"""
+    if is_compact(blob):
+        return CompactStructure.load(blob)
+    structure = load_structure(blob)
+    try:
+        return CompactStructure.from_dict(structure)
+    except ValueError:
+        return structure
@@ -0,0 +1,76 @@
+# structure_history.py - Deltas between consecutive structure versions of a page
+
+import json
+import zlib
+from typing import Dict, List, Union
+
+# A delta between identical structures
+EMPTY_DELTA = b''
+
+def _section_delta(old: Dict, new: Dict) -> Dict:
+    """Changes of one XPath-keyed section: its key order as runs over the old keys, and the new values
+
+    ``runs`` lists ``[start, length]`` for consecutive old keys kept in
+    place and bare keys for keys that are new or moved. ``values`` holds
+    the value of every new key and every kept key whose value changed.
+    """
+    positions = {key: position for position, key in enumerate(old)}
+    runs: List[Union[List[int], str]] = []
+    values = {}
+    for key, value in new.items():
+        position = positions.get(key)
+        if position is None:
+            runs.append(key)
+            values[key] = value
+            continue
+        if old[key] != value:
+            values[key] = value
+        last = runs[-1] if runs else None
+        if isinstance(last, list) and last[0] + last[1] == position:
+            last[1] += 1
+        else:
+            runs.append([position, 1])
+    return {'runs': runs, 'values': values}
+
+def encode_delta(old: Dict, new: Dict) -> bytes:
+    """Delta that turns structure dict ``old`` into ``new``, compressed
+
+    Sections (``elements``, ``attributes``, ``tables``, ...) are dicts
+    keyed by XPath, so a delta holds only the entries that differ and
+    enough of the key order to restore the new one exactly. Other values
+    are replaced whole when they differ.
+    """
+    if old == new:
+        return EMPTY_DELTA
+    delta = {'sections': {}, 'values': {}, 'order': list(new)}
+    for name, value in new.items():
+        base = old.get(name)
+        if base == value:
+            continue
+        if isinstance(value, dict) and isinstance(base, dict):
+            delta['sections'][name] = _section_delta(base, value)
+        else:
+            delta['values'][name] = value
+    return zlib.compress(json.dumps(delta, separators=(',', ':')).encode(), 6)
+
+def apply_delta(old: Dict, delta: bytes) -> Dict:
+    """Rebuild the ``new`` structure dict of ``delta = encode_delta(old, new)`` from ``old``"""
+    if delta == EMPTY_DELTA:
+        return old
+    delta = json.loads(zlib.decompress(delta))
+    structure = {}
+    for name in delta['order']:
+        if name in delta['values']:
+            structure[name] = delta['values'][name]
+        elif name in delta['sections']:
+            base = old[name]
+            keys = list(base)
+            values = delta['sections'][name]['values']
+            section = {}
+            for run in delta['sections'][name]['runs']:
+                for key in ([run] if isinstance(run, str) else keys[run[0]:run[0] + run[1]]):
+                    section[key] = values[key] if key in values else base[key]
+            structure[name] = section
+        else:
+            structure[name] = old[name]
+    return structure
@@ -0,0 +1,192 @@
+# table_diff.py - Column-oriented table contents and a vectorized row/cell diff
+
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from structure_format import hash64
+
+# Separates cells when hashing a row
+_CELL_SEPARATOR = '\x1f'
+
+def cell_text(text: str) -> str:
+    """Cell content with whitespace collapsed"""
+    return ' '.join(text.split())
+
+def build_table_data(rows: Sequence[Tuple[bool, List[str]]]) -> Dict:
+    """Turn a table's rows into its stored column-oriented form
+
+    ``rows`` are (is header row, cell texts) in document order. Column names
+    come from the last header row; data rows are padded to the widest row.
+    Each data row gets a stable 64-bit hash, hex encoded like the subtree
+    hashes.
+    """
+    header = []
+    data = []
+    for is_header, cells in rows:
+        if is_header:
+            header = cells
+        else:
+            data.append(cells)
+
+    width = max([len(header)] + [len(cells) for cells in data])
+    columns = [header[index] if index < len(header) and header[index] else f"column {index + 1}"
+               for index in range(width)]
+    return {
+        'columns': columns,
+        'cells': [[cells[index] if index < len(cells) else '' for cells in data] for index in range(width)],
+        'row_hashes': [f"{hash64(_CELL_SEPARATOR.join(cells)):016x}" for cells in data]
+    }
+
+@dataclass
+class TableDiff:
+    """Row and cell differences between two versions of a table
+
+    Row numbers index the data rows of the old (``deleted``) or new
+    (``inserted``) table. ``modified`` holds (old row, new row, changed
+    columns as (old index, new index)). ``old_key_column`` and
+    ``key_column`` are the index of the column rows were matched by in the
+    old and new table, or None if they were matched by content and position.
+    """
+    key_column: Optional[int] = None
+    old_key_column: Optional[int] = None
+    deleted: List[int] = field(default_factory=list)
+    inserted: List[int] = field(default_factory=list)
+    modified: List[Tuple[int, int, List[Tuple[int, int]]]] = field(default_factory=list)
+
+    def __bool__(self):
+        return bool(self.deleted or self.inserted or self.modified)
+
+def _row_hashes(table: Dict) -> np.ndarray:
+    return np.frombuffer(bytes.fromhex(''.join(table['row_hashes'])), dtype='>u8').astype(np.uint64)
+
+def _column_hashes(column: List[str]) -> np.ndarray:
+    # Both sides are hashed in this process, so Python's own string hash is stable enough
+    return np.fromiter(map(hash, column), dtype=np.int64, count=len(column)).view(np.uint64)
+
+def _occurrence_keys(hashes: np.ndarray) -> np.ndarray:
+    """Make hashes unique by mixing in how often the same hash occurred before"""
+    order = np.argsort(hashes, kind='stable')
+    ordered = hashes[order]
+    starts = np.empty(len(ordered), dtype=bool)
+    starts[:1] = True
+    starts[1:] = ordered[1:] != ordered[:-1]
+    positions = np.arange(len(ordered))
+    group_start = np.maximum.accumulate(np.where(starts, positions, 0))
+    occurrence = np.empty(len(ordered), dtype=np.uint64)
+    occurrence[order] = (positions - group_start).astype(np.uint64)
+    return hashes ^ (occurrence * np.uint64(0x9E3779B97F4A7C15))
+
+def _column_pairs(old: Dict, new: Dict) -> List[Tuple[int, int]]:
+    """(old index, new index) of the columns both tables have, paired by name in order of occurrence"""
+    positions: Dict[str, List[int]] = {}
+    for index, name in enumerate(new['columns']):
+        positions.setdefault(name, []).append(index)
+    pairs = []
+    for index, name in enumerate(old['columns']):
+        if positions.get(name):
+            pairs.append((index, positions[name].pop(0)))
+    return pairs
+
+def _resolve_key(old: Dict, new: Dict, key: Union[str, int, None],
+                 pairs: List[Tuple[int, int]]) -> Optional[Tuple[int, int]]:
+    """Old and new index of the key column: the configured one, else the first column unique on both sides"""
+    if isinstance(key, int):
+        # A configured index names the column at that position in the new table
+        if not 0 <= key < len(new['columns']):
+            return None
+        return next((pair for pair in pairs if pair[1] == key), None)
+    if isinstance(key, str):
+        if key not in old['columns'] or key not in new['columns']:
+            return None
+        return old['columns'].index(key), new['columns'].index(key)
+
+    for old_index, new_index in pairs:
+        for column in (old['cells'][old_index], new['cells'][new_index]):
+            if not all(column) or len(np.unique(_column_hashes(column))) != len(column):
+                break
+        else:
+            return old_index, new_index
+    return None
+
+def diff_tables(old: Dict, new: Dict, key: Union[str, int, None] = None) -> TableDiff:
+    """Diff two stored tables by key column, or by row content and position
+
+    With a key column (configured, or found as the first column whose
+    values are unique in both versions) rows with the same key are paired
+    and compared. Without one, identical rows are paired first and the rest
+    in document order. Columns are paired by name, so a table whose columns
+    were reordered still keys and compares its rows by the right cells.
+    Everything runs on 64-bit hash arrays, so tables with
+    hundreds of thousands of rows diff in well under a second.
+    """
+    result = TableDiff()
+    old_rows = _row_hashes(old)
+    new_rows = _row_hashes(new)
+    if len(old_rows) == len(new_rows) and np.array_equal(old_rows, new_rows):
+        return result
+
+    pairs = _column_pairs(old, new)
+    key_columns = _resolve_key(old, new, key, pairs) if len(old_rows) and len(new_rows) else None
+    if key_columns is not None:
+        old_keys = _column_hashes(old['cells'][key_columns[0]])
+        new_keys = _column_hashes(new['cells'][key_columns[1]])
+        if len(np.unique(old_keys)) != len(old_keys) or len(np.unique(new_keys)) != len(new_keys):
+            key_columns = None
+    if key_columns is not None:
+        result.old_key_column, result.key_column = key_columns
+
+    if key_columns is not None:
+        _, old_index, new_index = np.intersect1d(old_keys, new_keys, assume_unique=True, return_indices=True)
+        changed = old_rows[old_index] != new_rows[new_index]
+        pair_old, pair_new = old_index[changed], new_index[changed]
+    else:
+        _, old_index, new_index = np.intersect1d(
+            _occurrence_keys(old_rows), _occurrence_keys(new_rows), assume_unique=True, return_indices=True
+        )
+        pair_old = pair_new = np.empty(0, dtype=np.intp)
+
+    old_unmatched = np.ones(len(old_rows), dtype=bool)
+    old_unmatched[old_index] = False
+    new_unmatched = np.ones(len(new_rows), dtype=bool)
+    new_unmatched[new_index] = False
+    deleted = np.flatnonzero(old_unmatched)
+    inserted = np.flatnonzero(new_unmatched)
+
+    if key_columns is None:
+        # Rows that changed content: pair what is left over in document order
+        paired = min(len(deleted), len(inserted))
+        pair_old, pair_new = deleted[:paired], inserted[:paired]
+        deleted, inserted = deleted[paired:], inserted[paired:]
+
+    order = np.argsort(pair_new, kind='stable')
+    pair_old, pair_new = pair_old[order], pair_new[order]
+    # Rows of tables whose columns were only reordered differ in hash but not in any cell
+    reordered = len(pairs) == len(old['columns']) == len(new['columns'])
+    if len(pair_new):
+        differs = np.empty((len(pair_new), len(pairs)), dtype=bool)
+        for position, (old_column, new_column) in enumerate(pairs):
+            old_cells = np.asarray(old['cells'][old_column], dtype=object)[pair_old]
+            new_cells = np.asarray(new['cells'][new_column], dtype=object)[pair_new]
+            differs[:, position] = old_cells != new_cells
+        for row, (old_row, new_row) in enumerate(zip(pair_old.tolist(), pair_new.tolist())):
+            columns = [pairs[position] for position in np.flatnonzero(differs[row]).tolist()]
+            if columns or not reordered:
+                result.modified.append((old_row, new_row, columns))
+
+    result.deleted = deleted.tolist()
+    result.inserted = inserted.tolist()
+    return result
+
+def row_values(table: Dict, row: int) -> List[str]:
+    """Cells of one data row"""
+    return [column[row] for column in table['cells']]
+
+def xpath_literal(value: str) -> str:
+    """Quote a string as an XPath 1.0 literal, with concat() if it holds both kinds of quote"""
+    if "'" not in value:
+        return f"'{value}'"
+    if '"' not in value:
+        return f'"{value}"'
+    return 'concat(' + ', "\'", '.join(f"'{part}'" for part in value.split("'")) + ')'
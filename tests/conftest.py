@@ -0,0 +1,32 @@
+# conftest.py - Shared setup of the detector tests
+
+import logging
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# A root handler turns the detector's module-level logging.basicConfig into a
+# no-op, so tests don't write html_detector.log into the checkout
+logging.getLogger().addHandler(logging.NullHandler())
+
+from fixture_server import FixtureServer, FixtureSite
+
+@pytest.fixture
+def detector_config(tmp_path):
+    """Detector config with its database in a temporary directory and no waiting between requests"""
+    return {
+        'db_path': str(tmp_path / 'detector.db'),
+        'host_delay': 0,
+        'retry_delay': 0,
+        'max_retries': 0
+    }
+
+@pytest.fixture
+def fixture_server():
+    """A local fixture server whose pages only change when a test bumps their version"""
+    server = FixtureServer(FixtureSite(page_size=2000, change_probability=0, seed=1)).start()
+    yield server
+    server.stop()
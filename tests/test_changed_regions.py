@@ -0,0 +1,57 @@
+# test_changed_regions.py - Changed subtrees of CompactStructures against the dict walk
+
+import pytest
+
+from html_page_detector import PageAnalyzer
+from structure_format import CompactStructure, dump_structure, load_compact
+
+PAGE = """<html><body>
+<div id="nav"><a href="/">Home</a><a href="/news">News</a></div>
+<div class="content"><h1>Title</h1><p>First <b>bold</b></p><p>Second</p><ul><li>One</li><li>Two</li></ul></div>
+<div id="footer"><span>Contact</span></div>
+</body></html>"""
+
+EDITS = {
+    'text': [('<p>Second</p>', '<p>Changed</p>')],
+    'nested text': [('<b>bold</b>', '<b>bolder</b>')],
+    'attribute': [('href="/news"', 'href="/latest"')],
+    'inserted sibling': [('<p>First', '<p>New</p><p>First')],
+    'appended children': [('<li>Two</li>', '<li>Two</li><li>Three</li><li>Four</li>')],
+    'removed subtree': [('<ul><li>One</li><li>Two</li></ul>', '')],
+    'removed and changed': [('<div id="nav"><a href="/">Home</a><a href="/news">News</a></div>', ''),
+                            ('<span>Contact</span>', '<span>Write to us</span>')],
+    'scattered': [('Home', 'Start'), ('<li>Two</li>', '<li>2</li><li>3</li>'), ('Contact', 'Help')],
+}
+
+def edited(edit):
+    html = PAGE
+    for old, new in EDITS[edit]:
+        html = html.replace(old, new)
+    return html
+
+@pytest.mark.parametrize('edit', sorted(EDITS))
+def test_compact_regions_match_the_dict_regions(edit):
+    analyzer = PageAnalyzer({})
+    old = analyzer.extract_xpath_structure(PAGE)
+    new = analyzer.extract_xpath_structure(edited(edit))
+
+    expected = analyzer.changed_regions(old, new)
+    assert expected
+    assert analyzer.changed_regions(CompactStructure.from_dict(old), CompactStructure.from_dict(new)) == expected
+    loaded = load_compact(dump_structure(old)), load_compact(dump_structure(new))
+    assert analyzer.changed_regions(*loaded) == expected
+
+def test_compact_walk_decodes_only_the_regions(monkeypatch):
+    analyzer = PageAnalyzer({})
+    old = load_compact(dump_structure(analyzer.extract_xpath_structure(PAGE)))
+    new = load_compact(dump_structure(analyzer.extract_xpath_structure(edited('nested text'))))
+    monkeypatch.setattr(CompactStructure, 'strings', lambda self: pytest.fail('decoded the string table'))
+
+    assert analyzer.changed_regions(old, new) == ['/html/body/div[2]/p[1]/b']
+
+def test_regions_need_subtree_hashes_on_both_sides():
+    analyzer = PageAnalyzer({})
+    old = CompactStructure.from_dict(PageAnalyzer({'subtree_hashes': False}).extract_xpath_structure(PAGE))
+    new = CompactStructure.from_dict(analyzer.extract_xpath_structure(edited('text')))
+
+    assert analyzer.changed_regions(old, new) == []
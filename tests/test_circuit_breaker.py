@@ -0,0 +1,135 @@
+# test_circuit_breaker.py - Circuit breaker transitions and their effect on fetches
+
+import socket
+import time
+
+import pytest
+
+from fixture_server import FixtureServer, FixtureSite
+from html_page_detector import CircuitBreaker, DatabaseManager, HTMLPageDetector
+
+HOST = 'example.com'
+
+@pytest.fixture
+def db_manager(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / 'detector.db'))
+    yield db_manager
+    db_manager.close()
+
+def open_breaker(breaker: CircuitBreaker):
+    for _ in range(breaker.threshold):
+        breaker.record_failure(HOST)
+
+def test_opens_after_threshold_failures(db_manager):
+    breaker = CircuitBreaker(db_manager, threshold=3, cooldown=60)
+    breaker.record_failure(HOST)
+    breaker.record_failure(HOST)
+    assert breaker.allow(HOST) and not breaker.is_open(HOST)
+
+    breaker.record_failure(HOST)
+    assert breaker.is_open(HOST) and not breaker.allow(HOST)
+    assert breaker.allow('other.example.com')
+
+def test_success_resets_the_failure_count(db_manager):
+    breaker = CircuitBreaker(db_manager, threshold=2, cooldown=60)
+    breaker.record_failure(HOST)
+    breaker.record_success(HOST)
+    breaker.record_failure(HOST)
+
+    assert not breaker.is_open(HOST)
+    assert db_manager.get_host_breakers() == {HOST: (1, None)}
+
+def test_open_state_survives_a_restart(db_manager):
+    open_breaker(CircuitBreaker(db_manager, threshold=2, cooldown=60))
+
+    assert not CircuitBreaker(db_manager, threshold=2, cooldown=60).allow(HOST)
+
+def test_half_open_admits_a_single_probe(db_manager):
+    breaker = CircuitBreaker(db_manager, threshold=2, cooldown=0.2)
+    open_breaker(breaker)
+    time.sleep(0.25)
+
+    assert breaker.allow(HOST)
+    assert not breaker.allow(HOST) and not breaker.allow(HOST)
+
+def test_successful_probe_closes(db_manager):
+    breaker = CircuitBreaker(db_manager, threshold=2, cooldown=0.2)
+    open_breaker(breaker)
+    time.sleep(0.25)
+    assert breaker.allow(HOST)
+
+    breaker.record_success(HOST)
+    assert breaker.allow(HOST) and breaker.allow(HOST)
+    assert db_manager.get_host_breakers() == {}
+
+def test_failed_probe_reopens(db_manager):
+    breaker = CircuitBreaker(db_manager, threshold=2, cooldown=0.2)
+    open_breaker(breaker)
+    time.sleep(0.25)
+    assert breaker.allow(HOST)
+
+    breaker.record_failure(HOST)
+    assert breaker.is_open(HOST) and not breaker.allow(HOST)
+
+def test_released_probe_lets_the_next_request_probe(db_manager):
+    breaker = CircuitBreaker(db_manager, threshold=2, cooldown=0.2)
+    open_breaker(breaker)
+    time.sleep(0.25)
+    assert breaker.allow(HOST)
+
+    breaker.release(HOST)
+    assert breaker.allow(HOST)
+
+def test_abandoned_probe_is_given_up_after_a_cooldown(db_manager):
+    breaker = CircuitBreaker(db_manager, threshold=2, cooldown=0.2)
+    open_breaker(breaker)
+    time.sleep(0.25)
+    assert breaker.allow(HOST)
+
+    time.sleep(0.25)
+    assert breaker.allow(HOST)
+
+def closed_port_url() -> str:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}/"
+
+def test_fetch_counts_one_failure_after_its_retries(detector_config):
+    detector = HTMLPageDetector({**detector_config, 'max_retries': 3, 'breaker_threshold': 2})
+    url = closed_port_url()
+    host = url.split('/')[2]
+
+    assert detector.fetch(url).error
+    assert detector.db_manager.get_host_breakers()[host][0] == 1
+    assert not detector.circuit_breaker.is_open(host)
+
+    detector.fetch(url)
+    assert detector.circuit_breaker.is_open(host)
+    assert 'circuit breaker open' in detector.fetch(url).error
+    detector.close()
+
+def test_http_errors_dont_count_against_the_host(detector_config):
+    server = FixtureServer(FixtureSite(page_size=2000, change_probability=0, error_rate=1.0, seed=1)).start()
+    detector = HTMLPageDetector({**detector_config, 'max_retries': 1, 'breaker_threshold': 1})
+
+    fetched = detector.fetch(server.url(1))
+    detector.close()
+    server.stop()
+
+    assert fetched.status_code == 500
+    assert not detector.circuit_breaker.is_open(server.base_url.split('/')[2])
+
+def test_retries_wait_for_the_host_rate_limit(detector_config):
+    server = FixtureServer(FixtureSite(page_size=2000, change_probability=0, error_rate=1.0, seed=1)).start()
+    detector = HTMLPageDetector({**detector_config, 'max_retries': 2, 'host_delay': 0.3})
+
+    start = time.monotonic()
+    result, = detector.scan_urls([server.url(1)])
+    elapsed = time.monotonic() - start
+    detector.close()
+    server.stop()
+
+    assert not result.success and server.site.stats['requests'] == 3
+    # The scan engine takes the first request's token from a full bucket; each retry waits for the next one
+    assert elapsed >= 0.55
@@ -0,0 +1,77 @@
+# test_coalesce.py - Bounding the changes of one scan to max_changes_per_scan
+
+from datetime import datetime
+
+from html_page_detector import SAMPLE_VALUE_LENGTH, ChangeDetails, PageAnalyzer
+
+NOW = datetime(2024, 5, 1, 12, 0)
+
+def change(xpath, change_type='element_text_changed', old='old', new='new', element_type='p'):
+    return ChangeDetails(change_type=change_type, xpath=xpath, old_value=old, new_value=new,
+                         element_type=element_type, timestamp=NOW)
+
+def coalesce(changes, cap=5, sample_size=5):
+    return PageAnalyzer({'max_changes_per_scan': cap, 'change_sample_size': sample_size}).coalesce_changes(changes)
+
+def test_changes_within_the_cap_are_kept():
+    changes = [change(f'/html/body/p[{index}]') for index in range(1, 6)]
+
+    assert coalesce(changes) is changes
+
+def test_sibling_edits_collapse_to_their_common_ancestor():
+    changes = [change(f'/html/body/div[{index}]/p', old=f'old {index}', new=f'new {index}')
+               for index in range(1, 51)]
+
+    [group] = coalesce(changes)
+
+    assert (group.change_type, group.xpath, group.count, group.element_type) == (
+        'element_text_changed', '/html/body', 50, 'p'
+    )
+    assert group.old_value is None and group.new_value is None
+    assert group.sample == [{'xpath': f'/html/body/div[{index}]/p', 'old_value': f'old {index}',
+                             'new_value': f'new {index}'} for index in range(1, 6)]
+
+def test_groups_stay_as_deep_as_the_cap_allows():
+    changes = [change(f'/html/body/section[{section}]/ul/li[{item}]')
+               for section in range(1, 4) for item in range(1, 21)]
+
+    groups = coalesce(changes, cap=3)
+
+    assert [(group.xpath, group.count) for group in groups] == [
+        (f'/html/body/section[{section}]/ul', 20) for section in range(1, 4)
+    ]
+
+def test_change_types_are_never_merged():
+    changes = ([change(f'/html/body/p[{index}]') for index in range(1, 11)] +
+               [change(f'/html/body/p[{index}]/@class', 'attribute_modified', element_type='attribute')
+                for index in range(1, 11)] +
+               [change('/html/body/div', 'element_removed')])
+
+    groups = coalesce(changes, cap=3)
+
+    assert [(group.change_type, group.xpath, group.count) for group in groups] == [
+        ('element_text_changed', '/html/body', 10),
+        ('attribute_modified', '/html/body', 10),
+        ('element_removed', '/html/body/div', 1),
+    ]
+    # A group of one keeps its change as it was
+    assert groups[2] is changes[-1]
+
+def test_samples_are_capped_and_clipped():
+    long_value = 'x' * (SAMPLE_VALUE_LENGTH + 50)
+    changes = [change(f'/html/body/p[{index}]', old=long_value) for index in range(1, 21)]
+
+    [group] = coalesce(changes, cap=1, sample_size=3)
+
+    assert group.count == 20 and len(group.sample) == 3
+    assert group.sample[0]['old_value'] == 'x' * SAMPLE_VALUE_LENGTH + '...'
+
+def test_counts_of_coalesced_changes_add_up():
+    changes = [change(f'/html/body/p[{index}]') for index in range(1, 11)]
+    changes[0].count = 7
+
+    [group] = coalesce(changes, cap=1)
+
+    assert group.count == 16
+    assert group.element_type == 'p'
+    assert coalesce(changes + [change('/html/body/span', element_type='span')], cap=1)[0].element_type == 'mixed'
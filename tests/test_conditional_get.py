@@ -0,0 +1,52 @@
+# test_conditional_get.py - Revalidation of unchanged pages with conditional GETs
+
+import pytest
+
+from html_page_detector import HTMLPageDetector
+
+@pytest.fixture
+def detector(detector_config):
+    detector = HTMLPageDetector(detector_config)
+    yield detector
+    detector.close()
+
+def bump_version(server, number: int):
+    server.site.versions[f"/page/{number}"][0] += 1
+
+def test_unchanged_page_is_revalidated_with_etag(detector, fixture_server):
+    url = fixture_server.url(1)
+    first = detector.scan(url)
+    assert first.success and not first.not_modified
+
+    validators = detector.db_manager.get_last_validators(url)
+    assert validators['etag']
+
+    second = detector.scan(url)
+    assert second.success and second.not_modified and not second.changed
+    assert fixture_server.site.stats['not_modified'] == 1
+    # The stored validators are kept for the next revalidation
+    assert detector.db_manager.get_last_validators(url) == validators
+
+def test_changed_page_is_fetched_in_full(detector, fixture_server):
+    url = fixture_server.url(2)
+    detector.scan(url)
+    bump_version(fixture_server, 2)
+
+    result = detector.scan(url)
+    assert result.success and not result.not_modified and result.changed
+    assert fixture_server.site.stats['not_modified'] == 0
+
+def test_last_modified_alone_revalidates(detector, fixture_server):
+    fixture_server.site.etag = False
+    url = fixture_server.url(3)
+    detector.scan(url)
+
+    assert detector.db_manager.get_last_validators(url)['etag'] is None
+    assert detector.scan(url).not_modified
+
+def test_fetch_without_validators_is_unconditional(detector, fixture_server):
+    url = fixture_server.url(4)
+    detector.scan(url)
+
+    fetched = detector.fetch(url)
+    assert fetched.status_code == 200 and not fetched.not_modified and fetched.content
@@ -0,0 +1,165 @@
+# test_database.py - Schema creation and migration of the scan database
+
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from html_page_detector import DatabaseManager, HTMLPageDetector
+
+# Schema of databases created before the first migration
+BASE_SCHEMA = [
+    '''
+    CREATE TABLE scan_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        url TEXT NOT NULL,
+        scan_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        html_hash TEXT NOT NULL,
+        xpath_structure TEXT NOT NULL,
+        changes_detected INTEGER DEFAULT 0
+    )
+    ''',
+    '''
+    CREATE TABLE detected_changes (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        scan_id INTEGER,
+        change_type TEXT NOT NULL,
+        xpath TEXT NOT NULL,
+        old_value TEXT,
+        new_value TEXT,
+        element_type TEXT,
+        detection_time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY (scan_id) REFERENCES scan_history (id)
+    )
+    '''
+]
+
+def schema_version(db_path: str) -> int:
+    conn = sqlite3.connect(db_path)
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    conn.close()
+    return version
+
+def table_names(db_path: str):
+    conn = sqlite3.connect(db_path)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")}
+    conn.close()
+    return names
+
+def create_at_version(db_path: str, version: int):
+    """A database with the schema as of migration ``version``"""
+    class PartialDatabaseManager(DatabaseManager):
+        MIGRATIONS = DatabaseManager.MIGRATIONS[:version]
+    PartialDatabaseManager(db_path).close()
+
+def test_new_database_gets_every_migration(tmp_path):
+    db_path = str(tmp_path / 'detector.db')
+    DatabaseManager(db_path).close()
+
+    assert schema_version(db_path) == len(DatabaseManager.MIGRATIONS)
+    assert {'scan_history', 'detected_changes', 'url_schedule', 'host_breaker', 'url_head',
+            'idx_scan_history_url_time'} <= table_names(db_path)
+
+def test_reopening_is_a_no_op(tmp_path):
+    db_path = str(tmp_path / 'detector.db')
+    DatabaseManager(db_path).close()
+    DatabaseManager(db_path).close()
+
+    assert schema_version(db_path) == len(DatabaseManager.MIGRATIONS)
+
+def test_upgrade_keeps_and_backfills_history(tmp_path):
+    db_path = str(tmp_path / 'detector.db')
+    conn = sqlite3.connect(db_path)
+    for statement in BASE_SCHEMA:
+        conn.execute(statement)
+    structures = [{'elements': {'/html': {'tag': 'html', 'text': str(version), 'tail': ''}}} for version in range(3)]
+    for structure in structures:
+        conn.execute('INSERT INTO scan_history (url, html_hash, xpath_structure) VALUES (?, ?, ?)',
+                     ('https://example.com/', 'hash', json.dumps(structure)))
+    conn.commit()
+    conn.close()
+
+    db_manager = DatabaseManager(db_path)
+    html_hash, structure, simhash = db_manager.get_last_scan('https://example.com/')
+    assert json.loads(structure) == structures[-1] and simhash is None
+    assert [db_manager.get_structure(scan_id) for scan_id in (1, 2, 3)] == structures
+
+    # New scans chain onto the migrated head
+    scan_id = db_manager.save_scan_result('https://example.com/', 'hash', json.dumps(structures[0]), [])
+    assert db_manager.get_structure(scan_id) == structures[0]
+    db_manager.close()
+
+def test_failed_migration_rolls_back_whole(tmp_path):
+    db_path = str(tmp_path / 'detector.db')
+    DatabaseManager(db_path).close()
+
+    class BrokenDatabaseManager(DatabaseManager):
+        MIGRATIONS = DatabaseManager.MIGRATIONS + [[
+            "CREATE TABLE extra (value TEXT)",
+            "ALTER TABLE missing ADD COLUMN value TEXT"
+        ]]
+
+    with pytest.raises(sqlite3.OperationalError):
+        BrokenDatabaseManager(db_path)
+    assert schema_version(db_path) == len(DatabaseManager.MIGRATIONS)
+    assert 'extra' not in table_names(db_path)
+
+def _open_database(db_path: str, barrier):
+    barrier.wait()
+    DatabaseManager(db_path).close()
+
+@pytest.mark.parametrize('start_version', [0, 3])
+def test_concurrent_startup_migrates_once(tmp_path, monkeypatch, start_version):
+    # Spawned processes set the detector's logging up afresh; keep its log file out of the checkout
+    monkeypatch.chdir(tmp_path)
+    context = multiprocessing.get_context('spawn')
+    workers = 6
+
+    for attempt in range(2):
+        db_path = str(tmp_path / f"detector-{attempt}.db")
+        if start_version:
+            create_at_version(db_path, start_version)
+        barrier = context.Barrier(workers)
+        processes = [context.Process(target=_open_database, args=(db_path, barrier)) for _ in range(workers)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+
+        assert [process.exitcode for process in processes] == [0] * workers
+        assert schema_version(db_path) == len(DatabaseManager.MIGRATIONS)
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+def test_connections_of_exited_threads_are_closed(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'threads.db'))
+    threads = [threading.Thread(target=db.get_last_scan, args=('http://example.com/',)) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert wait_for(lambda: len(db._connections) == 1)
+    db.close()
+    assert db._connections == []
+
+def test_scan_cycles_leave_no_connections_behind(detector_config, fixture_server):
+    detector = HTMLPageDetector({**detector_config, 'max_concurrency': 3})
+    urls = [fixture_server.url(number) for number in range(3)]
+    detector.scan_urls(urls)
+    assert wait_for(lambda: len(detector.db_manager._connections) == 1)
+    open_files = len(os.listdir('/proc/self/fd'))
+
+    for _ in range(5):
+        assert all(result.success for result in detector.scan_urls(urls))
+        assert wait_for(lambda: len(detector.db_manager._connections) == 1)
+    assert len(os.listdir('/proc/self/fd')) <= open_files
+    detector.close()
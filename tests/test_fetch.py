@@ -0,0 +1,86 @@
+# test_fetch.py - Buffered and streaming fetches of the same page
+
+import pytest
+
+from html_page_detector import HTMLPageDetector
+from structure_format import load_structure
+
+@pytest.fixture
+def server(fixture_server):
+    """Fixture server sending Latin-1 pages without validators, so every scan fetches and fingerprints them"""
+    site = fixture_server.site
+    site.etag = False
+    site.last_modified = False
+    render = site.render
+
+    def render_latin1(path):
+        status, headers, body = render(path)
+        # Decoded text no longer encodes back to the body bytes
+        body = body.replace(b'Fixture', 'Fixtüre'.encode('latin-1'))
+        return status, {**headers, 'Content-Type': 'text/html; charset=iso-8859-1'}, body
+
+    site.render = render_latin1
+    return fixture_server
+
+def test_both_modes_hash_the_raw_body(detector_config, server):
+    detector = HTMLPageDetector(detector_config)
+    url = server.url(1)
+
+    buffered = detector.fetch(url, stream=False)
+    streamed = detector.fetch(url, stream=True)
+    detector.close()
+
+    assert buffered.content_hash is not None
+    assert buffered.content_hash == streamed.content_hash
+
+@pytest.mark.parametrize('extraction_mode', ['tree', 'iterparse'])
+def test_switching_to_streaming_keeps_the_fingerprint(detector_config, server, extraction_mode):
+    config = {**detector_config, 'normalization': {'enabled': False}, 'extraction_mode': extraction_mode}
+    url = server.url(2)
+
+    detector = HTMLPageDetector({**config, 'stream_fetch': False})
+    detector.scan(url)
+    buffered_hash = detector.db_manager.get_last_scan(url)[0]
+    detector.close()
+
+    detector = HTMLPageDetector({**config, 'stream_fetch': True})
+    result = detector.scan(url)
+    streamed_hash = detector.db_manager.get_last_scan(url)[0]
+    detector.close()
+
+    assert result.success and not result.changed
+    assert streamed_hash == buffered_hash
+
+FRAGMENT = '<p class="intro">One</p><p>Two <b>bold</b></p><ul><li>First</li><li>Second</li></ul>'.encode()
+
+@pytest.mark.parametrize('extraction_mode', ['tree', 'iterparse'])
+@pytest.mark.parametrize('kind', ['document', 'fragment'])
+def test_both_modes_extract_the_same_structure(detector_config, server, extraction_mode, kind):
+    if kind == 'fragment':
+        server.site.render = lambda path: (200, {'Content-Type': 'text/html; charset=utf-8'}, FRAGMENT)
+    url = server.url(4)
+    structures = []
+    for normalization in ({'enabled': False}, {}):
+        detector = HTMLPageDetector({**detector_config, 'normalization': normalization,
+                                     'extraction_mode': extraction_mode})
+        for stream in (False, True):
+            fetched = detector.fetch(url, stream=stream)
+            analysis = detector.analyze(url, fetched.content, fetched.tree, fetched.content_hash,
+                                        extracted=fetched.extracted)
+            structures.append(load_structure(analysis.structure))
+        detector.close()
+
+    assert structures[0] == structures[1]
+    assert structures[2] == structures[3]
+    if kind == 'fragment':
+        assert list(structures[0]['elements'])[:3] == ['/html', '/html/body', '/html/body/p[1]']
+
+def test_oversized_body_is_refused_in_both_modes(detector_config, server):
+    detector = HTMLPageDetector({**detector_config, 'max_body_bytes': 100})
+    url = server.url(3)
+
+    for stream in (False, True):
+        fetched = detector.fetch(url, stream=stream)
+        assert fetched.error and 'max_body_bytes' in fetched.error
+        assert fetched.content is None and fetched.tree is None
+    detector.close()
@@ -0,0 +1,94 @@
+# test_page_normalizer.py - Noise rules applied before pages are fingerprinted
+
+import pytest
+from lxml import html
+
+from html_page_detector import PageAnalyzer
+from page_normalizer import PageNormalizer
+
+URL = 'http://example.com/'
+
+RULES = {
+    'ignore_patterns': [
+        r'\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2})?',  # Timestamps
+        r'[?&](?:v|ver|_|cb)=[\w.-]+'  # Cache-busting query strings
+    ]
+}
+
+def page(token='a1b2c3', stamp='2024-05-01 10:00:00', version='1001', nonce='n1', text='Welcome',
+         href='/about'):
+    return f"""<html><head>
+<meta name="csrf-token" content="{token}">
+<link rel="stylesheet" href="/style.css?v={version}">
+<script nonce="{nonce}">var build = "{version}";</script>
+<style>body {{ color: red; }}</style>
+</head><body>
+<!-- rendered in {version}ms -->
+<p class="intro">{text}</p>
+<a href="{href}">About</a>
+<img src="/logo.png?_={version}" data-timestamp="{stamp}">
+<form action="/login"><input type="hidden" name="csrf_token" value="{token}"><input name="user"></form>
+<footer>Generated   {stamp}</footer>
+</body></html>"""
+
+def fingerprint(rules, content):
+    normalizer = PageNormalizer(rules)
+    return normalizer.fingerprint(normalizer.normalize(html.fromstring(content)))
+
+@pytest.mark.parametrize('noise', [
+    {'token': 'zz99yy'},
+    {'stamp': '2024-05-02 17:45:13'},
+    {'version': '2002'},
+    {'nonce': 'n2'},
+])
+def test_noise_leaves_the_fingerprint_alone(noise):
+    assert fingerprint(RULES, page(**noise)) == fingerprint(RULES, page())
+
+@pytest.mark.parametrize('edit', [{'text': 'Welcome back'}, {'href': '/team'}])
+def test_real_edits_change_the_fingerprint(edit):
+    assert fingerprint(RULES, page(**edit)) != fingerprint(RULES, page())
+
+def test_timestamps_and_cache_busting_need_their_patterns():
+    assert fingerprint({}, page(stamp='2024-05-02 17:45:13')) != fingerprint({}, page())
+    assert fingerprint({}, page(version='2002')) != fingerprint({}, page())
+    # CSRF tokens and nonces are covered by the default rules
+    assert fingerprint({}, page(token='zz99yy', nonce='n2')) == fingerprint({}, page())
+
+def test_normalized_page_keeps_its_content():
+    doc = PageNormalizer(RULES).normalize(html.fromstring(page()))
+
+    assert not doc.xpath('//script | //style | //comment()')
+    assert doc.xpath('//meta/@content') == [] and doc.xpath('//input[@type="hidden"]/@value') == []
+    assert doc.xpath('//link/@href') == ['/style.css'] and doc.xpath('//img/@src') == ['/logo.png']
+    assert doc.xpath('//img/@data-timestamp') == []
+    assert doc.xpath('string(//p)') == 'Welcome' and doc.xpath('string(//footer)') == 'Generated'
+
+def test_invalid_rules_are_skipped():
+    normalizer = PageNormalizer({'ignore_patterns': ['(unclosed', r'\d+'], 'ignore_xpaths': ['//[broken', '//aside']})
+
+    assert len(normalizer.patterns) == 1 and len(normalizer.xpaths) == 1
+
+@pytest.fixture
+def analyzer():
+    return PageAnalyzer({'normalization': RULES})
+
+def rescan(analyzer, old_html, new_html):
+    first = analyzer.analyze(URL, old_html)
+    return first, analyzer.analyze(URL, new_html, last_scan=(first.content_hash, first.structure, first.simhash))
+
+def test_noisy_rescan_is_no_change(analyzer):
+    first, analysis = rescan(analyzer, page(), page(token='zz99yy', stamp='2024-05-02 17:45:13', version='2002',
+                                                    nonce='n2'))
+
+    assert analysis.content_hash == first.content_hash
+    assert not analysis.changed
+
+@pytest.mark.parametrize('edit,change', [
+    ({'text': 'Welcome back'}, ('element_text_changed', '/html/body/p')),
+    ({'href': '/team'}, ('attribute_modified', '/html/body/a/@href')),
+])
+def test_real_edits_are_changes_despite_noise(analyzer, edit, change):
+    _, analysis = rescan(analyzer, page(), page(token='zz99yy', version='2002', **edit))
+
+    assert analysis.changed
+    assert change in [(item.change_type, item.xpath) for item in analysis.changes]
@@ -0,0 +1,76 @@
+# test_process_pool.py - Analysis of large pages in worker processes
+
+import logging
+import os
+import time
+
+import html_page_detector
+from html_page_detector import HTMLPageDetector, PageAnalyzer
+
+def test_worker_builds_an_analyzer_without_a_database(tmp_path):
+    db_path = tmp_path / 'worker.db'
+    html_page_detector._init_analysis_worker({'db_path': str(db_path), 'snapshots': True})
+
+    assert type(html_page_detector._worker_analyzer) is PageAnalyzer
+    assert not db_path.exists()
+    assert list(tmp_path.iterdir()) == []
+
+def test_pool_scans_match_in_process_scans(detector_config, fixture_server, tmp_path, monkeypatch, caplog):
+    # Spawned workers import the module here, where a stray log file would show up
+    monkeypatch.chdir(tmp_path)
+    url = fixture_server.url(1)
+    pooled = HTMLPageDetector({**detector_config, 'process_pool_workers': 1, 'process_pool_min_bytes': 0})
+    local = HTMLPageDetector({**detector_config, 'db_path': str(tmp_path / 'local.db')})
+
+    with caplog.at_level(logging.ERROR):
+        results = []
+        for _ in range(2):
+            results.append((pooled.scan(url), local.scan(url)))
+            fixture_server.site.versions['/page/1'][0] += 1
+    pooled.close()
+    local.close()
+
+    assert not caplog.records
+    for pooled_result, local_result in results:
+        assert pooled_result.success and local_result.success
+        assert pooled_result.changed == local_result.changed
+        assert pooled_result.change_count == local_result.change_count
+    assert results[1][0].changed
+    assert not (tmp_path / 'html_detector.log').exists()
+    assert not (tmp_path / 'html_detector.db').exists()
+
+def _hang(*args):
+    time.sleep(60)
+
+def _crash(*args):
+    os._exit(1)
+
+def test_stuck_analysis_fails_the_scan_and_restarts_the_pool(detector_config, fixture_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    url = fixture_server.url(1)
+    detector = HTMLPageDetector({**detector_config, 'process_pool_workers': 1, 'process_pool_min_bytes': 0,
+                                 'analysis_timeout': 2})
+    monkeypatch.setattr(html_page_detector, '_analyze_in_worker', _hang)
+
+    start = time.monotonic()
+    result = detector.scan(url)
+    assert not result.success and 'timed out' in result.error
+    assert time.monotonic() - start < 20
+
+    monkeypatch.undo()
+    monkeypatch.chdir(tmp_path)
+    assert detector.scan(url).success
+    detector.close()
+
+def test_broken_pool_falls_back_to_in_process_analysis(detector_config, fixture_server, tmp_path, monkeypatch,
+                                                        caplog):
+    monkeypatch.chdir(tmp_path)
+    detector = HTMLPageDetector({**detector_config, 'process_pool_workers': 1, 'process_pool_min_bytes': 0})
+    monkeypatch.setattr(html_page_detector, '_analyze_in_worker', _crash)
+
+    with caplog.at_level(logging.ERROR):
+        result = detector.scan(fixture_server.url(1))
+    detector.close()
+
+    assert result.success and result.error is None
+    assert 'process pool broke' in caplog.text
@@ -0,0 +1,51 @@
+# test_scheduler.py - Change rate estimation and interval learning of AdaptiveScheduler
+
+import math
+
+import pytest
+
+from html_page_detector import AdaptiveScheduler, DatabaseManager
+
+URL = 'https://example.com/'
+HOUR = 3600.0
+
+@pytest.fixture
+def scheduler(tmp_path):
+    db_manager = DatabaseManager(str(tmp_path / 'detector.db'))
+    yield AdaptiveScheduler(db_manager, default_interval=HOUR, min_interval=60, max_interval=7 * 24 * HOUR)
+    db_manager.close()
+
+def record_checks(scheduler: AdaptiveScheduler, changed, spacing: float = HOUR, start: float = 1_000_000.0):
+    """Record a first scan, then one check per entry of ``changed``, ``spacing`` seconds apart"""
+    scheduler.record_scan(URL, False, now=start)
+    for number, change in enumerate(changed, start=1):
+        interval = scheduler.record_scan(URL, change, now=start + number * spacing)
+    return interval
+
+def test_rate_follows_cho_garcia_molina_estimator(scheduler):
+    # 10 hourly checks, 3 of which saw a change
+    interval = record_checks(scheduler, [True, False, False, True, False, False, True, False, False, False])
+
+    expected_rate = -math.log((10 - 3 + 0.5) / (10 + 0.5)) / HOUR
+    schedule = scheduler.db_manager.get_url_schedule(URL)
+    assert schedule['checks'] == 10 and schedule['changes'] == 3
+    assert schedule['change_rate'] == pytest.approx(expected_rate)
+    assert interval == pytest.approx(0.5 / expected_rate)
+
+def test_every_check_changed(scheduler):
+    record_checks(scheduler, [True] * 4, spacing=600)
+
+    expected_rate = -math.log(0.5 / 4.5) / 600
+    assert scheduler.db_manager.get_url_schedule(URL)['change_rate'] == pytest.approx(expected_rate)
+
+def test_unchanged_url_gets_the_longest_interval(scheduler):
+    interval = record_checks(scheduler, [False] * 5)
+
+    assert scheduler.db_manager.get_url_schedule(URL)['change_rate'] == 0
+    assert interval == 7 * 24 * HOUR
+
+def test_interval_is_clamped_to_url_bounds(scheduler):
+    scheduler.url_intervals = {URL: {'min_interval': 1800}}
+    interval = record_checks(scheduler, [True] * 10, spacing=60)
+
+    assert interval == 1800
@@ -0,0 +1,37 @@
+# test_selectors.py - Monitoring restricted to the regions matched by selectors
+
+import pytest
+
+from html_page_detector import PageAnalyzer
+
+URL = 'http://example.com/'
+
+def page(main='Price: 10', tail='Updated at 10:00', aside='Ad one'):
+    return (f'<html><body><h1>Shop</h1><div id="main"><p>{main}</p><span>In stock</span></div>{tail}'
+            f'<aside><p>{aside}</p></aside></body></html>')
+
+@pytest.fixture
+def analyzer():
+    return PageAnalyzer({'custom_selectors': {URL: ['#main']}})
+
+def rescan(analyzer, old_html, new_html):
+    first = analyzer.analyze(URL, old_html)
+    return first, analyzer.analyze(URL, new_html, last_scan=(first.content_hash, first.structure, first.simhash))
+
+@pytest.mark.parametrize('edit', [{'tail': 'Updated at 11:00'}, {'aside': 'Ad two'}])
+def test_edits_outside_the_selector_are_no_change(analyzer, edit):
+    first, analysis = rescan(analyzer, page(), page(**edit))
+
+    # Same fingerprint, so the stored structure is kept without extracting again
+    assert analysis.content_hash == first.content_hash
+    assert analysis.structure == first.structure
+    assert not analysis.changed and not analysis.changes
+
+def test_edits_inside_the_selector_are_changes(analyzer):
+    first, analysis = rescan(analyzer, page(), page(main='Price: 12'))
+
+    assert analysis.content_hash != first.content_hash
+    assert analysis.changed
+    assert [(change.change_type, change.xpath) for change in analysis.changes] == [
+        ('element_text_changed', '/html/body/div/p')
+    ]
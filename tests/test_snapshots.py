@@ -0,0 +1,95 @@
+# test_snapshots.py - Snapshot retention, and cleanup racing with scans that reuse a version
+
+import os
+import time
+
+import pytest
+
+from html_page_detector import HTMLPageDetector
+from snapshot_store import SnapshotStore
+from structure_format import dump_structure
+
+STRUCTURE = dump_structure({'elements': {'/html': {'tag': 'html', 'text': '', 'tail': ''}}})
+
+def age(store: SnapshotStore, key: str, seconds: float = 7200):
+    """Pretend a version was last stored or reused ``seconds`` ago"""
+    past = time.time() - seconds
+    os.utime(store.path(key), (past, past))
+
+@pytest.fixture
+def detector(detector_config):
+    detector = HTMLPageDetector({**detector_config, 'snapshots': True, 'snapshot_retention': 2})
+    yield detector
+    detector.close()
+
+def test_store_spares_recently_reused_versions(tmp_path):
+    store = SnapshotStore(str(tmp_path / 'snapshots'))
+    key = store.put('<html>page</html>')
+    age(store, key)
+
+    assert store.put(b'<html>page</html>') == key
+    assert not store.delete(key, grace=3600)
+    age(store, key)
+    assert store.delete(key, grace=3600)
+    assert key not in store and list(store.keys()) == []
+    # A writer that finds it gone stores it anew
+    assert store.put('<html>page</html>') == key and store.get(key) == b'<html>page</html>'
+
+def test_scans_keep_the_latest_versions_of_a_url(detector, fixture_server):
+    url = fixture_server.url(1)
+    keys = []
+    for _ in range(4):
+        result = detector.scan(url)
+        assert result.success
+        keys.append(detector.db_manager.get_last_snapshot_key(url))
+        for key in keys:
+            if key in detector.snapshot_store:
+                age(detector.snapshot_store, key)
+        fixture_server.site.versions['/page/1'][0] += 1
+
+    assert len(set(keys)) == 4
+    assert sorted(detector.snapshot_store.keys()) == sorted(keys[-2:])
+    assert detector.db_manager.unreferenced_snapshots(keys) == keys[:2]
+
+def test_versions_shared_across_urls_outlive_one_urls_expiry(detector):
+    db, store = detector.db_manager, detector.snapshot_store
+    shared = store.put('<html>shared</html>')
+    db.save_scan_result('http://a.example/', 'a1', STRUCTURE, [], snapshot_key=shared)
+    db.save_scan_result('http://b.example/', 'b1', STRUCTURE, [], snapshot_key=shared)
+    for version in range(2):
+        key = store.put(f'<html>a{version}</html>')
+        db.save_scan_result('http://a.example/', f'a{version + 2}', STRUCTURE, [], snapshot_key=key)
+    age(store, shared)
+
+    assert db.expire_snapshots('http://a.example/', 2) == []
+    assert detector.collect_snapshots() == 0
+    assert shared in store
+
+def test_cleanup_spares_a_version_another_scan_is_about_to_reuse(detector):
+    db, store = detector.db_manager, detector.snapshot_store
+    old = store.put('<html>old</html>')
+    db.save_scan_result('http://a.example/', 'a1', STRUCTURE, [], snapshot_key=old)
+    for version in range(2):
+        db.save_scan_result('http://a.example/', f'a{version + 2}', STRUCTURE, [],
+                            snapshot_key=store.put(f'<html>a{version}</html>'))
+    age(store, old)
+
+    # Another URL's scan stores the same body but has not saved its scan yet
+    assert store.put('<html>old</html>') == old
+    expired = db.expire_snapshots('http://a.example/', 2)
+    assert expired == [old]
+    assert detector._delete_snapshots(expired) == 0
+    db.save_scan_result('http://b.example/', 'b1', STRUCTURE, [], snapshot_key=old)
+    assert store.get(old) == b'<html>old</html>'
+
+def test_collect_removes_old_unreferenced_versions(detector):
+    db, store = detector.db_manager, detector.snapshot_store
+    referenced = store.put('<html>kept</html>')
+    db.save_scan_result('http://a.example/', 'a1', STRUCTURE, [], snapshot_key=referenced)
+    orphan = store.put('<html>orphan</html>')
+    recent = store.put('<html>recent</html>')
+    age(store, referenced)
+    age(store, orphan)
+
+    assert detector.collect_snapshots() == 1
+    assert sorted(store.keys()) == sorted([referenced, recent])
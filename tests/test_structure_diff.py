@@ -0,0 +1,65 @@
+# test_structure_diff.py - Compact structure comparison against the dict comparison
+
+import pytest
+
+from html_page_detector import PageAnalyzer
+from structure_format import CompactStructure, dump_structure, load_compact
+
+PAGE = """<html><body>
+<div id="nav"><a href="/">Home</a><a href="/news">News</a></div>
+<div class="content"><h1>Title</h1><p>First</p><p>Second</p><p class="note">Third</p></div>
+<table><tr><th>name</th><th>price</th></tr><tr><td>apple</td><td>1</td></tr><tr><td>pear</td><td>2</td></tr></table>
+<form action="/search"><input name="q"></form>
+<div id="footer"><span>Contact</span></div>
+</body></html>"""
+
+EDITS = {
+    'unchanged': ('', ''),
+    'text': ('<p>Second</p>', '<p>Changed</p>'),
+    'attribute': ('href="/news"', 'href="/latest"'),
+    'attribute added and removed': ('<span>', '<span title="mail">', ' class="note"', ''),
+    'inserted sibling': ('<p>First</p>', '<p>New</p><p>First</p>'),
+    'removed subtree': ('<div id="nav"><a href="/">Home</a><a href="/news">News</a></div>', ''),
+    'table cell': ('<td>2</td>', '<td>3</td>'),
+    'table row': ('</table>', '<tr><td>plum</td><td>4</td></tr></table>'),
+    'form input': ('<input name="q">', '<input name="q"><input name="page">'),
+}
+
+def edited(edit):
+    html = PAGE
+    replacements = EDITS[edit]
+    for position in range(0, len(replacements), 2):
+        if replacements[position]:
+            html = html.replace(replacements[position], replacements[position + 1])
+    return html
+
+@pytest.mark.parametrize('subtree_hashes', [True, False])
+@pytest.mark.parametrize('edit', sorted(EDITS))
+def test_compact_diff_gives_the_dict_diffs_changes(edit, subtree_hashes):
+    analyzer = PageAnalyzer({'subtree_hashes': subtree_hashes})
+    old = analyzer.extract_xpath_structure(PAGE)
+    new = analyzer.extract_xpath_structure(edited(edit))
+
+    def changes(old_structure, new_structure):
+        return sorted((change.change_type, change.xpath, change.old_value, change.new_value)
+                      for change in analyzer.compare_structures(old_structure, new_structure))
+
+    expected = changes(old, new)
+    assert bool(expected) == (edit != 'unchanged')
+    assert changes(CompactStructure.from_dict(old), CompactStructure.from_dict(new)) == expected
+    # Stored blobs load back as CompactStructures and compare the same way
+    loaded_old = load_compact(dump_structure(old))
+    loaded_new = load_compact(dump_structure(new))
+    assert isinstance(loaded_old, CompactStructure) and isinstance(loaded_new, CompactStructure)
+    assert changes(loaded_old, loaded_new) == expected
+
+def test_element_changes_come_in_dict_order():
+    analyzer = PageAnalyzer({})
+    old = analyzer.extract_xpath_structure(PAGE)
+    new = analyzer.extract_xpath_structure(edited('inserted sibling'))
+
+    def elements(changes):
+        return [(change.change_type, change.xpath) for change in changes if change.change_type.startswith('element_')]
+
+    compact = analyzer.compare_structures(CompactStructure.from_dict(old), CompactStructure.from_dict(new))
+    assert elements(compact) == elements(analyzer.compare_structures(old, new))
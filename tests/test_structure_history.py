@@ -0,0 +1,117 @@
+# test_structure_history.py - Structure versions stored as keyframes and deltas
+
+import threading
+
+import pytest
+
+from html_page_detector import DatabaseManager, PageAnalyzer
+from structure_format import dump_structure, load_structure
+
+URL = 'http://example.com/'
+
+def versions(count, compact=True):
+    """Structures of a page that gains a paragraph and changes a heading every version"""
+    analyzer = PageAnalyzer({})
+    blobs = []
+    for version in range(count):
+        paragraphs = ''.join(f'<p class="p{index}">Paragraph {index}</p>' for index in range(version % 5 + 3))
+        html = f'<html><body><h1>Version {version}</h1><div>{paragraphs}</div><span>Footer</span></body></html>'
+        blobs.append(dump_structure(analyzer.extract_xpath_structure(html), compact))
+    return blobs
+
+def history(db, url=URL):
+    return db._connection().execute(
+        'SELECT id, xpath_structure, structure_base FROM scan_history WHERE url = ? ORDER BY id', (url,)
+    ).fetchall()
+
+@pytest.fixture
+def db(tmp_path):
+    db = DatabaseManager(str(tmp_path / 'history.db'), keyframe_interval=3)
+    yield db
+    db.close()
+
+@pytest.mark.parametrize('compact', [True, False])
+def test_every_version_rebuilds_from_keyframes_and_deltas(db, compact):
+    blobs = versions(8, compact)
+    scan_ids = [db.save_scan_result(URL, f'hash{index}', blob, []) for index, blob in enumerate(blobs)]
+
+    for scan_id, blob in zip(scan_ids, blobs):
+        assert db.get_structure(scan_id) == load_structure(blob)
+    assert db.get_last_scan(URL)[1] == blobs[-1]
+    # A keyframe every keyframe_interval versions, deltas in between
+    assert [base is None for _, _, base in history(db)] == [index % 3 == 0 for index in range(8)]
+
+def test_unchanged_versions_are_empty_deltas_on_the_holding_row(db):
+    first, second = versions(2)
+    scan_ids = [db.save_scan_result(URL, 'hash', blob, []) for blob in (first, first, first, second, second)]
+    rows = history(db)
+
+    assert [(blob, base) for _, blob, base in rows[1:3]] == [(b'', scan_ids[0]), (b'', scan_ids[0])]
+    assert rows[4][1:] == (b'', scan_ids[3])
+    assert rows[3][2] == scan_ids[0]
+    for scan_id, blob in zip(scan_ids, (first, first, first, second, second)):
+        assert db.get_structure(scan_id) == load_structure(blob)
+
+def test_concurrent_writers_chain_onto_the_saved_head(db):
+    blobs = versions(10)
+    saved = {}
+    errors = []
+    barrier = threading.Barrier(4)
+
+    def write(worker):
+        try:
+            barrier.wait()
+            for index in range(10):
+                blob = blobs[(index + worker * 3) % len(blobs)]
+                saved[db.save_scan_result(URL, f'{worker}-{index}', blob, [])] = blob
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(worker,)) for worker in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(saved) == 40
+    for scan_id, blob in saved.items():
+        assert db.get_structure(scan_id) == load_structure(blob)
+    assert db.get_last_scan(URL)[1] == saved[max(saved)]
+
+def test_writer_raced_by_another_scan_chains_onto_it(tmp_path):
+    first, second, third = versions(3)
+    path = str(tmp_path / 'history.db')
+    other = DatabaseManager(path, keyframe_interval=3)
+    first_id = other.save_scan_result(URL, 'first', first, [])
+    raced = []
+
+    class RacedDatabaseManager(DatabaseManager):
+        def _plan_structure(self, head, xpath_structure):
+            if not raced:
+                # Another process saves a scan of the URL after we read the head
+                raced.append(other.save_scan_result(URL, 'second', second, []))
+            return super()._plan_structure(head, xpath_structure)
+
+    db = RacedDatabaseManager(path, keyframe_interval=3)
+    third_id = db.save_scan_result(URL, 'third', third, [])
+    rows = history(db)
+
+    assert [(scan_id, base) for scan_id, _, base in rows] == [
+        (first_id, None), (raced[0], first_id), (third_id, raced[0])
+    ]
+    for scan_id, blob in zip((first_id, raced[0], third_id), (first, second, third)):
+        assert db.get_structure(scan_id) == load_structure(blob)
+    db.close()
+    other.close()
+
+def test_head_refers_to_the_row_holding_its_version(db):
+    first, second = versions(2)
+    db.save_scan_result(URL, 'first', first, [])
+    second_id = db.save_scan_result(URL, 'second', second, [])
+    conn = db._connection()
+
+    assert 'structure' not in {row[1] for row in conn.execute('PRAGMA table_info(url_head)')}
+    assert conn.execute('SELECT structure_scan_id FROM url_head WHERE url = ?', (URL,)).fetchone() == (second_id,)
+    assert history(db)[1][2] is not None
+    assert db.get_last_scan(URL)[1] == second
@@ -0,0 +1,78 @@
+# test_table_diff.py - Row and cell changes of tables in every diff mode
+
+import pytest
+
+from html_page_detector import XPATH_STEP, PageAnalyzer
+from structure_format import CompactStructure
+
+MODES = [('xpath', False), ('xpath', True), ('tree', False)]
+
+def page(rows, caption='Prices'):
+    body = ''.join(f"<tr><td>{name}</td><td>{price}</td></tr>" for name, price in rows)
+    return (f"<html><body><p>Intro</p><table><caption>{caption}</caption>"
+            f"<thead><tr><th>name</th><th>price</th></tr></thead><tbody>{body}</tbody></table></body></html>")
+
+def changes(diff_mode, compact, old_html, new_html):
+    analyzer = PageAnalyzer({'diff_mode': diff_mode})
+    old = analyzer.extract_xpath_structure(old_html)
+    new = analyzer.extract_xpath_structure(new_html)
+    if compact:
+        old, new = CompactStructure.from_dict(old), CompactStructure.from_dict(new)
+    return analyzer.compare_structures(old, new)
+
+@pytest.mark.parametrize('diff_mode,compact', MODES)
+def test_keyed_cell_change_is_reported_once(diff_mode, compact):
+    rows = [('apple', '1'), ('pear', '2'), ('plum', '3')]
+    found = changes(diff_mode, compact, page(rows), page([rows[0], ('pear', '5'), rows[2]]))
+
+    assert [(change.change_type, change.xpath, change.old_value, change.new_value) for change in found] == [
+        ('table_cell_changed', "/html/body/table/row['name'='pear']/cell['price']", '2', '5')
+    ]
+
+@pytest.mark.parametrize('diff_mode,compact', MODES)
+def test_unkeyed_row_insert_is_reported_once(diff_mode, compact):
+    rows = [('apple', '1'), ('apple', '1'), ('pear', '2'), ('pear', '2')]
+    found = changes(diff_mode, compact, page(rows), page(rows[:2] + [('plum', '1')] + rows[2:]))
+
+    assert not [change for change in found if change.change_type.startswith('element_')]
+    assert [(change.xpath, change.new_value) for change in found if change.change_type == 'table_row_inserted'] == [
+        ('/html/body/table/row[3]', 'plum | 1')
+    ]
+
+@pytest.mark.parametrize('diff_mode,compact', MODES)
+def test_text_outside_rows_is_still_reported(diff_mode, compact):
+    rows = [('apple', '1'), ('pear', '2')]
+    found = changes(diff_mode, compact, page(rows), page(rows, caption='Fruit prices'))
+
+    assert [(change.change_type, change.xpath) for change in found] == [
+        ('element_text_changed', '/html/body/table/caption')
+    ]
+
+def test_key_values_are_quoted():
+    rows = [("O'Brien", '1'), ('say "hi"', '2'), ('it\'s "x"', '3'), ('a/b]', '4')]
+    found = changes('xpath', False, page(rows), page([(name, '9') for name, _ in rows]))
+    paths = [change.xpath for change in found]
+
+    assert paths == [
+        "/html/body/table/row['name'=\"O'Brien\"]/cell['price']",
+        "/html/body/table/row['name'='say \"hi\"']/cell['price']",
+        "/html/body/table/row['name'=concat('it', \"'\", 's \"x\"')]/cell['price']",
+        "/html/body/table/row['name'='a/b]']/cell['price']",
+    ]
+    # Quoted brackets and slashes stay inside their location step
+    assert all(len(XPATH_STEP.findall(path)) == 5 for path in paths)
+
+@pytest.mark.parametrize('key', [None, 'name', 1])
+def test_moved_key_column_keys_rows_by_their_header(key):
+    rows = [('apple', '1'), ('pear', '2'), ('plum', '3')]
+    swapped = page([(price, name) for name, price in rows[:1] + [('pear', '5')] + rows[2:]]).replace(
+        '<th>name</th><th>price</th>', '<th>price</th><th>name</th>')
+    analyzer = PageAnalyzer({})
+    found = analyzer.compare_structures(analyzer.extract_xpath_structure(page(rows)),
+                                        analyzer.extract_xpath_structure(swapped), key)
+
+    assert [(change.change_type, change.xpath, change.old_value, change.new_value)
+            for change in found if change.change_type.startswith('table_')] == [
+        ('table_headers_changed', '/html/body/table', "['name', 'price']", "['price', 'name']"),
+        ('table_cell_changed', "/html/body/table/row['name'='pear']/cell['price']", '2', '5'),
+    ]
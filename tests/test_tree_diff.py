@@ -0,0 +1,81 @@
+# test_tree_diff.py - Tree matching, and tree diff mode against the XPath comparison
+
+import pytest
+
+from html_page_detector import PageAnalyzer
+from tree_diff import match_trees
+
+PAGE = """<html><body>
+<div id="nav"><a href="/">Home</a><a href="/news">News</a></div>
+<div class="content"><h1>Title</h1><p>First</p><p>Second</p><p class="note">Third</p></div>
+<div id="footer"><span>Contact</span></div>
+</body></html>"""
+
+EDITS = {
+    'text': ('<p>Second</p>', '<p>Changed</p>'),
+    'attribute': ('href="/news"', 'href="/latest"'),
+    'attribute added': ('<span>', '<span title="mail">'),
+    'attribute removed': (' class="note"', ''),
+    'text and attribute': ('<h1>Title</h1>', '<h1 lang="en">Heading</h1>'),
+}
+
+def structure(subtree_hashes=True, html=PAGE):
+    return PageAnalyzer({'subtree_hashes': subtree_hashes}).extract_xpath_structure(html)
+
+@pytest.mark.parametrize('old,new', [
+    ({}, {}),
+    ({'elements': {}, 'subtree_hashes': False}, {'elements': {}, 'subtree_hashes': False}),
+    ({'elements': {}, 'subtree_hashes': {}}, {}),
+])
+def test_empty_structures_match_nothing(old, new):
+    match = match_trees(old, new)
+
+    assert not (match.mapping or match.removed or match.added or match.moved or match.text_changed)
+
+@pytest.mark.parametrize('subtree_hashes', [True, False])
+def test_empty_against_a_page_adds_or_removes_its_root(subtree_hashes):
+    page = structure(subtree_hashes)
+
+    assert match_trees({}, page).added == ['/html']
+    assert match_trees(page, {}).removed == ['/html']
+    assert match_trees({'elements': {}, 'subtree_hashes': False}, page).added == ['/html']
+
+@pytest.mark.parametrize('subtree_hashes', [True, False])
+@pytest.mark.parametrize('edit', sorted(EDITS))
+def test_tree_mode_agrees_with_xpath_mode_on_in_place_edits(edit, subtree_hashes):
+    old = structure(subtree_hashes)
+    new = structure(subtree_hashes, PAGE.replace(*EDITS[edit]))
+
+    def changes(diff_mode):
+        analyzer = PageAnalyzer({'diff_mode': diff_mode})
+        return sorted((change.change_type, change.xpath, change.old_value, change.new_value)
+                      for change in analyzer.compare_structures(old, new))
+
+    assert changes('tree')
+    assert changes('tree') == changes('xpath')
+
+def test_inserted_sibling_is_one_change_in_tree_mode():
+    old = structure()
+    new = structure(html=PAGE.replace('<p>First</p>', '<p>New</p><p>First</p>'))
+
+    tree = PageAnalyzer({'diff_mode': 'tree'}).compare_structures(old, new)
+    xpath = PageAnalyzer({'diff_mode': 'xpath'}).compare_structures(old, new)
+
+    assert [(change.change_type, change.xpath) for change in tree] == [
+        ('element_added', '/html/body/div[2]/p[1]')
+    ]
+    assert len(xpath) > len(tree)
+
+def test_moved_subtree_does_not_take_over_descendants_paired_elsewhere():
+    # The list moves out of the section first, then the section moves holding a copy of it
+    old = structure(html='<html><body><article><section><ul><li>One</li><li>Two</li></ul><b>z</b></section>'
+                         '</article></body></html>')
+    new = structure(html='<html><body><nav><ul><li>One</li><li>Two</li></ul></nav><aside><section><ul><li>One</li>'
+                         '<li>Two</li></ul><b>z</b></section></aside></body></html>')
+    match = match_trees(old, new)
+
+    assert len(set(match.mapping.values())) == len(match.mapping)
+    assert match.mapping['/html/body/article/section/ul'] == '/html/body/nav/ul'
+    assert match.mapping['/html/body/article/section'] == '/html/body/aside/section'
+    assert match.removed == ['/html/body/article']
+    assert match.added == ['/html/body/nav', '/html/body/aside', '/html/body/aside/section/ul']
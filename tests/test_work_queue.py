@@ -0,0 +1,103 @@
+# test_work_queue.py - Leases, renewal and reclaiming in the shared work queue
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from html_page_detector import DatabaseManager
+from work_queue import SQLiteWorkQueue, WorkQueue
+
+URLS = [f"https://example.com/page/{number}" for number in range(5)]
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = str(tmp_path / 'detector.db')
+    DatabaseManager(db_path).close()
+    return db_path
+
+@pytest.fixture
+def queue(db_path):
+    queue = SQLiteWorkQueue(db_path)
+    queue.enqueue(URLS)
+    return queue
+
+def test_incomplete_queue_cant_be_created():
+    class ClaimOnlyQueue(WorkQueue):
+        def claim(self, worker_id, limit, lease_seconds):
+            return []
+
+    with pytest.raises(TypeError):
+        ClaimOnlyQueue()
+
+def test_claimed_urls_are_leased_to_one_worker(queue):
+    assert queue.claim('a', 3, 60) == URLS[:3]
+    assert queue.claim('b', 10, 60) == URLS[3:]
+    assert queue.claim('c', 10, 60) == []
+
+def test_urls_not_yet_due_are_not_claimed(queue):
+    queue.enqueue(['https://example.com/later'], due=time.time() + 3600)
+    assert 'https://example.com/later' not in queue.claim('a', 10, 60)
+
+def test_enqueue_leaves_known_urls_alone(queue):
+    claimed = queue.claim('a', 10, 60)
+    queue.release('a', claimed[0], time.time() + 3600)
+
+    queue.enqueue(URLS)
+    assert claimed[0] not in queue.claim('b', 10, 60)
+
+def test_released_url_is_due_again_at_its_next_scan(queue):
+    claimed = queue.claim('a', 1, 60)
+    queue.release('a', claimed[0], time.time() + 0.2)
+    assert queue.claim('b', 10, 60) == URLS[1:]
+
+    time.sleep(0.25)
+    assert queue.claim('b', 10, 60) == claimed
+
+def test_expired_lease_is_reclaimed(queue):
+    claimed = queue.claim('a', 2, 0.1)
+    time.sleep(0.15)
+
+    assert queue.claim('b', 2, 60) == claimed
+    # The first worker has lost the URLs and can no longer reschedule them
+    assert queue.renew('a', claimed, 60) == 0
+    queue.release('a', claimed[0], time.time() + 3600)
+    assert queue.renew('b', claimed, 60) == 2
+
+def test_renewed_lease_is_kept(queue):
+    claimed = queue.claim('a', 2, 0.1)
+    assert queue.renew('a', claimed, 60) == 2
+    time.sleep(0.15)
+
+    assert not set(claimed) & set(queue.claim('b', 10, 60))
+
+def test_seconds_until_due(queue):
+    queue.remove(URLS[1:])
+    assert queue.seconds_until_due() == 0
+
+    claimed = queue.claim('a', 1, 60)
+    queue.release('a', claimed[0], time.time() + 100)
+    assert 99 < queue.seconds_until_due() <= 100
+
+    queue.remove(URLS[:1])
+    assert queue.seconds_until_due() == float('inf')
+
+def test_concurrent_claims_never_overlap(db_path):
+    urls = [f"https://example.com/item/{number}" for number in range(200)]
+    SQLiteWorkQueue(db_path).enqueue(urls)
+
+    def drain(worker_id):
+        # Every worker has its own queue object and connections, like separate processes
+        queue = SQLiteWorkQueue(db_path)
+        claimed = []
+        while True:
+            batch = queue.claim(worker_id, 7, 60)
+            if not batch:
+                return claimed
+            claimed.extend(batch)
+
+    with ThreadPoolExecutor(8) as executor:
+        batches = list(executor.map(drain, [f"worker-{number}" for number in range(8)]))
+
+    claimed = [url for batch in batches for url in batch]
+    assert sorted(claimed) == sorted(urls)
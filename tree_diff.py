@@ -0,0 +1,328 @@
+# tree_diff.py - Matching of element trees by anchors and sibling alignment
+
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from difflib import SequenceMatcher
+from typing import Dict, List, Tuple
+
+# Attributes that identify an element among its siblings, strongest first
+ANCHOR_ATTRIBUTES = ('id', 'name', 'class')
+
+# Texts at least this similar are taken for the same element with edited text
+TEXT_SIMILARITY = 0.6
+
+# Leftover siblings compared pairwise by text before falling back to plain alignment
+MAX_SIMILARITY_CANDIDATES = 50
+
+# Largest group of same-label leftover siblings scored pairwise by shared children
+MAX_PAIR_SCORES = 2500
+
+class _Tree:
+    """Parent/child links, anchor labels and subtree signatures of a structure's elements
+
+    Signatures are the stored Merkle subtree hashes when ``stored_hashes``
+    is set, and are computed from the element records otherwise.
+    """
+
+    def __init__(self, structure: Dict, stored_hashes: bool = False):
+        elements = structure.get('elements', {})
+        attributes = structure.get('attributes', {})
+        self.paths = list(elements)
+        self.records = list(elements.values())
+        count = len(self.paths)
+        positions = {xpath: index for index, xpath in enumerate(self.paths)}
+
+        self.parent = [-1] * count
+        self.children: List[List[int]] = [[] for _ in range(count)]
+        self.roots = []
+        for index, xpath in enumerate(self.paths):
+            parent = positions.get(xpath.rpartition('/')[0])
+            if parent is None:
+                self.roots.append(index)
+            else:
+                self.parent[index] = parent
+                self.children[parent].append(index)
+
+        self.labels = []
+        for xpath, record in zip(self.paths, self.records):
+            attrs = attributes.get(xpath, {})
+            anchor = next(((name, attrs[name]) for name in ANCHOR_ATTRIBUTES if attrs.get(name)), None)
+            self.labels.append((record.get('tag'), anchor))
+
+        if stored_hashes:
+            hashes = structure['subtree_hashes']
+            self.signature = [hashes[xpath][0] for xpath in self.paths]
+            self.size = [hashes[xpath][1] for xpath in self.paths]
+            return
+
+        # Elements come in document order, so children always follow their parent
+        self.size = [1] * count
+        self.signature = [0] * count
+        for index in range(count - 1, -1, -1):
+            record = self.records[index]
+            children = self.children[index]
+            self.signature[index] = hash((
+                record.get('tag'), record.get('text'), record.get('tail'),
+                tuple(sorted(attributes.get(self.paths[index], {}).items())),
+                tuple(self.signature[child] for child in children)
+            ))
+            self.size[index] = 1 + sum(self.size[child] for child in children)
+
+    def text(self, index: int) -> str:
+        return self.records[index].get('text') or ''
+
+@dataclass
+class TreeMatch:
+    """Elements of an old and a new structure matched to each other
+
+    ``mapping`` maps old XPaths to the XPaths of the same elements in the
+    new structure. ``removed`` and ``added`` are the tops of deleted and
+    inserted subtrees only, ``moved`` the (old, new) XPaths of subtrees that
+    changed position, and ``text_changed`` the (old, new) XPaths of matched
+    elements whose text differs.
+    """
+    mapping: Dict[str, str] = field(default_factory=dict)
+    removed: List[str] = field(default_factory=list)
+    added: List[str] = field(default_factory=list)
+    moved: List[Tuple[str, str]] = field(default_factory=list)
+    text_changed: List[Tuple[str, str]] = field(default_factory=list)
+
+    def split(self, old_section: Dict, new_section: Dict) -> Tuple[Dict, Dict, Dict, Dict]:
+        """Split a structure section into matched and unmatched entries
+
+        Returns the matched old entries keyed by their new XPath, the
+        matched new entries, and the old-only and new-only entries.
+        """
+        matched_new = set(self.mapping.values())
+        old_matched = {self.mapping[xpath]: value for xpath, value in old_section.items() if xpath in self.mapping}
+        new_matched = {xpath: value for xpath, value in new_section.items() if xpath in matched_new}
+        old_only = {xpath: value for xpath, value in old_section.items() if xpath not in self.mapping}
+        new_only = {xpath: value for xpath, value in new_section.items() if xpath not in matched_new}
+        return old_matched, new_matched, old_only, new_only
+
+class _Matcher:
+    def __init__(self, old: _Tree, new: _Tree):
+        self.old = old
+        self.new = new
+        self.old_to_new = [-1] * len(old.paths)
+        self.new_to_old = [-1] * len(new.paths)
+        self.moves: List[Tuple[int, int]] = []
+
+    def pair(self, old_index: int, new_index: int):
+        self.old_to_new[old_index] = new_index
+        self.new_to_old[new_index] = old_index
+
+    def pair_subtrees(self, old_index: int, new_index: int):
+        """Pair two identical subtrees element by element; both are contiguous in document order
+
+        Elements a move already paired elsewhere keep that pairing.
+        """
+        for offset in range(self.old.size[old_index]):
+            if self.old_to_new[old_index + offset] < 0 and self.new_to_old[new_index + offset] < 0:
+                self.pair(old_index + offset, new_index + offset)
+
+    def match_children(self, old_children: List[int], new_children: List[int]):
+        """Match two lists of siblings and, from there, their still unpaired descendants"""
+        stack = [(old_children, new_children)]
+        while stack:
+            old_children, new_children = stack.pop()
+            old_children = [index for index in old_children if self.old_to_new[index] < 0]
+            new_children = [index for index in new_children if self.new_to_old[index] < 0]
+            pairs = self.align(old_children, new_children)
+            self.moves.extend(_out_of_order(pairs))
+            for old_index, new_index in pairs:
+                if self.old.signature[old_index] == self.new.signature[new_index]:
+                    self.pair_subtrees(old_index, new_index)
+                else:
+                    self.pair(old_index, new_index)
+                    stack.append((self.old.children[old_index], self.new.children[new_index]))
+
+    def align(self, old_children: List[int], new_children: List[int]) -> List[Tuple[int, int]]:
+        """Pair siblings in passes of decreasing strictness, each over what the previous left"""
+        pairs = []
+        passes = (
+            (self._aligned_pairs, lambda tree, index: tree.signature[index]),
+            (self._aligned_pairs, lambda tree, index: (tree.labels[index], tree.text(index))),
+            (self._similar_text_pairs, None),
+            (self._closest_pairs, lambda tree, index: tree.labels[index]),
+            (self._closest_pairs, lambda tree, index: tree.labels[index][0])
+        )
+        for find, key in passes:
+            if not old_children or not new_children:
+                break
+            found = find(old_children, new_children, key)
+            if found:
+                pairs.extend(found)
+                paired_old = {old_index for old_index, _ in found}
+                paired_new = {new_index for _, new_index in found}
+                old_children = [index for index in old_children if index not in paired_old]
+                new_children = [index for index in new_children if index not in paired_new]
+        return pairs
+
+    def _aligned_pairs(self, old_children: List[int], new_children: List[int], key) -> List[Tuple[int, int]]:
+        """Pair siblings with equal keys along the longest common subsequence"""
+        matcher = SequenceMatcher(None, [key(self.old, index) for index in old_children],
+                                  [key(self.new, index) for index in new_children], autojunk=False)
+        return [(old_children[a + offset], new_children[b + offset])
+                for a, b, size in matcher.get_matching_blocks() for offset in range(size)]
+    
+    def _closest_pairs(self, old_children: List[int], new_children: List[int], key) -> List[Tuple[int, int]]:
+        """Pair siblings with equal keys, preferring those sharing the most child subtrees"""
+        old_groups: Dict[object, List[int]] = {}
+        new_groups: Dict[object, List[int]] = {}
+        for index in old_children:
+            old_groups.setdefault(key(self.old, index), []).append(index)
+        for index in new_children:
+            new_groups.setdefault(key(self.new, index), []).append(index)
+        
+        pairs = []
+        for group_key, olds in old_groups.items():
+            news = new_groups.get(group_key)
+            if not news:
+                continue
+            if len(olds) == 1 and len(news) == 1 or len(olds) * len(news) > MAX_PAIR_SCORES:
+                pairs.extend(zip(olds, news))
+                continue
+            candidates = []
+            for old_position, old_index in enumerate(olds):
+                old_signatures = {self.old.signature[child] for child in self.old.children[old_index]}
+                for new_position, new_index in enumerate(news):
+                    shared = sum(1 for child in self.new.children[new_index]
+                                 if self.new.signature[child] in old_signatures)
+                    shared += self.old.text(old_index) == self.new.text(new_index)
+                    candidates.append((-shared, abs(old_position - new_position), old_index, new_index))
+            candidates.sort()
+            used_old = set()
+            used_new = set()
+            for _, _, old_index, new_index in candidates:
+                if old_index not in used_old and new_index not in used_new:
+                    pairs.append((old_index, new_index))
+                    used_old.add(old_index)
+                    used_new.add(new_index)
+        return pairs
+    
+    def _similar_text_pairs(self, old_children: List[int], new_children: List[int], key=None) -> List[Tuple[int, int]]:
+        """Pair same-label siblings with similar texts, keeping their order"""
+        pairs = []
+        start = 0
+        for old_index in old_children:
+            old_text = self.old.text(old_index)
+            if not old_text:
+                continue
+            label = self.old.labels[old_index]
+            for position in range(start, min(len(new_children), start + MAX_SIMILARITY_CANDIDATES)):
+                new_index = new_children[position]
+                new_text = self.new.text(new_index)
+                if self.new.labels[new_index] != label or not new_text:
+                    continue
+                matcher = SequenceMatcher(None, old_text, new_text, autojunk=False)
+                if matcher.quick_ratio() >= TEXT_SIMILARITY and matcher.ratio() >= TEXT_SIMILARITY:
+                    pairs.append((old_index, new_index))
+                    start = position + 1
+                    break
+        return pairs
+
+    def match_moves(self):
+        """Pair subtrees that left one place and reappear in another
+
+        First identical subtrees (more than a bare empty element), then
+        elements carrying the same id, whose descendants are matched as
+        usual.
+        """
+        old, new = self.old, self.new
+        by_signature: Dict[int, List[int]] = {}
+        by_id: Dict[Tuple, List[int]] = {}
+        for index in range(len(old.paths)):
+            if self.old_to_new[index] < 0:
+                if old.size[index] > 1 or old.text(index):
+                    by_signature.setdefault(old.signature[index], []).append(index)
+                if old.labels[index][1] and old.labels[index][1][0] == 'id':
+                    by_id.setdefault(old.labels[index], []).append(index)
+
+        for candidates, exact in ((by_signature, True), (by_id, False)):
+            for new_index in range(len(new.paths)):
+                if self.new_to_old[new_index] >= 0:
+                    continue
+                key = new.signature[new_index] if exact else new.labels[new_index]
+                for old_index in candidates.get(key, ()):
+                    if self.old_to_new[old_index] < 0:
+                        break
+                else:
+                    continue
+                self.moves.append((old_index, new_index))
+                if exact:
+                    self.pair_subtrees(old_index, new_index)
+                else:
+                    self.pair(old_index, new_index)
+                    self.match_children(old.children[old_index], new.children[new_index])
+
+def _out_of_order(pairs: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Pairs outside the longest run that keeps its order on both sides: the siblings that moved"""
+    if len(pairs) < 2:
+        return []
+    pairs = sorted(pairs)
+    # Longest increasing subsequence of the new positions, by patience sorting
+    tails = []
+    tail_positions = []
+    previous = [-1] * len(pairs)
+    for position, (_, new_index) in enumerate(pairs):
+        slot = bisect_left(tails, new_index)
+        if slot == len(tails):
+            tails.append(new_index)
+            tail_positions.append(position)
+        else:
+            tails[slot] = new_index
+            tail_positions[slot] = position
+        previous[position] = tail_positions[slot - 1] if slot else -1
+    in_order = set()
+    position = tail_positions[-1]
+    while position >= 0:
+        in_order.add(position)
+        position = previous[position]
+    return [pair for position, pair in enumerate(pairs) if position not in in_order]
+
+def match_trees(old_structure: Dict, new_structure: Dict) -> TreeMatch:
+    """Match the elements of two structures independently of their positional XPaths
+
+    Siblings are aligned with ``difflib.SequenceMatcher``: identical
+    subtrees first, then elements with the same tag and anchor attribute
+    (id, name or class) and text, then similar texts, then tag and anchor,
+    then tag alone; siblings paired out of order count as moved. Matching
+    proceeds top-down from matched parents; finally unmatched subtrees are
+    looked up anywhere in the other tree to detect moves. An inserted
+    sibling therefore shows up as one insertion instead of shifting the
+    XPaths of everything after it.
+    """
+    # Stored subtree hashes only compare with each other, so use them when both sides have them
+    stored_hashes = all(
+        isinstance(structure.get('subtree_hashes'), dict)
+        and len(structure['subtree_hashes']) == len(structure.get('elements', {}))
+        for structure in (old_structure, new_structure)
+    )
+    old = _Tree(old_structure, stored_hashes)
+    new = _Tree(new_structure, stored_hashes)
+    matcher = _Matcher(old, new)
+    matcher.match_children(old.roots, new.roots)
+    matcher.match_moves()
+
+    result = TreeMatch()
+    moved_new = {new_index for _, new_index in matcher.moves}
+    for old_index, new_index in enumerate(matcher.old_to_new):
+        if new_index < 0:
+            parent = old.parent[old_index]
+            if parent < 0 or matcher.old_to_new[parent] >= 0:
+                result.removed.append(old.paths[old_index])
+            continue
+        result.mapping[old.paths[old_index]] = new.paths[new_index]
+
+    for new_index, old_index in enumerate(matcher.new_to_old):
+        if old_index < 0:
+            parent = new.parent[new_index]
+            if parent < 0 or matcher.new_to_old[parent] >= 0:
+                result.added.append(new.paths[new_index])
+            continue
+        if new_index in moved_new:
+            result.moved.append((old.paths[old_index], new.paths[new_index]))
+        if old.records[old_index].get('text') != new.records[new_index].get('text'):
+            result.text_changed.append((old.paths[old_index], new.paths[new_index]))
+    return result
@@ -0,0 +1,194 @@
+# work_queue.py - Lease-based work queue for running scans across processes and machines
+
+import argparse
+import json
+import logging
+import multiprocessing
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+class WorkQueue(ABC):
+    """Interface of the shared queue that scan workers claim URLs from
+    
+    A URL is due once its next scan time has passed. ``claim`` hands out due
+    URLs that nobody holds a live lease on, atomically, so two workers never
+    scan the same URL at once. A lease that is neither renewed nor released
+    expires and the URL becomes claimable again.
+    """
+    
+    @abstractmethod
+    def enqueue(self, urls: List[str], due: Optional[float] = None):
+        """Add URLs to the queue, due at ``due`` (now by default); known URLs are left alone"""
+    
+    @abstractmethod
+    def remove(self, urls: List[str]):
+        """Remove URLs from the queue"""
+    
+    @abstractmethod
+    def claim(self, worker_id: str, limit: int, lease_seconds: float) -> List[str]:
+        """Lease up to ``limit`` due URLs to a worker"""
+    
+    @abstractmethod
+    def renew(self, worker_id: str, urls: List[str], lease_seconds: float) -> int:
+        """Extend a worker's leases and return how many it still holds"""
+    
+    @abstractmethod
+    def release(self, worker_id: str, url: str, next_due: float):
+        """Give back a leased URL and set when it is due next"""
+    
+    @abstractmethod
+    def seconds_until_due(self) -> float:
+        """Time until the next URL becomes due"""
+
+class SQLiteWorkQueue(WorkQueue):
+    """Work queue stored in the detector's SQLite database
+    
+    Queue entries are the ``url_schedule`` rows of the adaptive scheduler,
+    whose ``next_scan`` column is the due time, plus the lease columns added
+    by the database migrations. Claims run in a ``BEGIN IMMEDIATE``
+    transaction so concurrent workers serialize on the database write lock.
+    Several machines can share the queue as long as they see the same
+    database file on storage with working locks, and their clocks agree to
+    well within the lease time. WAL journal mode needs shared memory, so such
+    setups set ``db_journal_mode`` to ``'delete'``.
+    """
+    
+    def __init__(self, db_path: str = "html_detector.db", busy_timeout: float = 30):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+    
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode so transactions are opened explicitly below
+        return sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None)
+    
+    def enqueue(self, urls: List[str], due: Optional[float] = None):
+        """Add URLs to the queue, due at ``due`` (now by default); known URLs are left alone"""
+        due = time.time() if due is None else due
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.executemany('''
+            INSERT INTO url_schedule (url, scan_interval, next_scan) VALUES (?, 0, ?)
+            ON CONFLICT(url) DO NOTHING
+        ''', [(url, due) for url in urls])
+        cursor.execute('COMMIT')
+        conn.close()
+    
+    def remove(self, urls: List[str]):
+        """Remove URLs from the queue"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.executemany('DELETE FROM url_schedule WHERE url = ?', [(url,) for url in urls])
+        cursor.execute('COMMIT')
+        conn.close()
+    
+    def claim(self, worker_id: str, limit: int, lease_seconds: float) -> List[str]:
+        """Lease up to ``limit`` due URLs to a worker"""
+        now = time.time()
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute('''
+                SELECT url FROM url_schedule
+                WHERE next_scan <= ? AND (lease_expires IS NULL OR lease_expires < ?)
+                ORDER BY next_scan LIMIT ?
+            ''', (now, now, limit))
+            urls = [row[0] for row in cursor.fetchall()]
+            
+            cursor.executemany('''
+                UPDATE url_schedule SET lease_owner = ?, lease_expires = ? WHERE url = ?
+            ''', [(worker_id, now + lease_seconds, url) for url in urls])
+            cursor.execute('COMMIT')
+        except sqlite3.Error:
+            if conn.in_transaction:
+                cursor.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+        
+        return urls
+    
+    def renew(self, worker_id: str, urls: List[str], lease_seconds: float) -> int:
+        """Extend a worker's leases and return how many it still holds"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.executemany('''
+            UPDATE url_schedule SET lease_expires = ? WHERE url = ? AND lease_owner = ?
+        ''', [(time.time() + lease_seconds, url, worker_id) for url in urls])
+        renewed = cursor.rowcount
+        cursor.execute('COMMIT')
+        conn.close()
+        
+        if renewed < len(urls):
+            logger.warning(f"Worker {worker_id} lost {len(urls) - renewed} of its leases")
+        return renewed
+    
+    def release(self, worker_id: str, url: str, next_due: float):
+        """Give back a leased URL and set when it is due next"""
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            UPDATE url_schedule SET lease_owner = NULL, lease_expires = NULL, next_scan = ?
+            WHERE url = ? AND lease_owner = ?
+        ''', (next_due, url, worker_id))
+        conn.close()
+    
+    def seconds_until_due(self) -> float:
+        """Time until the next URL becomes due"""
+        now = time.time()
+        conn = self._connect()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT MIN(MAX(next_scan, COALESCE(lease_expires, 0))) FROM url_schedule
+        ''')
+        next_due = cursor.fetchone()[0]
+        conn.close()
+        
+        return max(0.0, next_due - now) if next_due is not None else float('inf')
+
+def _run_worker_process(config: dict, urls: List[str], worker_number: int):
+    """Entry point of one worker process"""
+    from html_page_detector import HTMLPageDetector
+    
+    detector = HTMLPageDetector(config)
+    detector.run_worker(urls if worker_number == 0 else None)
+
+def main():
+    """Start N scan worker processes against the shared queue"""
+    parser = argparse.ArgumentParser(description="Run HTML change detector scan workers")
+    parser.add_argument('--config', default='detector_config.json', help="detector config file")
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count(), help="worker processes")
+    args = parser.parse_args()
+    
+    with open(args.config) as f:
+        config = json.load(f)
+    urls = config.get('urls_to_monitor', [])
+    
+    processes = [
+        multiprocessing.Process(target=_run_worker_process, args=(config, urls, number), daemon=True)
+        for number in range(args.workers)
+    ]
+    for process in processes:
+        process.start()
+    
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        print("\nWorkers stopped by user")
+
+if __name__ == "__main__":
+    main()